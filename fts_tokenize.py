@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""SQLite FTS5 用のトークン化（tdnet_pdf_text と index_scripts_search で共通）。
+
+日本語（ひらがな・カタカナ・漢字・半角カナ）は2文字ずつ（2-gram）、英数字は単語単位で小文字にする。
+索引は unicode61 トークナイザにスペース区切りの語を渡し、検索語も同じ規則で MATCH 式にする。
+"""
+
+import re
+from typing import List
+
+RE_CJK = re.compile(r'[぀-ヿ㐀-鿿豈-﫿ｦ-ﾟ]+')
+RE_WORD = re.compile(r'[぀-ヿ㐀-鿿豈-﫿ｦ-ﾟ]+|[0-9A-Za-z_]+')
+RE_IDENT_PART = re.compile(r'[A-Z]+(?=[A-Z][a-z]|\d|\b|_)|[A-Z]?[a-z]+|[A-Z]+|\d+')
+
+
+def _ident_parts(word: str) -> List[str]:
+    return [p.lower() for p in RE_IDENT_PART.findall(word)]
+
+
+def tokenize(text: str, split_identifiers: bool = False, for_query: bool = False) -> List[str]:
+    """text を索引用の語に分ける。
+
+    split_identifiers=True ではコードの識別子を丸ごと+分割した語にする
+    （extract_info → extractinfo extract info）。検索語側（for_query）は分割した語だけにする。
+    """
+    tokens = []
+    for w in RE_WORD.findall(text):
+        if RE_CJK.fullmatch(w):
+            if len(w) == 1:
+                tokens.append(w)
+            else:
+                tokens.extend(w[i:i + 2] for i in range(len(w) - 1))
+            continue
+        if not split_identifiers:
+            tokens.append(w.lower())
+            continue
+        parts = _ident_parts(w)
+        if len(parts) <= 1:
+            tokens.append(w.lower().strip("_") or w)
+        elif for_query:
+            tokens.extend(parts)
+        else:
+            tokens.append("".join(parts))
+            tokens.extend(parts)
+    return tokens
+
+
+def build_match_query(query: str, split_identifiers: bool = False) -> str:
+    """検索語を FTS5 の MATCH 式に変換する（語ごとにフレーズ、語間はAND。末尾 * は前方一致）。
+
+    1文字だけの日本語は2-gram の先頭として前方一致にする。
+    """
+    parts = []
+    for w in query.split():
+        prefix = w.endswith("*")
+        toks = tokenize(w.rstrip("*"), split_identifiers, for_query=True)
+        if not toks:
+            continue
+        phrase = '"' + " ".join(toks) + '"'
+        if prefix or (len(toks) == 1 and len(toks[0]) == 1):
+            phrase += "*"
+        parts.append(phrase)
+    return " AND ".join(parts)
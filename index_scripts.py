@@ -1,10 +1,18 @@
 import os
+import sys
 import sqlite3
 import duckdb
 import time
-import glob  # 追加：ファイル検索用
+import io
+import json
+import shutil
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+import index_scripts_ast
+import index_scripts_search
+
 # --- 設定 ---
 # 1. 検索対象のスクリプトフォルダ
 SOURCE_DIR = r"\\LS720D7A9\TakashiBK\投資\MyPython"
@@ -24,6 +32,21 @@ EXCLUDE_DIRS = {
 # 除外したいフォルダは時々で追加/削除する　例えばBackUpファイルなど
 # EXCLUDE_DIRS = {".venv", "__pycache__", ".git", ".ipynb_checkpoints"}
 
+# 4. ファイル読み込みの並列数（NAS の待ち時間を重ねる。ローカルディスクなら 4 程度で十分）
+READ_WORKERS = 16
+
+# 5. DB をローカルディスクで更新し、終わってから DB_FOLDER のファイルを一度に置き換える
+#    （NAS 上の DuckDB を直接更新するより共有フォルダのロック時間が短い。False なら従来どおり直接更新）
+BUILD_LOCAL = True
+LOCAL_DB_DIR = os.path.join(os.path.expanduser("~"), ".index_scripts")
+
+# 6. 監視モード（python index_scripts.py --watch）
+#    "auto" = watchdog があればOSの変更通知（Linux は inotify / Windows は ReadDirectoryChangesW）、なければポーリング
+#    "poll" = 常にポーリング（変更通知が届かない共有フォルダ向け。scandir の情報だけを比べ、中身は読まない）
+WATCH_MODE = "auto"
+POLL_INTERVAL = 10   # ポーリング間隔（秒）。失敗した更新もこの間隔でやり直す
+DEBOUNCE_SEC = 3     # 最後の変更からこの秒数だけ変化がなければ反映する（保存が続くときにまとめる）
+
 def extract_metadata(lines):
     """# --- metadata --- セクションからメタデータを抽出"""
     metadata = {"description": "", "システム構成図": ""}
@@ -46,59 +69,245 @@ def extract_metadata(lines):
     
     return metadata
 
-def extract_info(file_path):
-    """ファイルから概要とコード内容を抽出"""
+def read_script(file_path):
+    """ファイルを1回だけ読み、(テキスト, 内容のハッシュ) を返す。改行は open() のテキストモードと同じく \\n にそろえる。"""
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    text = data.decode('utf-8', errors='ignore').replace('\r\n', '\n').replace('\r', '\n')
+    return text, hashlib.sha256(data).hexdigest()
+
+def extract_info(file_path, text=None):
+    """ファイルから概要とコード内容を抽出（text を渡せばファイルは読まない）"""
     try:
-        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            lines = f.readlines()
-            content = "".join(lines)
-            description = "説明なし"
-            if not lines:
-                return description, content, {}
-
-            # メタデータを抽出
-            metadata = extract_metadata(lines)
-            
-            # 既存の説明文抽出ロジック（メタデータにdescriptionがない場合に使用）
-            first_line = lines[0].strip()
-            if first_line.startswith(('"""', "'''")):
-                desc_lines = []
-                quote_type = first_line[:3]
-                first_content = first_line[3:]
-                if first_content:
-                    desc_lines.append(first_content)
-                for line in lines[1:]:
-                    if quote_type in line:
-                        desc_lines.append(line.split(quote_type)[0])
-                        break
-                    desc_lines.append(line.strip())
-                description = " ".join(desc_lines).strip()
-            elif first_line.startswith("#"):
-                description = first_line.replace("#", "").strip()
-                
-            # メタデータにdescriptionがあれば上書き
-            if metadata["description"]:
-                description = metadata["description"]
-                
-            return description, content, metadata
+        if text is None:
+            text, _ = read_script(file_path)
+        lines = io.StringIO(text).readlines()
+        content = "".join(lines)
+        description = "説明なし"
+        if not lines:
+            return description, content, {}
+
+        # メタデータを抽出
+        metadata = extract_metadata(lines)
+
+        # 既存の説明文抽出ロジック（メタデータにdescriptionがない場合に使用）
+        first_line = lines[0].strip()
+        if first_line.startswith(('"""', "'''")):
+            desc_lines = []
+            quote_type = first_line[:3]
+            first_content = first_line[3:]
+            if first_content:
+                desc_lines.append(first_content)
+            for line in lines[1:]:
+                if quote_type in line:
+                    desc_lines.append(line.split(quote_type)[0])
+                    break
+                desc_lines.append(line.strip())
+            description = " ".join(desc_lines).strip()
+        elif first_line.startswith("#"):
+            description = first_line.replace("#", "").strip()
+
+        # メタデータにdescriptionがあれば上書き
+        if metadata["description"]:
+            description = metadata["description"]
+
+        return description, content, metadata
     except Exception as e:
         return f"エラー: {str(e)}", "", {"description": "", "システム構成図": ""}
 
-def run():
+def render_note(file, full_path, desc, metadata, mtime, code, deps=""):
+    """Obsidian ノートの本文を作る（deps は依存関係のセクション）"""
+    stamp = mtime.strftime('%Y-%m-%dT%H:%M:%S+09:00')
+    return (
+        # YAML front matter for Obsidian properties
+        "---\n"
+        f"title: {file}\n"
+        f"description: {desc}\n"
+        f"システム構成図: {metadata.get('システム構成図', '')}\n"
+        f"created: {stamp}\n"
+        f"updated: {stamp}\n"
+        "tags:\n"
+        "  - python_script\n"
+        "  - tools\n"
+        "aliases: \n"
+        "  - " + file + "\n"
+        "---\n\n"
+        f"# {file}\n\n"
+        f"> [!abstract] 概要\n"
+        f"> {desc}\n\n"
+        "## スクリプト情報\n"
+        f"- **フルパス**: `{full_path}`\n"
+        f"- **最終更新**: {mtime.strftime('%Y-%m-%d %H:%M:%S')}\n"
+        f"{deps}"
+        "\n---\n\n"
+        "## ソースコード\n\n"
+        "```python\n"
+        f"{code}"
+        "\n```\n"
+    )
+
+def write_if_changed(output_path, text):
+    """内容が変わったときだけ一時ファイル経由で置き換える（Obsidian の同期が無駄に走らないように）。書いたら True"""
+    try:
+        with open(output_path, "r", encoding="utf-8") as f:
+            if f.read() == text:
+                return False
+    except FileNotFoundError:
+        pass
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, output_path)
+    return True
+
+def scan_scripts(top, failed_dirs=None):
+    """os.scandir で top 以下の .py を (フルパス, ファイル名, stat) で列挙する（EXCLUDE_DIRS は降りない）。
+
+    os.walk + os.path.getmtime と違い、ディレクトリ一覧で得た情報を使うので Windows ではファイルごとの問い合わせがない。
+    読めなかったサブフォルダは failed_dirs に追加する（その下のスクリプトを削除扱いにしないため）。top 自体が読めなければ OSError。
+    """
+    stack = [top]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = list(os.scandir(current))
+        except OSError as e:
+            if current == top:
+                raise
+            print(f"フォルダを読めません ({current}): {e}")
+            if failed_dirs is not None:
+                failed_dirs.append(current)
+            continue
+        for entry in entries:
+            if entry.is_dir():
+                if entry.name not in EXCLUDE_DIRS and not entry.is_symlink():
+                    stack.append(entry.path)
+            elif entry.name.endswith(".py") and entry.name != "index_scripts.py":
+                yield entry.path, entry.name, entry.stat()
+
+def list_scripts():
+    """SOURCE_DIR の一覧 ([(フルパス, ファイル名, stat)], 読めなかったサブフォルダ) を返す。SOURCE_DIR が読めなければ OSError"""
+    if not os.path.isdir(SOURCE_DIR):
+        raise FileNotFoundError(f"スクリプトフォルダを読めません: {SOURCE_DIR}")
+    failed_dirs = []
+    listing = list(scan_scripts(SOURCE_DIR, failed_dirs))
+    return listing, failed_dirs
+
+def is_under(path, dirs):
+    return any(path.startswith(d.rstrip(os.sep) + os.sep) for d in dirs)
+
+def load_script(full_path):
+    """（スレッドプールで実行）読み込みと情報抽出。(sha256, 概要, コード, メタデータ) を返す。"""
+    try:
+        text, sha = read_script(full_path)
+    except Exception as e:
+        return None, f"エラー: {str(e)}", "", {"description": "", "システム構成図": ""}
+    desc, code, metadata = extract_info(full_path, text)
+    return sha, desc, code, metadata
+
+def ensure_schema(con):
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS scripts (
+            path TEXT PRIMARY KEY, 
+            name TEXT, 
+            description TEXT, 
+            content TEXT, 
+            last_updated TIMESTAMP
+        )
+    """)
+    # 変更検出用（旧バージョンで作ったDBには列を追加する）
+    for column, col_type in (("size", "BIGINT"), ("mtime", "DOUBLE"), ("sha256", "TEXT"), ("note", "TEXT")):
+        con.execute(f"ALTER TABLE scripts ADD COLUMN IF NOT EXISTS {column} {col_type}")
+
+SCRIPT_COLUMNS = ["path", "name", "description", "content", "last_updated", "size", "mtime", "sha256", "note"]
+
+def write_batch(con, rows, deleted):
+    """追加・変更した行の upsert と、消えたスクリプトの削除を1トランザクションでまとめて行う"""
+    if not rows and not deleted:
+        return
+    con.execute("BEGIN TRANSACTION")
+    try:
+        if rows:
+            try:
+                import pyarrow as pa
+                batch = pa.table({c: [r[i] for r in rows] for i, c in enumerate(SCRIPT_COLUMNS)})
+                con.register("script_batch", batch)
+                con.execute(f"INSERT OR REPLACE INTO scripts ({', '.join(SCRIPT_COLUMNS)}) "
+                            f"SELECT {', '.join(SCRIPT_COLUMNS)} FROM script_batch")
+                con.unregister("script_batch")
+            except ImportError:
+                con.executemany(f"INSERT OR REPLACE INTO scripts ({', '.join(SCRIPT_COLUMNS)}) "
+                                f"VALUES ({', '.join('?' * len(SCRIPT_COLUMNS))})", rows)
+        if deleted:
+            con.execute("DELETE FROM scripts WHERE list_contains(?, path)", [deleted])
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+
+def _db_stamp(path):
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime": st.st_mtime}
+
+def prepare_local_db(db_full_path):
+    """ローカルの作業用DBを用意する。共有側が前回の同期以降に変わっていればコピーし直す。パスを返す"""
+    os.makedirs(LOCAL_DB_DIR, exist_ok=True)
+    local_path = os.path.join(LOCAL_DB_DIR, DB_NAME)
+    state_path = local_path + ".sync.json"
+    state = {}
+    if os.path.exists(state_path):
+        with open(state_path, encoding="utf-8") as f:
+            state = json.load(f)
+    if os.path.exists(db_full_path):
+        if not os.path.exists(local_path) or state.get("remote") != _db_stamp(db_full_path):
+            shutil.copyfile(db_full_path, local_path)
+            state = {"remote": _db_stamp(db_full_path), "pending": False}
+    elif os.path.exists(local_path) and not state.get("pending"):
+        os.remove(local_path)  # 共有側が消された
+    with open(state_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    return local_path
+
+def publish_db(local_path, db_full_path, changed):
+    """ローカルのDBを共有側へ一時ファイル経由でコピーし、os.replace で一度に置き換える。
+
+    置き換えに失敗（他のプロセスが開いている等）したら pending として残し、次回変更がなくても公開し直す。
+    """
+    state_path = local_path + ".sync.json"
+    with open(state_path, encoding="utf-8") as f:
+        state = json.load(f)
+    if not changed and not state.get("pending"):
+        return False
+    tmp_path = db_full_path + ".tmp"
+    try:
+        shutil.copyfile(local_path, tmp_path)
+        os.replace(tmp_path, db_full_path)
+        state = {"remote": _db_stamp(db_full_path), "pending": False}
+        published = True
+    except OSError as e:
+        print(f"DBの公開に失敗しました（次回再試行します）: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        state["pending"] = True
+        published = False
+    with open(state_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    return published
+
+def run(scan=None):
+    """SOURCE_DIR の変更を DB・ノート・索引に反映する。scan に list_scripts() の結果を渡せば一覧を取り直さない"""
     start_time = time.time()
-    
+
+    # 一覧は DB を開く前に取る。SOURCE_DIR が見えない（NAS の停止など）と全スクリプトが「削除」扱いになるので、
+    # その場合は DB・ノートに触る前に OSError で中止する
+    scan_start = time.time()
+    listing, failed_dirs = scan if scan is not None else list_scripts()
+    scan_time = time.time() - scan_start
+
     # Obsidianフォルダの作成
     if not os.path.exists(OBSIDIAN_DIR):
         os.makedirs(OBSIDIAN_DIR)
-    else:
-        # --- 追加処理: Obsidianフォルダ内の既存の .md ファイルをすべて削除 ---
-        existing_md_files = glob.glob(os.path.join(OBSIDIAN_DIR, "*.md"))
-        for f in existing_md_files:
-            try:
-                os.remove(f)
-            except Exception as e:
-                print(f"削除エラー ({os.path.basename(f)}): {e}")
-        print(f"Obsidian出力先をクリーンアップしました: {len(existing_md_files)}個のファイルを削除")
+    existing_notes = set(os.listdir(OBSIDIAN_DIR))
         
     # --- 代替案の工夫：DBフォルダの自動作成 ---
     if not os.path.exists(DB_FOLDER):
@@ -108,77 +317,237 @@ def run():
     # フルパスの結合
     db_full_path = os.path.join(DB_FOLDER, DB_NAME)
 
-    con = duckdb.connect(db_full_path)
-    con.execute("""
-        CREATE TABLE IF NOT EXISTS scripts (
-            path TEXT PRIMARY KEY, 
-            name TEXT, 
-            description TEXT, 
-            content TEXT, 
-            last_updated TIMESTAMP
-        )
-    """)
+    work_db_path = prepare_local_db(db_full_path) if BUILD_LOCAL else db_full_path
+    con = duckdb.connect(work_db_path)
+    ensure_schema(con)
+    # 前回の状態: path -> (size, mtime, sha256, note)
+    known = {row[0]: row[1:] for row in con.execute("SELECT path, size, mtime, sha256, note FROM scripts").fetchall()}
 
     processed_files = []
+    rows = []
+    notes = {}  # ノートを書き直すスクリプト: path -> (ファイル名, 概要, メタデータ, 更新時刻, コード)
+    missing_notes = []
+    skipped = 0
+    notes_written = 0
+    seen = set()
+
+    # 一覧は scandir の stat をそのまま使い、中身を読む必要があるファイルだけスレッドプールで読む
+    changed = []
+    for full_path, file, st in listing:
+        seen.add(full_path)
+        prev = known.get(full_path)
+
+        # サイズと更新時刻が前回と同じなら中身は読まない（ノートが消えていればDBの内容から作り直す）
+        if prev and prev[0] == st.st_size and prev[1] == st.st_mtime and prev[2]:
+            if f"{file}.md" not in existing_notes:
+                missing_notes.append(full_path)
+            skipped += 1
+            continue
+        changed.append((full_path, file, st))
+
+    read_start = time.time()
+    with ThreadPoolExecutor(max_workers=READ_WORKERS) as executor:
+        for (full_path, file, st), (sha, desc, code, metadata) in zip(
+                changed, executor.map(load_script, [c[0] for c in changed])):
+            mtime = datetime.fromtimestamp(st.st_mtime)
+            rows.append((full_path, file, desc, code, mtime, st.st_size, st.st_mtime, sha, f"{file}.md"))
+            notes[full_path] = (file, desc, metadata, mtime, code)
+            processed_files.append(file)
+    read_time = time.time() - read_start
+
+    # DB への書き込みは最後に1回（upsert と削除を1トランザクションで）
+    # 読めなかったフォルダの下は一覧にないだけなので削除しない
+    deleted = [path for path in known if path not in seen and not is_under(path, failed_dirs)]
+    write_start = time.time()
+    write_batch(con, rows, deleted)
+    write_time = time.time() - write_start
+
+    # AST 解析（内容が変わったスクリプトだけ。結果は内容のハッシュでキャッシュ）と依存関係
+    ast_start = time.time()
+    n_ast, n_analyzed = index_scripts_ast.update_ast_index(con)
+    graph_changed, sections = index_scripts_ast.changed_sections(con)
+    ast_time = time.time() - ast_start
+
+    # 全文検索の索引（DB と同じ場所の SQLite）も変わった分だけ更新
+    idx = index_scripts_search.open_index(os.path.join(os.path.dirname(work_db_path), index_scripts_search.INDEX_NAME))
+    try:
+        n_fts, n_fts_removed = index_scripts_search.sync_index(con, idx)
+    finally:
+        idx.close()
 
-    for root, dirs, files in os.walk(SOURCE_DIR):
-        dirs[:] = [d for d in dirs if d not in EXCLUDE_DIRS]
-
-        for file in files:
-            if file.endswith(".py") and file != "index_scripts.py":
-                full_path = os.path.join(root, file)
-                desc, code, metadata = extract_info(full_path)
-                mtime = datetime.fromtimestamp(os.path.getmtime(full_path))
-
-                con.execute("""
-                    INSERT OR REPLACE INTO scripts (path, name, description, content, last_updated)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (full_path, file, desc, code, mtime))
-
-                md_filename = f"{file}.md"
-                output_path = os.path.join(OBSIDIAN_DIR, md_filename)
-                
-                with open(output_path, "w", encoding="utf-8") as f:
-                    # YAML front matter for Obsidian properties
-                    f.write("---\n")
-                    f.write(f"title: {file}\n")
-                    f.write(f"description: {desc}\n")
-                    f.write(f"システム構成図: {metadata.get('システム構成図', '')}\n")
-                    f.write(f"created: {mtime.strftime('%Y-%m-%dT%H:%M:%S+09:00')}\n")
-                    f.write(f"updated: {mtime.strftime('%Y-%m-%dT%H:%M:%S+09:00')}\n")
-                    f.write("tags:\n")
-                    f.write("  - python_script\n")
-                    f.write("  - tools\n")
-                    f.write("aliases: \n")
-                    f.write("  - " + file + "\n")
-                    f.write("---\n\n")
-                    
-                    f.write(f"# {file}\n\n")
-                    f.write(f"> [!abstract] 概要\n")
-                    f.write(f"> {desc}\n\n")
-                    f.write("## スクリプト情報\n")
-                    f.write(f"- **フルパス**: `{full_path}`\n")
-                    f.write(f"- **最終更新**: {mtime.strftime('%Y-%m-%d %H:%M:%S')}\n")
-                    f.write("\n---\n\n")
-                    f.write("## ソースコード\n\n")
-                    f.write("```python\n")
-                    f.write(code)
-                    f.write("\n```\n")
-                
-                processed_files.append(file)
+    # ノートを書くのは 変更したスクリプト・ノートが消えたもの・依存関係が変わったもの だけ
+    refill = [path for path in set(missing_notes) | set(graph_changed) if path not in notes]
+    if refill:
+        for path, file, desc, code, mtime in con.execute(
+                "SELECT path, name, description, content, mtime FROM scripts WHERE list_contains(?, path)",
+                [refill]).fetchall():
+            _, _, metadata = extract_info(path, code)
+            notes[path] = (file, desc, metadata, datetime.fromtimestamp(mtime), code)
+    for path, (file, desc, metadata, mtime, code) in notes.items():
+        md_filename = f"{file}.md"
+        note = render_note(file, path, desc, metadata, mtime, code, sections.get(path, ""))
+        notes_written += write_if_changed(os.path.join(OBSIDIAN_DIR, md_filename), note)
+        existing_notes.add(md_filename)
 
     con.close()
+    publish_start = time.time()
+    published = BUILD_LOCAL and publish_db(work_db_path, db_full_path, bool(rows or deleted or n_ast or graph_changed))
+    write_time += time.time() - publish_start
+
+    # 消えたスクリプトのノートを削除（同名のスクリプトが他に残っていればノートは残す）
+    notes_removed = 0
+    if deleted:
+        live_notes = {f"{os.path.basename(path)}.md" for path in seen}
+        for path in deleted:
+            md_filename = known[path][3] or f"{os.path.basename(path)}.md"
+            if md_filename not in live_notes and md_filename in existing_notes:
+                try:
+                    os.remove(os.path.join(OBSIDIAN_DIR, md_filename))
+                    existing_notes.discard(md_filename)
+                    notes_removed += 1
+                except Exception as e:
+                    print(f"削除エラー ({md_filename}): {e}")
     
     end_time = time.time()
     elapsed_time = end_time - start_time
 
     print("-" * 30)
     print(f"完了！")
-    print(f"処理ファイル数: {len(processed_files)} 個")
+    print(f"処理ファイル数: {len(processed_files)} 個 (変更なしでスキップ {skipped} 個 / 削除 {len(deleted)} 個)")
+    if failed_dirs:
+        print(f"読めなかったフォルダ: {len(failed_dirs)} 個（その下のスクリプトは前回の内容のまま）")
+    print(f"一覧: {len(seen)} 個 {scan_time:.2f} 秒 ({len(seen) / scan_time if scan_time else 0:,.0f} ファイル/秒) / "
+          f"読み込み・登録: {len(processed_files)} 個 {read_time:.2f} 秒 "
+          f"({len(processed_files) / read_time if read_time else 0:,.0f} ファイル/秒, {READ_WORKERS} スレッド)")
+    print(f"DB書き込み: {len(rows)} 行追加・更新 / {len(deleted)} 行削除 {write_time:.3f} 秒"
+          + (" (共有フォルダへ公開)" if published else ""))
+    print(f"AST解析: {n_ast} 個反映 (うち解析 {n_analyzed} 個, 他はキャッシュ) {ast_time:.2f} 秒 / "
+          f"依存関係の変化 {len(graph_changed)} 個")
+    print(f"検索索引: {n_fts} 個更新 / {n_fts_removed} 個削除")
+    print(f"ノート: 更新 {notes_written} 個 / 削除 {notes_removed} 個")
     print(f"実行時間: {elapsed_time:.2f} 秒")
     print(f"DB保存先: {db_full_path}")
     print(f"Obsidian出力先: {OBSIDIAN_DIR}")
     print("-" * 30)
 
+def snapshot():
+    """監視用: ({パス: (サイズ, 更新時刻)}, list_scripts() の結果)。SOURCE_DIR が読めなければ OSError"""
+    scan = list_scripts()
+    return {path: (st.st_size, st.st_mtime) for path, _, st in scan[0]}, scan
+
+def _is_watched(path):
+    parts = set(os.path.normpath(path).split(os.sep))
+    return path.endswith(".py") and os.path.basename(path) != "index_scripts.py" and not (parts & EXCLUDE_DIRS)
+
+def _run_safely(scan=None):
+    """run() の失敗で監視を止めない。成功したら True"""
+    try:
+        run(scan)
+        return True
+    except Exception as e:
+        # NAS が一時的に見えない等（run は SOURCE_DIR を読めなければ何も消さずに OSError を出す）。次の変更（またはポーリング）で再試行する
+        print(f"更新エラー: {e}")
+        return False
+
+def _watch_events(observer_cls, retry=False):
+    """OS の変更通知で監視する。通知が来たら DEBOUNCE_SEC 静かになるのを待って run() する
+
+    run() が失敗している間は POLL_INTERVAL ごとにやり直す。observer が止まった（監視先の NAS が切れた等）、
+    または開始できないときはポーリングに切り替える（止まっている間の変更を拾うため、切り替え後に1回 run() する）。
+    """
+    import threading
+    from watchdog.events import FileSystemEventHandler
+
+    changed = threading.Event()
+    last_event = [0.0]
+
+    class Handler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            # opened / closed（run() 自身の読み込みでも発生する）は無視する
+            if event.event_type not in ("created", "modified", "deleted", "moved"):
+                return
+            if event.is_directory and event.event_type not in ("deleted", "moved"):
+                return
+            paths = [event.src_path, getattr(event, "dest_path", "") or ""]
+            if event.is_directory or any(_is_watched(p) for p in paths if p):
+                last_event[0] = time.time()
+                changed.set()
+
+    observer = observer_cls()
+    try:
+        observer.schedule(Handler(), SOURCE_DIR, recursive=True)
+        observer.start()
+    except OSError as e:
+        print(f"変更通知を開始できないためポーリングで監視します: {e}")
+        _watch_poll(retry=True)
+        return
+    try:
+        while observer.is_alive():
+            if not changed.wait(timeout=POLL_INTERVAL):
+                if retry:
+                    retry = not _run_safely()
+                continue
+            while time.time() - last_event[0] < DEBOUNCE_SEC:
+                time.sleep(DEBOUNCE_SEC - (time.time() - last_event[0]))
+            changed.clear()
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] 変更を検出しました")
+            retry = not _run_safely()
+    finally:
+        observer.stop()
+        observer.join()
+    print("変更通知が止まったためポーリングに切り替えます")
+    _watch_poll(retry=True)
+
+def _watch_poll(retry=False):
+    """POLL_INTERVAL ごとに scandir の情報（サイズ・更新時刻）を比べ、変化が DEBOUNCE_SEC 収まったら run() する
+
+    run() にはそのポーリングの一覧を渡すので、変更1回あたりのフォルダの走査は1回で済む。
+    一覧に失敗した（NAS が見えない）間は何もせず、見えるようになったら前回の run() が失敗していればやり直す。
+    """
+    previous = None
+    pending_since = None
+    while True:
+        try:
+            current, scan = snapshot()
+        except OSError as e:
+            print(f"一覧エラー（{POLL_INTERVAL}秒後に再試行）: {e}")
+            time.sleep(POLL_INTERVAL)
+            continue
+        if previous is None:
+            previous = current
+        elif current != previous:
+            added = len(current.keys() - previous.keys())
+            removed = len(previous.keys() - current.keys())
+            modified = sum(1 for p in current.keys() & previous.keys() if current[p] != previous[p])
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] 変更を検出: 追加 {added} / 変更 {modified} / 削除 {removed}")
+            previous = current
+            pending_since = time.time()
+        elif (pending_since is not None and time.time() - pending_since >= DEBOUNCE_SEC) or retry:
+            pending_since = None
+            retry = not _run_safely(scan)
+        time.sleep(POLL_INTERVAL if pending_since is None else min(POLL_INTERVAL, DEBOUNCE_SEC))
+
+def watch():
+    """起動時に1回更新し、その後は SOURCE_DIR の .py の追加・変更・削除を監視して差分だけ反映し続ける"""
+    ok = _run_safely()
+    observer_cls = None
+    if WATCH_MODE == "auto":
+        try:
+            from watchdog.observers import Observer as observer_cls
+        except ImportError:
+            print("watchdog がないためポーリングで監視します（pip install watchdog で変更通知を使えます）")
+    mode = f"変更通知 ({observer_cls.__name__})" if observer_cls else f"ポーリング ({POLL_INTERVAL}秒ごと)"
+    print(f"監視中: {SOURCE_DIR} [{mode}] 終了は Ctrl+C")
+    try:
+        if observer_cls:
+            _watch_events(observer_cls, retry=not ok)
+        else:
+            _watch_poll(retry=not ok)
+    except KeyboardInterrupt:
+        print("監視を終了しました")
+
 if __name__ == "__main__":
-    run()
\ No newline at end of file
+    if "--watch" in sys.argv:
+        watch()
+    else:
+        run()
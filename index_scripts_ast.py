@@ -0,0 +1,278 @@
+"""index_scripts の AST 解析（import・トップレベルの関数/クラス・ハードコードされたパス・DB/テーブル参照）
+
+解析結果はスクリプトの内容のハッシュ（scripts.sha256）ごとに script_analysis へキャッシュし、
+パスごとの表（script_imports / script_symbols / script_paths / script_db_refs）に展開する。
+内容が変わったスクリプトだけをプロセスプールで解析する。
+
+  python index_scripts_ast.py imports win32com     # win32com を import しているスクリプト
+  python index_scripts_ast.py touches tdnet.duckdb # tdnet.duckdb（ファイル名・テーブル名）を参照しているスクリプト
+  python index_scripts_ast.py defines main         # main を定義しているスクリプト
+  python index_scripts_ast.py graph                # スクリプト間の依存（import）の一覧
+"""
+import os
+import re
+import sys
+import ast
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import duckdb
+
+# --- 設定 ---
+# 解析内容を変えたら上げる（キャッシュを使わず全件解析し直す）
+ANALYSIS_VERSION = 1
+# 解析のプロセス数。対象がこれより少ないときはプロセスを立ち上げずにその場で解析する
+ANALYSIS_WORKERS = os.cpu_count()
+POOL_MIN_FILES = 20
+
+# ハードコードされたパスとみなす文字列（ドライブ/UNC/絶対パス、または区切りを含み拡張子で終わる）
+PATH_RE = re.compile(r'^(?:[A-Za-z]:[\\/]|\\\\[^\\]|/[^/\s]+/)|^[^\s]*[\\/][^\s\\/]+\.\w{1,5}$')
+# DB・データファイルとみなす拡張子
+DB_EXTENSIONS = (".duckdb", ".db", ".sqlite", ".sqlite3", ".parquet", ".xlsm", ".xlsx", ".xls", ".csv")
+# SQL 文とみなす文字列と、そこからのテーブル名の取り出し（関数呼び出し read_csv(...) などは除く）
+SQL_RE = re.compile(r'\b(SELECT|INSERT|UPDATE|DELETE|CREATE|DROP|ALTER|MERGE|COPY)\b', re.I)
+SQL_TABLE_RE = re.compile(
+    r'\b(FROM|JOIN|INTO|UPDATE|TABLE(?:\s+IF\s+(?:NOT\s+)?EXISTS)?)\s+'
+    r'((?:"[^"]+"|[A-Za-z_぀-ヿ一-鿿][\w぀-ヿ一-鿿]*)'
+    r'(?:\.(?:"[^"]+"|[A-Za-z_]\w*))?)', re.I)
+SQL_NOT_TABLES = {"select", "values", "set", "where", "lateral", "unnest", "only"}
+
+AST_SCHEMA = """
+CREATE TABLE IF NOT EXISTS script_analysis (sha256 TEXT PRIMARY KEY, version INTEGER, result TEXT);
+CREATE TABLE IF NOT EXISTS script_ast_state (path TEXT PRIMARY KEY, sha256 TEXT, version INTEGER, error TEXT);
+CREATE TABLE IF NOT EXISTS script_imports (path TEXT, module TEXT, name TEXT, alias TEXT, lineno INTEGER);
+CREATE TABLE IF NOT EXISTS script_symbols (path TEXT, kind TEXT, name TEXT, lineno INTEGER);
+CREATE TABLE IF NOT EXISTS script_paths (path TEXT, literal TEXT, lineno INTEGER);
+CREATE TABLE IF NOT EXISTS script_db_refs (path TEXT, kind TEXT, target TEXT, lineno INTEGER);
+CREATE TABLE IF NOT EXISTS script_note_graph (path TEXT PRIMARY KEY, section TEXT);
+"""
+
+# 正規化した表: 表名 -> (列, 解析結果のキー)
+DETAIL_TABLES = {
+    "script_imports": (["module", "name", "alias", "lineno"], "imports"),
+    "script_symbols": (["kind", "name", "lineno"], "symbols"),
+    "script_paths": (["literal", "lineno"], "paths"),
+    "script_db_refs": (["kind", "target", "lineno"], "db_refs"),
+}
+
+def ensure_schema(con):
+    con.execute(AST_SCHEMA)
+
+def _sql_tables(text):
+    if not SQL_RE.search(text):
+        return []
+    tables = []
+    for m in SQL_TABLE_RE.finditer(text):
+        # FROM read_csv(...) のようなテーブル関数は除く（CREATE TABLE x (...) は残す）
+        if m.group(1).upper() in ("FROM", "JOIN") and text[m.end():].lstrip().startswith("("):
+            continue
+        name = m.group(2).replace('"', '')
+        if len(name) > 1 and name.lower() not in SQL_NOT_TABLES:
+            tables.append(name)
+    return tables
+
+def analyze_source(content):
+    """ソースを解析して結果を JSON 文字列で返す（プロセスプールのワーカー）"""
+    result = {"imports": [], "symbols": [], "paths": [], "db_refs": [], "error": None}
+    try:
+        tree = ast.parse(content)
+    except (SyntaxError, ValueError) as e:
+        result["error"] = f"構文エラー: {e}"
+        return json.dumps(result, ensure_ascii=False)
+
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            result["symbols"].append(["function", node.name, node.lineno])
+        elif isinstance(node, ast.ClassDef):
+            result["symbols"].append(["class", node.name, node.lineno])
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for a in node.names:
+                result["imports"].append([a.name, None, a.asname, node.lineno])
+        elif isinstance(node, ast.ImportFrom):
+            module = "." * node.level + (node.module or "")
+            for a in node.names:
+                result["imports"].append([module, a.name, a.asname, node.lineno])
+        elif isinstance(node, ast.Constant) and isinstance(node.value, str):
+            text = node.value.strip()
+            if not text:
+                continue
+            if "\n" not in text and PATH_RE.search(text):
+                result["paths"].append([text, node.lineno])
+            base = re.split(r'[\\/]', text)[-1]
+            # ワイルドカードや拡張子だけの文字列（"*.csv", ".parquet"）は除く
+            if "\n" not in text and base.lower().endswith(DB_EXTENSIONS) and not base.startswith(".") and not any(c in base for c in "*?{"):
+                result["db_refs"].append(["file", base, node.lineno])
+            for table in _sql_tables(text):
+                result["db_refs"].append(["table", table, node.lineno])
+    return json.dumps(result, ensure_ascii=False)
+
+def _insert_rows(con, table, columns, rows):
+    if not rows:
+        return
+    try:
+        import pyarrow as pa
+        batch = pa.table({c: [r[i] for r in rows] for i, c in enumerate(columns)})
+        con.register("ast_batch", batch)
+        con.execute(f"INSERT INTO {table} ({', '.join(columns)}) SELECT {', '.join(columns)} FROM ast_batch")
+        con.unregister("ast_batch")
+    except ImportError:
+        con.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows)
+
+def update_ast_index(con, workers=None):
+    """内容が変わった（または未解析の）スクリプトの解析結果を表に反映する。(反映したパス数, 実際に解析した数) を返す"""
+    ensure_schema(con)
+    stale = con.execute("""
+        SELECT s.path, s.sha256 FROM scripts s LEFT JOIN script_ast_state a ON a.path = s.path
+        WHERE s.sha256 IS NOT NULL AND (a.sha256 IS DISTINCT FROM s.sha256 OR a.version IS DISTINCT FROM ?)
+    """, [ANALYSIS_VERSION]).fetchall()
+    gone = [r[0] for r in con.execute(
+        "SELECT path FROM script_ast_state WHERE path NOT IN (SELECT path FROM scripts WHERE sha256 IS NOT NULL)").fetchall()]
+    if not stale and not gone:
+        return 0, 0
+
+    # 同じ内容（ハッシュ）のスクリプトは1回だけ解析する。キャッシュ済みなら解析しない
+    shas = sorted({sha for _, sha in stale})
+    results = dict(con.execute("SELECT sha256, result FROM script_analysis WHERE version = ? AND list_contains(?, sha256)",
+                               [ANALYSIS_VERSION, shas]).fetchall()) if shas else {}
+    todo = [sha for sha in shas if sha not in results]
+    if todo:
+        sources = con.execute("SELECT sha256, any_value(content) FROM scripts WHERE list_contains(?, sha256) GROUP BY sha256",
+                              [todo]).fetchall()
+        contents = [c or "" for _, c in sources]
+        if len(sources) >= POOL_MIN_FILES:
+            with ProcessPoolExecutor(max_workers=workers or ANALYSIS_WORKERS) as executor:
+                analyzed = list(executor.map(analyze_source, contents, chunksize=8))
+        else:
+            analyzed = [analyze_source(c) for c in contents]
+        new = {sha: res for (sha, _), res in zip(sources, analyzed)}
+        results.update(new)
+
+    refresh = [path for path, _ in stale] + gone
+    parsed = {sha: json.loads(results[sha]) for sha in shas}
+    con.execute("BEGIN TRANSACTION")
+    try:
+        if todo:
+            con.execute("DELETE FROM script_analysis WHERE list_contains(?, sha256)", [todo])
+            _insert_rows(con, "script_analysis", ["sha256", "version", "result"],
+                         [(sha, ANALYSIS_VERSION, res) for sha, res in new.items()])
+        for table in list(DETAIL_TABLES) + ["script_ast_state"]:
+            con.execute(f"DELETE FROM {table} WHERE list_contains(?, path)", [refresh])
+        for table, (columns, key) in DETAIL_TABLES.items():
+            rows = [[path] + item for path, sha in stale for item in parsed[sha][key]]
+            _insert_rows(con, table, ["path"] + columns, rows)
+        _insert_rows(con, "script_ast_state", ["path", "sha256", "version", "error"],
+                     [(path, sha, ANALYSIS_VERSION, parsed[sha]["error"]) for path, sha in stale])
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    return len(stale), len(todo)
+
+# -----------------------------------------------------------------
+# 依存関係（Obsidian ノート用）
+# -----------------------------------------------------------------
+def dependency_edges(con):
+    """スクリプト間の import の依存 [(import する側のパス, import される側のファイル名)]"""
+    return con.execute("""
+        WITH names AS (SELECT DISTINCT name, regexp_replace(name, '\\.py$', '') AS module FROM scripts)
+        SELECT DISTINCT i.path, n.name
+        FROM script_imports i JOIN names n ON n.module = split_part(i.module, '.', 1)
+        JOIN scripts s ON s.path = i.path
+        WHERE i.module NOT LIKE '.%' AND n.name <> s.name
+        ORDER BY 1, 2
+    """).fetchall()
+
+def dependency_sections(con):
+    """パスごとのノートの「依存関係」セクション（Markdown）。何もなければ空文字"""
+    uses, used_by, paths_of = {}, {}, {}
+    name_of = dict(con.execute("SELECT path, name FROM scripts").fetchall())
+    for p, n in name_of.items():
+        paths_of.setdefault(n, []).append(p)
+    for path, target in dependency_edges(con):
+        uses.setdefault(path, []).append(target)
+        for p in paths_of.get(target, []):
+            used_by.setdefault(p, set()).add(name_of[path])
+    internal = {n[:-3] for n in name_of.values()}
+    stdlib = getattr(sys, "stdlib_module_names", frozenset())
+    libs, refs, defs = {}, {}, {}
+    for path, module in con.execute("SELECT DISTINCT path, split_part(module, '.', 1) FROM script_imports "
+                                    "WHERE module NOT LIKE '.%' ORDER BY 2").fetchall():
+        if module not in internal and module not in stdlib:
+            libs.setdefault(path, []).append(module)
+    for path, kind, target in con.execute("SELECT DISTINCT path, kind, target FROM script_db_refs ORDER BY kind, target").fetchall():
+        refs.setdefault(path, []).append(f"`{target}`" if kind == "file" else f"テーブル {target}")
+    for path, kind, name in con.execute("SELECT path, kind, name FROM script_symbols ORDER BY lineno").fetchall():
+        defs.setdefault(path, []).append(f"{name}()" if kind == "function" else f"class {name}")
+
+    sections = {}
+    for path in name_of:
+        lines = []
+        if uses.get(path):
+            lines.append("- **使用スクリプト**: " + ", ".join(f"[[{n}]]" for n in uses[path]))
+        if used_by.get(path):
+            lines.append("- **使用元**: " + ", ".join(f"[[{n}]]" for n in sorted(used_by[path])))
+        if libs.get(path):
+            lines.append("- **外部ライブラリ**: " + ", ".join(libs[path]))
+        if refs.get(path):
+            lines.append("- **DB・ファイル参照**: " + ", ".join(refs[path]))
+        if defs.get(path):
+            lines.append("- **定義**: " + ", ".join(defs[path]))
+        sections[path] = ("\n## 依存関係\n" + "\n".join(lines) + "\n") if lines else ""
+    return sections
+
+def changed_sections(con):
+    """前回から変わった依存関係セクション {パス: セクション} を返し、記録を更新する"""
+    ensure_schema(con)
+    sections = dependency_sections(con)
+    stored = dict(con.execute("SELECT path, section FROM script_note_graph").fetchall())
+    changed = {p: s for p, s in sections.items() if stored.get(p) != s}
+    if changed or len(stored) != len(sections):
+        con.execute("BEGIN TRANSACTION")
+        try:
+            con.execute("DELETE FROM script_note_graph")
+            _insert_rows(con, "script_note_graph", ["path", "section"], list(sections.items()))
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+    return changed, sections
+
+# -----------------------------------------------------------------
+# 検索
+# -----------------------------------------------------------------
+QUERIES = {
+    "imports": """SELECT DISTINCT path, lineno FROM script_imports
+                  WHERE module = $1 OR module LIKE $1 || '.%' ORDER BY path, lineno""",
+    "touches": """SELECT DISTINCT path, lineno FROM (
+                      SELECT path, lineno, target AS t FROM script_db_refs
+                      UNION ALL SELECT path, lineno, literal FROM script_paths)
+                  WHERE t ILIKE '%' || $1 || '%' ORDER BY path, lineno""",
+    "defines": "SELECT DISTINCT path, lineno FROM script_symbols WHERE name = $1 ORDER BY path, lineno",
+}
+
+def main():
+    import index_scripts
+    if len(sys.argv) < 2 or sys.argv[1] not in list(QUERIES) + ["graph"]:
+        print(__doc__)
+        sys.exit(1)
+    con = duckdb.connect(os.path.join(index_scripts.DB_FOLDER, index_scripts.DB_NAME), read_only=True)
+    try:
+        if sys.argv[1] == "graph":
+            for path, target in dependency_edges(con):
+                print(f"{path} -> {target}")
+            return
+        if len(sys.argv) < 3:
+            print(__doc__)
+            sys.exit(1)
+        word = sys.argv[2]
+        rows = con.execute(QUERIES[sys.argv[1]], [word]).fetchall()
+    finally:
+        con.close()
+    for path, lineno in rows:
+        print(f"{path}:{lineno}")
+    print(f"{len(rows)} 件")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""index_scripts で集めたスクリプトの全文検索（SQLite FTS5）
+
+ファイル名・概要・ソースコードを索引にする。コードの識別子は丸ごとと分割した語
+（extract_info → extractinfo extract info、ThreadPoolExecutor → threadpoolexecutor thread pool executor）、
+日本語は2文字ずつ（2-gram）に分けて登録する。索引は index_scripts.run のたびに内容のハッシュが変わった分だけ更新する。
+
+  python index_scripts_search.py "duckdb 適時開示"   # 語はすべて含むもの（AND）。末尾 * で前方一致
+"""
+import os
+import time
+import sqlite3
+
+import fts_tokenize
+
+# --- 設定 ---
+INDEX_NAME = "python_script_fts.sqlite"
+# 順位付けの重み（ファイル名, 概要, コード）
+RANK_WEIGHTS = (10.0, 5.0, 1.0)
+SNIPPET_LINES = 3  # 1件あたりに表示する該当行の数
+
+def index_path():
+    """索引ファイルの場所（ローカルでDBを作る設定ならローカル、そうでなければDBと同じフォルダ）"""
+    import index_scripts
+    folder = index_scripts.LOCAL_DB_DIR if index_scripts.BUILD_LOCAL else index_scripts.DB_FOLDER
+    return os.path.join(folder, INDEX_NAME)
+
+# -----------------------------------------------------------------
+# トークン化（fts_tokenize。コードの識別子は分割した語も登録する）
+# -----------------------------------------------------------------
+def tokenize(text, for_query=False):
+    return fts_tokenize.tokenize(text, split_identifiers=True, for_query=for_query)
+
+def build_match_query(query):
+    return fts_tokenize.build_match_query(query, split_identifiers=True)
+
+# -----------------------------------------------------------------
+# 索引の更新
+# -----------------------------------------------------------------
+def open_index(path=None):
+    path = path or index_path()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    idx = sqlite3.connect(path)
+    idx.executescript("""
+        CREATE TABLE IF NOT EXISTS script_docs (
+            rowid INTEGER PRIMARY KEY, path TEXT UNIQUE, sha256 TEXT, name TEXT, description TEXT, content TEXT
+        );
+        CREATE VIRTUAL TABLE IF NOT EXISTS script_fts USING fts5(name, description, code, tokenize='unicode61');
+    """)
+    return idx
+
+def sync_index(con, idx):
+    """DuckDB の scripts と索引を突き合わせ、追加・変更・削除の分だけ更新する。(更新数, 削除数) を返す"""
+    current = dict(con.execute("SELECT path, sha256 FROM scripts WHERE sha256 IS NOT NULL").fetchall())
+    indexed = {path: (rowid, sha) for rowid, path, sha in idx.execute("SELECT rowid, path, sha256 FROM script_docs")}
+    stale = [path for path, sha in current.items() if indexed.get(path, (None, None))[1] != sha]
+    gone = [path for path in indexed if path not in current]
+    if not stale and not gone:
+        return 0, 0
+    docs = con.execute("SELECT path, name, description, content, sha256 FROM scripts WHERE list_contains(?, path)",
+                       [stale]).fetchall() if stale else []
+    with idx:
+        for path in gone + [d[0] for d in docs if d[0] in indexed]:
+            rowid = indexed[path][0]
+            idx.execute("DELETE FROM script_fts WHERE rowid = ?", (rowid,))
+            idx.execute("DELETE FROM script_docs WHERE rowid = ?", (rowid,))
+        for path, name, desc, content, sha in docs:
+            cur = idx.execute("INSERT INTO script_docs (path, sha256, name, description, content) VALUES (?, ?, ?, ?, ?)",
+                              (path, sha, name, desc, content))
+            idx.execute("INSERT INTO script_fts (rowid, name, description, code) VALUES (?, ?, ?, ?)",
+                        (cur.lastrowid, " ".join(tokenize(name or "")), " ".join(tokenize(desc or "")),
+                         " ".join(tokenize(content or ""))))
+    return len(docs), len(gone)
+
+# -----------------------------------------------------------------
+# 検索
+# -----------------------------------------------------------------
+def _snippets(content, query, limit=SNIPPET_LINES):
+    """検索語を含む行を (行番号, 行) で返す"""
+    words = [w.rstrip("*").lower() for w in query.split() if w.rstrip("*")]
+    hits = []
+    for no, line in enumerate((content or "").splitlines(), 1):
+        low = line.lower()
+        if any(w in low for w in words):
+            hits.append((no, line.strip()))
+            if len(hits) >= limit:
+                break
+    return hits
+
+def search(query, limit=20, path=None):
+    """検索語で順位付けしたスクリプトの一覧 [{path, name, description, score, lines}] を返す"""
+    match = build_match_query(query)
+    if not match:
+        return []
+    idx = open_index(path)
+    try:
+        rows = idx.execute(f"""
+            SELECT d.path, d.name, d.description, d.content, bm25(script_fts, {', '.join(map(str, RANK_WEIGHTS))}) AS score
+            FROM script_fts JOIN script_docs d ON d.rowid = script_fts.rowid
+            WHERE script_fts MATCH ? ORDER BY score LIMIT ?
+        """, (match, limit)).fetchall()
+    finally:
+        idx.close()
+    return [{"path": p, "name": n, "description": d, "score": s, "lines": _snippets(c, query)}
+            for p, n, d, c, s in rows]
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="スクリプトの全文検索")
+    parser.add_argument("query", help="検索語（空白区切りで AND、末尾 * で前方一致）")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--rebuild", action="store_true", help="検索前に DB から索引を更新する")
+    args = parser.parse_args()
+
+    path = index_path()
+    if args.rebuild or not os.path.exists(path):
+        import duckdb
+        import index_scripts
+        con = duckdb.connect(os.path.join(index_scripts.DB_FOLDER, index_scripts.DB_NAME), read_only=True)
+        idx = open_index(path)
+        try:
+            n, removed = sync_index(con, idx)
+        finally:
+            idx.close()
+            con.close()
+        print(f"索引を更新しました: {n} 件更新 / {removed} 件削除")
+
+    start = time.time()
+    hits = search(args.query, args.limit, path)
+    elapsed = (time.time() - start) * 1000
+    for h in hits:
+        print(f"{h['name']}  ({h['path']})  score={-h['score']:.2f}")
+        if h["description"]:
+            print(f"    {h['description']}")
+        for no, line in h["lines"]:
+            print(f"    {no:>5}: {line[:120]}")
+    print(f"{len(hits)} 件 ({elapsed:.1f} ms)")
+
+if __name__ == "__main__":
+    main()
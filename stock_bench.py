@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""株価CSV取り込み（test.py）の合成データ生成とベンチマーク。
+
+  python stock_bench.py generate bench_csv --days 250 --codes 4000 --malformed 0.01
+  python stock_bench.py run bench_csv --modes per_file,multi,dataset
+
+generate は無尽蔵の日別株価と同じ形式（Shift-JIS, 1日1ファイル, ヘッダ付き）の CSV を乱数の種から
+再現可能に作り、指定割合のファイルを壊す。run は test.py を方式ごとに別プロセス・別作業フォルダで実行し、
+ファイル/秒・行/秒・ピークメモリ（子プロセスの最大RSS）・出力サイズを表にする。Linux 用（os.wait4 を使う）。
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import subprocess
+from datetime import date, timedelta
+
+# ================= config =================
+INGEST_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test.py")
+WORK_ROOT = "stock_bench_work"          # 方式ごとの作業フォルダの親（出力・ログはここに残る）
+SEED = 20240101
+START_DATE = date(2021, 1, 4)
+CSV_ENCODING = "cp932"
+CSV_HEADER = ["日付", "銘柄コード", "市場", "銘柄名", "始値", "高値", "安値", "終値", "出来高"]
+MARKETS = ["東証プライム", "東証スタンダード", "東証グロース", "名証メイン", "福証"]
+NAME_PARTS = ["日本", "東京", "大和", "髙島", "三菱", "住友", "ホールディングス", "製作所", "電機", "化学",
+              "建設", "商事", "銀行", "工業", "①号投資法人", "ﾃﾞｼﾞﾀﾙ", "システムズ", "ファーマ"]
+SUSPEND_RATE = 0.002                    # 売買なし（四本値が "-"）の行の割合
+# 壊し方（順に割り当てる）: 文字コード不正 / 途中で切れた行 / 空ファイル / 値が壊れている / 列が多い
+MALFORMED_KINDS = ["bad_bytes", "short_row", "empty", "bad_values", "extra_column"]
+# 比較する方式: 名前 -> test.py の設定の上書き
+MODES = {
+    "per_file": {"ingest_mode": "per_file", "output_mode": "single"},   # 従来の1ファイルずつ
+    "multi": {"ingest_mode": "multi", "output_mode": "single"},
+    "dataset": {"ingest_mode": "multi", "output_mode": "dataset"},
+    "dataset_python": {"ingest_mode": "multi", "output_mode": "dataset", "decode_mode": "python"},
+}
+# ==========================================
+
+
+# -----------------------------------------------------------------
+# 合成データ
+# -----------------------------------------------------------------
+def business_days(start: date, n: int):
+    """土日と年末年始（12/31〜1/3）を除いた n 日分の日付。"""
+    days, d = [], start
+    while len(days) < n:
+        if d.weekday() < 5 and not ((d.month == 12 and d.day == 31) or (d.month == 1 and d.day <= 3)):
+            days.append(d)
+        d += timedelta(days=1)
+    return days
+
+
+def make_codes(rng: random.Random, n: int):
+    """銘柄（コード, 市場, 銘柄名, 初期株価）を n 件作る。コードは 1301 から飛び飛びに増やす。"""
+    codes, code = [], 1300
+    for _ in range(n):
+        code += rng.choice((1, 1, 1, 2, 3, 5))
+        name = "".join(rng.sample(NAME_PARTS, rng.choice((1, 2, 2, 3))))
+        codes.append((str(code), rng.choice(MARKETS), name, rng.lognormvariate(7, 1)))
+    return codes
+
+
+def day_rows(rng: random.Random, d: date, codes, prices):
+    """1日分の行（文字列のリスト）を作り、prices（終値）を更新する。"""
+    ds = d.strftime("%Y/%m/%d")
+    rows = []
+    for i, (code, market, name, _) in enumerate(codes):
+        if rng.random() < SUSPEND_RATE:
+            rows.append([ds, code, market, name, "-", "-", "-", "-", "0"])
+            continue
+        prev = prices[i]
+        close = max(1.0, prev * (1 + rng.gauss(0, 0.02)))
+        high = max(prev, close) * (1 + abs(rng.gauss(0, 0.005)))
+        low = min(prev, close) * (1 - abs(rng.gauss(0, 0.005)))
+        prices[i] = close
+        volume = int(rng.lognormvariate(10, 1.5)) * 100
+        rows.append([ds, code, market, name, f"{prev:.0f}", f"{high:.0f}", f"{low:.0f}", f"{close:.0f}",
+                     f'"{volume:,}"'])
+    return rows
+
+
+def break_file(kind: str, rng: random.Random, rows):
+    """rows を壊して書き込むバイト列を返す（kind は MALFORMED_KINDS のいずれか）。"""
+    if kind == "empty":
+        return b""
+    if kind == "short_row":
+        k = rng.randrange(len(rows))
+        rows[k] = rows[k][:3]
+    elif kind == "bad_values":
+        for row in rng.sample(rows, max(1, len(rows) // 10)):
+            row[0], row[7] = "9999/99/99", "abc"
+    elif kind == "extra_column":
+        rows = [row + ["備考"] for row in rows]
+    data = encode_csv(rows, extra_header=["備考"] if kind == "extra_column" else [])
+    if kind == "bad_bytes":
+        # cp932 として解釈できない2バイト（0x82 の後に 0xFF）を途中の行に混ぜる
+        pos = data.index(b"\r\n", len(data) // 2) + 2
+        data = data[:pos] + b"\x82\xff" + data[pos:]
+    return data
+
+
+def encode_csv(rows, extra_header=()):
+    lines = [",".join(CSV_HEADER + list(extra_header))] + [",".join(row) for row in rows]
+    return ("\r\n".join(lines) + "\r\n").encode(CSV_ENCODING)
+
+
+def generate(out_dir: str, n_days: int, n_codes: int, malformed: float, seed: int = SEED, start: date = START_DATE):
+    """合成CSVを out_dir に書く。作った内容（種・壊したファイル）を out_dir/generator.json に残す。"""
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    codes = make_codes(rng, n_codes)
+    prices = [c[3] for c in codes]
+    days = business_days(start, n_days)
+    n_bad = round(len(days) * malformed)
+    bad_days = set(rng.sample(range(len(days)), n_bad)) if n_bad else set()
+    broken, total_bytes = {}, 0
+    for k, d in enumerate(days):
+        rows = day_rows(rng, d, codes, prices)
+        name = f"T{d:%y%m%d}.csv"
+        if k in bad_days:
+            kind = MALFORMED_KINDS[len(broken) % len(MALFORMED_KINDS)]
+            data = break_file(kind, rng, rows)
+            broken[name] = kind
+        else:
+            data = encode_csv(rows)
+        with open(os.path.join(out_dir, name), "wb") as f:
+            f.write(data)
+        total_bytes += len(data)
+    info = {"seed": seed, "start": start.isoformat(), "days": n_days, "codes": n_codes,
+            "rows": n_days * n_codes, "bytes": total_bytes, "malformed": broken}
+    with open(os.path.join(out_dir, "generator.json"), "w", encoding="utf-8") as f:
+        json.dump(info, f, ensure_ascii=False, indent=1)
+    return info
+
+
+# -----------------------------------------------------------------
+# ベンチマーク
+# -----------------------------------------------------------------
+def run_ingest(overrides: dict):
+    """（子プロセス側）test.py を読み込み、設定を上書きして main() を実行する。"""
+    import importlib.util
+    import multiprocessing
+    # Python 変換のプロセスプールが、ここで読み込んだモジュールをそのまま使えるように fork にする
+    multiprocessing.set_start_method("fork", force=True)
+    spec = importlib.util.spec_from_file_location("stock_ingest", INGEST_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["stock_ingest"] = module
+    spec.loader.exec_module(module)
+    for key, value in overrides.items():
+        if not hasattr(module, key):
+            raise SystemExit(f"test.py に設定 {key} がありません")
+        setattr(module, key, value)
+    module.main()
+
+
+def dir_size(path: str) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, n)) for root, _, names in os.walk(path) for n in names)
+
+
+def count_output(workdir: str, overrides: dict):
+    """出力の行数とサイズ（バイト）。出力がなければ (None, 0)。"""
+    import duckdb
+    if overrides.get("output_mode", "dataset") == "dataset":
+        target = os.path.join(workdir, "stock_data")
+        source = f"'{target}/**/*.parquet'"
+    else:
+        target = os.path.join(workdir, "stock_data.parquet")
+        source = f"'{target}'"
+    if not os.path.exists(target) or not dir_size(target):
+        return None, 0
+    rows = duckdb.connect().execute(f"SELECT COUNT(*) FROM read_parquet({source})").fetchone()[0]
+    return rows, dir_size(target)
+
+
+def bench_mode(name: str, overrides: dict, input_dir: str, work_root: str = WORK_ROOT) -> dict:
+    """1つの方式を新しい作業フォルダで実行し、計測結果を返す。"""
+    workdir = os.path.abspath(os.path.join(work_root, name))
+    shutil.rmtree(workdir, ignore_errors=True)
+    os.makedirs(workdir)
+    # データセットの置き場は既定ではスクリプトの隣（stock_prices.DATASET_DIR）なので、作業フォルダに向ける
+    dataset = os.path.join(workdir, "stock_data")
+    config = dict(overrides, input_path=os.path.join(os.path.abspath(input_dir), "*.csv"),
+                  dataset_dir=dataset, staging_dir=dataset + "_staging", manifest_file=dataset + "_manifest.duckdb")
+    log_path = os.path.join(workdir, "bench.log")
+    with open(log_path, "w", encoding="utf-8") as log:
+        start = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "_ingest", json.dumps(config)],
+                                cwd=workdir, stdout=log, stderr=subprocess.STDOUT,
+                                env=dict(os.environ, PYTHONIOENCODING="utf-8"))
+        # wait4 でこの子プロセス（とその子）のリソース使用量を受け取る。ru_maxrss は KB 単位
+        _, status, usage = os.wait4(proc.pid, 0)
+        elapsed = time.perf_counter() - start
+        proc.returncode = os.waitstatus_to_exitcode(status)
+    with open(log_path, encoding="utf-8", errors="replace") as f:
+        log_text = f.read()
+    rows, size = count_output(workdir, overrides)
+    error_log = os.path.join(workdir, "import_errors.csv")
+    n_errors = 0
+    if os.path.exists(error_log):
+        import csv
+        with open(error_log, encoding="utf-8-sig", newline="") as f:
+            n_errors = max(0, sum(1 for _ in csv.reader(f)) - 1)
+    ok = proc.returncode == 0 and "致命的なエラー" not in log_text and rows is not None
+    return {"mode": name, "ok": ok, "seconds": elapsed, "rows": rows or 0, "errors": n_errors,
+            "peak_rss_mb": usage.ru_maxrss / 1024, "output_bytes": size, "log": log_path}
+
+
+def print_table(results, n_files: int):
+    print(f"{'方式':<16}{'秒':>9}{'ファイル/秒':>12}{'行/秒':>13}{'行数':>12}{'エラー':>7}{'ピークRSS(MB)':>15}{'出力(MB)':>10}")
+    for r in results:
+        fps = n_files / r["seconds"] if r["seconds"] else 0
+        rps = r["rows"] / r["seconds"] if r["seconds"] else 0
+        mark = "" if r["ok"] else "  ❌ 失敗（ログ: " + r["log"] + "）"
+        print(f"{r['mode']:<16}{r['seconds']:>9.2f}{fps:>12,.1f}{rps:>13,.0f}{r['rows']:>12,}{r['errors']:>7}"
+              f"{r['peak_rss_mb']:>15,.0f}{r['output_bytes'] / 1024 / 1024:>10.1f}{mark}")
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == "_ingest":
+        run_ingest(json.loads(sys.argv[2]))
+        return
+
+    parser = argparse.ArgumentParser(description="株価CSV取り込みの合成データ生成・ベンチマーク")
+    sub = parser.add_subparsers(dest="command", required=True)
+    gen = sub.add_parser("generate", help="Shift-JIS の日別株価CSVを作る")
+    gen.add_argument("out_dir")
+    gen.add_argument("--days", type=int, default=250, help="営業日数（=ファイル数）")
+    gen.add_argument("--codes", type=int, default=4000, help="銘柄数（=1ファイルの行数）")
+    gen.add_argument("--malformed", type=float, default=0.01, help="壊すファイルの割合")
+    gen.add_argument("--seed", type=int, default=SEED)
+    run = sub.add_parser("run", help="方式ごとに test.py を実行して比較する")
+    run.add_argument("input_dir")
+    run.add_argument("--modes", default=",".join(MODES), help=f"比較する方式（{', '.join(MODES)}）")
+    run.add_argument("--work", default=WORK_ROOT, help="作業フォルダの親")
+    run.add_argument("--json", help="結果を JSON で保存するパス")
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        start = time.time()
+        info = generate(args.out_dir, args.days, args.codes, args.malformed, args.seed)
+        print(f"生成: {args.days}ファイル {info['rows']:,}行 {info['bytes'] / 1024 / 1024:.1f}MB "
+              f"(壊したファイル {len(info['malformed'])}件) {time.time() - start:.1f}秒")
+        return
+
+    modes = [m for m in args.modes.split(",") if m]
+    unknown = [m for m in modes if m not in MODES]
+    if unknown:
+        parser.error(f"不明な方式: {', '.join(unknown)}")
+    files = [n for n in os.listdir(args.input_dir) if n.lower().endswith(".csv")]
+    print(f"入力: {args.input_dir} ({len(files)}ファイル, {dir_size(args.input_dir) / 1024 / 1024:.1f}MB)")
+    results = []
+    for name in modes:
+        print(f"実行中: {name} ...", flush=True)
+        results.append(bench_mode(name, MODES[name], args.input_dir, args.work))
+    print("-" * 94)
+    print_table(results, len(files))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"input": args.input_dir, "files": len(files), "results": results}, f, ensure_ascii=False, indent=1)
+    if not all(r["ok"] for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""株価データセット（test.py が作る stock_data/year=/month=）の読み出しAPI。
+
+    from stock_prices import load_prices
+    tbl = load_prices(["7203", "6758"], "2023-01-01", "2024-12-31", ["日付", "コード", "終値"])
+
+期間に該当する year/month のファイルだけを DuckDB に渡し、コード・日付の条件と列の選択は
+Parquet の読み込みに押し込む（行グループ統計で不要な部分は読まない）。
+結果は pyarrow.Table（as_pandas=True なら DataFrame）で、同じ条件の再要求はプロセス内の
+LRU キャッシュ（合計サイズで上限）から返す。キャッシュのキーには対象ファイルの一覧と更新日時・サイズを
+含めるので、test.py がパーツを追加・まとめ直した後は読み直す。
+"""
+
+import os
+import sys
+import glob
+import time
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Iterable, List, Optional, Sequence, Union
+
+import duckdb
+
+# ================= config =================
+# 株価データセットの置き場。書く側（test.py）・読む側（tdnet_event_study）もこの設定を使う
+DATASET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stock_data")
+DEFAULT_FIELDS = ("日付", "コード", "始値", "高値", "安値", "終値", "出来高")
+# 列の型（test.py の typed_columns と同じ）。該当データがないときもこの型の空テーブルを返す。ここにない列は VARCHAR
+FIELD_TYPES = {"日付": "DATE", "コード": "VARCHAR", "始値": "DOUBLE", "高値": "DOUBLE", "安値": "DOUBLE",
+               "終値": "DOUBLE", "出来高": "BIGINT", "year": "BIGINT", "month": "BIGINT"}
+CACHE_MAX_BYTES = 512 * 1024 * 1024   # キャッシュ全体の上限（Arrow のバイト数）
+DUCKDB_THREADS = None                  # None なら DuckDB の既定（全コア）
+# ==========================================
+
+DateLike = Union[str, date, None]
+
+_lock = threading.Lock()
+_con = None
+_cache = OrderedDict()
+_cache_bytes = 0
+_stats = {"hits": 0, "misses": 0}
+
+
+def _cursor() -> duckdb.DuckDBPyConnection:
+    """クエリ用のカーソル。スレッドごとに別のカーソルを使えば、共有の接続で並行に読める。"""
+    global _con
+    with _lock:
+        if _con is None:
+            _con = duckdb.connect()
+            if DUCKDB_THREADS:
+                _con.execute(f"SET threads = {int(DUCKDB_THREADS)}")
+        return _con.cursor()
+
+
+def normalize_code(code) -> str:
+    """TDnet の5桁コード（末尾0）を株価データの4桁に揃える。"""
+    c = str(code).strip()
+    return c[:4] if len(c) == 5 and c.endswith("0") else c
+
+
+def _to_date(v: DateLike) -> Optional[date]:
+    if v is None or isinstance(v, date):
+        return v
+    return date.fromisoformat(str(v).replace("/", "-"))
+
+
+def _partition_value(path: str) -> Optional[int]:
+    """year=2023 → 2023。日付が NULL の行のパーティション（__HIVE_DEFAULT_PARTITION__）などは None。"""
+    try:
+        return int(os.path.basename(path).split("=", 1)[1])
+    except ValueError:
+        return None
+
+
+def partition_files(start: DateLike = None, end: DateLike = None, dataset: str = DATASET_DIR) -> List[str]:
+    """期間にかかる year=/month= パーティションの Parquet ファイル一覧。"""
+    start, end = _to_date(start), _to_date(end)
+    lo = (start.year, start.month) if start else (0, 0)
+    hi = (end.year, end.month) if end else (9999, 12)
+    files = []
+    for ydir in sorted(glob.glob(os.path.join(dataset, "year=*"))):
+        year = _partition_value(ydir)
+        if year is None or not lo[0] <= year <= hi[0]:
+            continue
+        for mdir in glob.glob(os.path.join(ydir, "month=*")):
+            month = _partition_value(mdir)
+            if month is not None and lo <= (year, month) <= hi:
+                files.extend(glob.glob(os.path.join(mdir, "*.parquet")))
+    return sorted(files)
+
+
+def _read_sql(files: Sequence[str]) -> Optional[str]:
+    if not files:
+        return None
+    paths = ", ".join("'" + f.replace(os.sep, "/").replace("'", "''") + "'" for f in files)
+    return f"read_parquet([{paths}], hive_partitioning=true, union_by_name=true)"
+
+
+def source_sql(start: DateLike = None, end: DateLike = None, dataset: str = DATASET_DIR) -> Optional[str]:
+    """期間にかかるファイルだけを読む read_parquet(...) の式。該当ファイルがなければ None。"""
+    return _read_sql(partition_files(start, end, dataset))
+
+
+def _files_signature(files: Sequence[str]) -> tuple:
+    """ファイル一覧と各ファイルの更新日時・サイズ（キャッシュのキー用）。"""
+    sig = []
+    for f in files:
+        try:
+            st = os.stat(f)
+        except FileNotFoundError:
+            continue
+        sig.append((f, st.st_mtime_ns, st.st_size))
+    return tuple(sig)
+
+
+def _quote(v: str) -> str:
+    return "'" + v.replace("'", "''") + "'"
+
+
+def _ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _query(codes, start, end, fields, files):
+    src = _read_sql(files)
+    if src is None:
+        return None
+    where = []
+    if codes is not None:
+        # 定数の IN リストにすると Parquet の読み込みまで条件が押し込まれる
+        where.append(f"コード IN ({', '.join(_quote(c) for c in codes)})" if codes else "FALSE")
+    if start:
+        where.append(f"日付 >= DATE '{start.isoformat()}'")
+    if end:
+        where.append(f"日付 <= DATE '{end.isoformat()}'")
+    return (f"SELECT {', '.join(_ident(f) for f in fields)} FROM {src}"
+            + (f" WHERE {' AND '.join(where)}" if where else "")
+            + " ORDER BY コード, 日付")
+
+
+def _empty_table(fields):
+    cols = ", ".join(f"CAST(NULL AS {FIELD_TYPES.get(f, 'VARCHAR')}) AS {_ident(f)}" for f in fields)
+    cur = _cursor()
+    try:
+        return cur.execute(f"SELECT {cols} LIMIT 0").fetch_arrow_table()
+    finally:
+        cur.close()
+
+
+def _cache_put(key, table):
+    # 同じ条件の古い世代（ファイルが変わる前の結果）は捨てる。キーの最後の要素がファイルの世代
+    global _cache_bytes
+    for old_key in [k for k in _cache if k[:-1] == key[:-1]]:
+        _cache_bytes -= _cache.pop(old_key).nbytes
+    size = table.nbytes
+    if size > CACHE_MAX_BYTES:
+        return
+    _cache[key] = table
+    _cache_bytes += size
+    while _cache_bytes > CACHE_MAX_BYTES:
+        _, old = _cache.popitem(last=False)
+        _cache_bytes -= old.nbytes
+
+
+def load_prices(codes: Optional[Iterable] = None, start: DateLike = None, end: DateLike = None,
+                fields: Optional[Sequence[str]] = None, as_pandas: bool = False, dataset: str = DATASET_DIR):
+    """コード・期間・列を指定して株価を読み込む。
+
+    codes=None は全銘柄、start/end=None は端まで。fields は DEFAULT_FIELDS から選ぶ。
+    戻り値は pyarrow.Table（キャッシュと共有するため変更しないこと）。as_pandas=True なら DataFrame。
+    """
+    codes_key = None if codes is None else tuple(sorted({normalize_code(c) for c in codes}))
+    start, end = _to_date(start), _to_date(end)
+    fields = tuple(fields or DEFAULT_FIELDS)
+    files = partition_files(start, end, dataset)
+    key = (os.path.abspath(dataset), codes_key, start, end, fields, _files_signature(files))
+
+    # ロックはキャッシュの参照・登録だけ。読み込み中も他のスレッドはキャッシュを使える
+    with _lock:
+        table = _cache.get(key)
+        if table is not None:
+            _cache.move_to_end(key)
+            _stats["hits"] += 1
+        else:
+            _stats["misses"] += 1
+    if table is None:
+        sql = _query(codes_key, start, end, fields, files)
+        if sql is None:
+            table = _empty_table(fields)
+        else:
+            cur = _cursor()
+            try:
+                table = cur.execute(sql).fetch_arrow_table()
+            finally:
+                cur.close()
+        with _lock:
+            _cache_put(key, table)
+    return table.to_pandas() if as_pandas else table
+
+
+def cache_info() -> dict:
+    with _lock:
+        return {"entries": len(_cache), "bytes": _cache_bytes, "max_bytes": CACHE_MAX_BYTES, **_stats}
+
+
+def clear_cache():
+    global _cache_bytes
+    with _lock:
+        _cache.clear()
+        _cache_bytes = 0
+
+
+if __name__ == "__main__":
+    # 使い方: python stock_prices.py 7203[,6758] [開始日] [終了日]
+    if len(sys.argv) < 2:
+        print("使い方: python stock_prices.py コード[,コード...] [開始日 YYYY-MM-DD] [終了日 YYYY-MM-DD]")
+        sys.exit(1)
+    arg_codes = sys.argv[1].split(",")
+    arg_start = sys.argv[2] if len(sys.argv) > 2 else None
+    arg_end = sys.argv[3] if len(sys.argv) > 3 else None
+    for label in ("初回", "2回目"):
+        t = time.perf_counter()
+        result = load_prices(arg_codes, arg_start, arg_end)
+        print(f"{label}: {result.num_rows}行 {(time.perf_counter() - t) * 1000:.1f}ms")
+    print(result.slice(0, 5).to_pydict())
+    print(cache_info())
@@ -1,10 +1,9 @@
 import os
+import heapq
 import requests
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
 import time
-import win32com.client
-import pythoncom
 
 # ================= config =================
 EXCEL_FILE = r'\\LS720D7A9\TakashiBK\投資\TDNET\TDnet適時情報開示サービス\TDnet適時開示情報.xlsm'
@@ -12,8 +11,27 @@ BASE_DIR = os.path.dirname(EXCEL_FILE)
 SHEET_NAME = '適時開示情報'
 PDF_FOLDER = os.path.join(BASE_DIR, "TDnet(決算短信)-PDF-随時追加分")
 XBRL_FOLDER = os.path.join(BASE_DIR, "TDnet(決算短信)XBRL-随時追加分")
+# 初回のみ使う開始行。以降は tdnet_watermark の記録（新規行＋内容が変わったブロック）で対象を決める
 START_ROW_INDEX = 41652
+FIRST_DATA_ROW = 2
+WATERMARK_STAGE = "download:excel"
 MAX_WORKERS = 15
+# 内容アドレス型ストア（tdnet_blobstore）を使う。同一URL・同一内容は再取得/再保存しない
+USE_BLOB_STORE = True
+# タスクの取得元: "duckdb" = tdnet.duckdb の未DL行 / "excel" = シートのSTART_ROW_INDEX以降
+SOURCE = "duckdb"
+
+# --- 優先度設定（スコアが大きいほど先にDL） ---
+# 種別ごとの優先度（tdnet_Qperiod の判定結果。未分類は 0）
+PRIORITY_REPORT_TYPE = {"決算短信": 100, "業績予想": 60, "決算説明": 40, "中期経営": 20, "事業計画": 20}
+# ウォッチリスト銘柄の加点
+WATCHLIST_CODES = set()   # 例: {"7203", "6758"}
+PRIORITY_WATCHLIST = 200
+NEWEST_FIRST = True       # 同スコア内では新しい連番から
+PDF_FIRST = True          # 同スコア内では PDF を XBRL より先に
+# 打ち切り設定（None で無制限）。超えたら新規投入を止め、残りは次回に持ち越す
+DEADLINE_SEC = None       # 例: 600 (10分)
+MAX_JOBS = None           # 例: 500 (ファイル数)
 # ==========================================
 
 def get_timestamp_msg(msg):
@@ -24,6 +42,9 @@ def download_file(url, save_path):
         if not url or not str(url).startswith('http'):
             return "失敗: URL不正"
         headers = {"User-Agent": "Mozilla/5.0"}
+        if USE_BLOB_STORE:
+            import tdnet_blobstore
+            return tdnet_blobstore.download_to(url, save_path, headers=headers)
         response = requests.get(url, timeout=30, headers=headers)
         if response.status_code == 200:
             with open(save_path, 'wb') as f:
@@ -33,7 +54,149 @@ def download_file(url, save_path):
     except Exception as e:
         return f"失敗: {str(e)}"
 
+def task_priority(t):
+    """タスクの優先度スコアを返す。"""
+    score = 0
+    rtype = t.get("種別")
+    if not rtype:
+        # シート由来のタスクはファイル名の (種別) から推定
+        rtype = next((k for k in PRIORITY_REPORT_TYPE if k in str(t.get("fname") or "")), None)
+    score += PRIORITY_REPORT_TYPE.get(rtype, 0)
+    code = str(t.get("コード") or "")
+    if code and (code in WATCHLIST_CODES or code[:4] in WATCHLIST_CODES):
+        score += PRIORITY_WATCHLIST
+    return score
+
+def build_jobs(tasks):
+    """タスクを PDF/XBRL 単位のジョブに分け、優先度順のヒープにする。"""
+    heap = []
+    for t in tasks:
+        score = task_priority(t)
+        recency = -t["row"] if NEWEST_FIRST else t["row"]
+        fname = str(t["fname"])
+        if t["p_url"] and str(t["p_url"]).startswith("http"):
+            fn = fname if fname.lower().endswith(".pdf") else f"{fname}.pdf"
+            job = {"row": t["row"], "kind": "p", "url": t["p_url"], "path": os.path.join(PDF_FOLDER, fn)}
+            heapq.heappush(heap, (-score, 0 if PDF_FIRST else 1, recency, len(heap), job))
+        if t["x_url"] and str(t["x_url"]).startswith("http"):
+            fn = fname.replace(".pdf", "").replace(".PDF", "") + ".zip"
+            job = {"row": t["row"], "kind": "x", "url": t["x_url"], "path": os.path.join(XBRL_FOLDER, fn)}
+            heapq.heappush(heap, (-score, 1 if PDF_FIRST else 0, recency, len(heap), job))
+    return heap
+
+def execute_job(job):
+    return job, get_timestamp_msg(download_file(job["url"], job["path"]))
+
+def run_downloads(tasks, deadline_sec=DEADLINE_SEC, max_jobs=MAX_JOBS):
+    """優先度順にジョブを投入して並列実行し、行単位の結果リストを返す。
+
+    実行中のジョブ数を並列数に抑え、投入のたびに最優先のジョブを選ぶ。
+    期限・件数上限に達したら投入を止め、未投入分は結果に含めない（次回に持ち越し）。
+    """
+    heap = build_jobs(tasks)
+    total = len(heap)
+    results = {}
+    start = time.time()
+    first_hit = None
+    submitted, completed_count = 0, 0
+
+    def budget_left():
+        if deadline_sec is not None and time.time() - start >= deadline_sec:
+            return False
+        if max_jobs is not None and submitted >= max_jobs:
+            return False
+        return True
+
+    # 進捗表示付きで実行
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        running = set()
+        while heap or running:
+            while heap and len(running) < MAX_WORKERS and budget_left():
+                job = heapq.heappop(heap)[-1]
+                running.add(executor.submit(execute_job, job))
+                submitted += 1
+            if not running:
+                break
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                job, msg = future.result()
+                res = results.setdefault(job["row"], {"row": job["row"], "p_msg": None, "x_msg": None})
+                res[f"{job['kind']}_msg"] = msg
+                if first_hit is None and "成功" in msg:
+                    first_hit = time.time() - start
+                completed_count += 1
+                if completed_count % 10 == 0 or completed_count == total:
+                    print(f"  進捗: {completed_count}/{total} 件完了...", end="\r")
+
+    if heap:
+        print(f"\n打ち切り: 未実行 {len(heap)} 件は次回に持ち越します。")
+    if first_hit is not None:
+        print(f"\n初回取得までの時間: {first_hit:.2f}秒")
+    return list(results.values())
+
+def print_summary(script_start_time, dl_start_time, dl_end_time, tasks, p_cnt, x_cnt):
+    total_elapsed = time.time() - script_start_time
+    dl_elapsed = dl_end_time - dl_start_time
+    avg_speed = dl_elapsed / len(tasks) if tasks else 0
+
+    print("\n" + "="*45)
+    print(f" 【処理結果概要】")
+    print(f"  総実行時間　: {int(total_elapsed // 60)}分 {int(total_elapsed % 60)}秒")
+    print(f"  DL純処理時間: {int(dl_elapsed // 60)}分 {int(dl_elapsed % 60)}秒")
+    print(f"  平均DL速度  : {avg_speed:.2f} 秒/件")
+    print(f"  新規PDF取得 : {p_cnt} 件")
+    print(f"  新規XBRL取得: {x_cnt} 件")
+    if USE_BLOB_STORE:
+        import tdnet_blobstore
+        links = tdnet_blobstore.link_counts()
+        if links:
+            print(f"  リンク方式  : " + " / ".join(f"{k} {v}件" for k, v in sorted(links.items())))
+        if links.get("copy") and tdnet_blobstore.LINK_MODE != "copy":
+            print(f"  ※ {links['copy']}件はリンクできずコピーしました（保存先がリンク非対応の可能性）")
+    print("="*45)
+
+def main_duckdb():
+    """tdnet.duckdb の未DL行だけを対象にダウンロードし、結果をDBへ記録する。"""
+    import tdnet_worklist
+    script_start_time = time.time() # 全体開始時間
+    print(f"--- スクリプト開始 [{datetime.now().strftime('%H:%M:%S')}] ---")
+
+    os.makedirs(PDF_FOLDER, exist_ok=True)
+    os.makedirs(XBRL_FOLDER, exist_ok=True)
+
+    con = None
+    try:
+        con = tdnet_worklist.connect()
+        # 分類済みでファイル名が未設定の行に、保存先のパス長に収まる名前を付ける
+        import tdnet_filename
+        n_named, n_trunc, n_coll = tdnet_filename.assign_filenames(con, folders=(PDF_FOLDER, XBRL_FOLDER))
+        if n_named:
+            print(f"ファイル名生成: {n_named}件 (切り詰め {n_trunc}件 / 衝突 {n_coll}件)")
+        tasks = tdnet_worklist.fetch_pending_downloads(con)
+        if not tasks:
+            print("処理対象の新規データはありません。")
+            return
+
+        print(f"ダウンロード開始: {len(tasks)}件 (並列数:{MAX_WORKERS})")
+        dl_start_time = time.time()
+        results = run_downloads(tasks)
+        dl_end_time = time.time()
+        print(f"\nダウンロード完了。DBに書き込んでいます...")
+
+        tdnet_worklist.save_download_results(con, results)
+        p_cnt = sum(1 for r in results if r["p_msg"] and "成功" in r["p_msg"])
+        x_cnt = sum(1 for r in results if r["x_msg"] and "成功" in r["x_msg"])
+        print_summary(script_start_time, dl_start_time, dl_end_time, tasks, p_cnt, x_cnt)
+
+    except Exception as e:
+        print(f"\n致命的なエラー: {e}")
+    finally:
+        if con: con.close()
+        print(f"--- スクリプト終了 [{datetime.now().strftime('%H:%M:%S')}] ---")
+
 def main():
+    import win32com.client  # Excel から読むときだけ pywin32 を使う
+    import pythoncom
     script_start_time = time.time() # 全体開始時間
     print(f"--- スクリプト開始 [{datetime.now().strftime('%H:%M:%S')}] ---")
     
@@ -76,84 +239,87 @@ def main():
         COL_PDF_RES = find_col("pdfDL", 14)
         COL_XBRL_RES = find_col("xbrlDL", 15)
 
-        # タスク抽出
-        tasks = []
-        for r in range(START_ROW_INDEX, max_row + 1):
-            fname = ws.Cells(r, COL_FILENAME).Value
-            p_res = ws.Cells(r, COL_PDF_RES).Value
-            x_res = ws.Cells(r, COL_XBRL_RES).Value
-            
-            p_url = None
-            if not p_res or str(p_res).strip() in ["", "None"]:
-                c = ws.Cells(r, COL_PDF_URL)
-                p_url = c.Hyperlinks(1).Address if c.Hyperlinks.Count > 0 else c.Value
-            
-            x_url = None
-            if not x_res or str(x_res).strip() in ["", "None"]:
-                c = ws.Cells(r, COL_XBRL_URL)
-                x_url = c.Hyperlinks(1).Address if c.Hyperlinks.Count > 0 else c.Value
-
-            if (p_url or x_url) and fname:
-                tasks.append({"row": r, "fname": fname, "p_url": p_url, "x_url": x_url})
+        # タスク抽出（ファイル名・結果列は一括で読み、前回から変化のない範囲はセルを見に行かない）
+        import tdnet_watermark as wm
+        from tdnet_worklist import connect
+        def read_col(col):
+            return [v[0] for v in ws.Range(ws.Cells(FIRST_DATA_ROW, col), ws.Cells(max_row, col)).Value]
+        fnames, p_results, x_results = read_col(COL_FILENAME), read_col(COL_PDF_RES), read_col(COL_XBRL_RES)
+        def fp_rows():
+            return [(wm.normalize_cell(f), wm.normalize_cell(p), wm.normalize_cell(x))
+                    for f, p, x in zip(fnames, p_results, x_results)]
 
-        if not tasks:
-            print("処理対象の新規データはありません。")
-            return
+        con = connect()
+        try:
+            last_key = wm.get_last_key(con, WATERMARK_STAGE)
+            ranges = wm.pending_ranges(con, WATERMARK_STAGE,
+                                       wm.block_fingerprints(fp_rows(), FIRST_DATA_ROW, last_key),
+                                       max_row, START_ROW_INDEX)
+            print(f"確認範囲: {wm.count_rows(ranges)}行")
 
-        # ダウンロード実行
-        print(f"ダウンロード開始: {len(tasks)}件 (並列数:{MAX_WORKERS})")
-        dl_start_time = time.time()
-        
-        results = []
-        def execute_task(t):
-            res = {"row": t["row"], "p_msg": None, "x_msg": None}
-            if t["p_url"] and str(t["p_url"]).startswith("http"):
-                fn = str(t["fname"]) if str(t["fname"]).lower().endswith(".pdf") else f"{t['fname']}.pdf"
-                res["p_msg"] = get_timestamp_msg(download_file(t["p_url"], os.path.join(PDF_FOLDER, fn)))
-            if t["x_url"] and str(t["x_url"]).startswith("http"):
-                fn = str(t["fname"]).replace(".pdf", "").replace(".PDF", "") + ".zip"
-                res["x_msg"] = get_timestamp_msg(download_file(t["x_url"], os.path.join(XBRL_FOLDER, fn)))
-            return res
-
-        # 進捗表示付きで実行
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            future_to_task = {executor.submit(execute_task, t): t for t in tasks}
-            completed_count = 0
-            for future in as_completed(future_to_task):
-                results.append(future.result())
-                completed_count += 1
-                if completed_count % 10 == 0 or completed_count == len(tasks):
-                    print(f"  進捗: {completed_count}/{len(tasks)} 件完了...", end="\r")
+            tasks = []
+            for range_start, range_end in ranges:
+                for r in range(range_start, range_end + 1):
+                    i = r - FIRST_DATA_ROW
+                    fname, p_res, x_res = fnames[i], p_results[i], x_results[i]
+
+                    p_url = None
+                    if not p_res or str(p_res).strip() in ["", "None"]:
+                        c = ws.Cells(r, COL_PDF_URL)
+                        p_url = c.Hyperlinks(1).Address if c.Hyperlinks.Count > 0 else c.Value
+
+                    x_url = None
+                    if not x_res or str(x_res).strip() in ["", "None"]:
+                        c = ws.Cells(r, COL_XBRL_URL)
+                        x_url = c.Hyperlinks(1).Address if c.Hyperlinks.Count > 0 else c.Value
+
+                    if (p_url or x_url) and fname:
+                        tasks.append({"row": r, "fname": fname, "p_url": p_url, "x_url": x_url})
+
+            if not tasks:
+                wm.commit(con, WATERMARK_STAGE, max_row, wm.block_fingerprints(fp_rows(), FIRST_DATA_ROW, max_row))
+                print("処理対象の新規データはありません。")
+                return
+
+            # ダウンロード実行
+            print(f"ダウンロード開始: {len(tasks)}件 (並列数:{MAX_WORKERS})")
+            dl_start_time = time.time()
+
+            results = run_downloads(tasks)
+            dl_end_time = time.time()
+            print(f"\nダウンロード完了。Excelに書き込んでいます...")
+
+            # 書き込み
+            excel.ScreenUpdating = False
+            p_cnt, x_cnt = 0, 0
+            for r in results:
+                i = r["row"] - FIRST_DATA_ROW
+                if r["p_msg"]:
+                    ws.Cells(r["row"], COL_PDF_RES).Value = r["p_msg"]
+                    p_results[i] = r["p_msg"]
+                    if "成功" in r["p_msg"]: p_cnt += 1
+                if r["x_msg"]:
+                    ws.Cells(r["row"], COL_XBRL_RES).Value = r["x_msg"]
+                    x_results[i] = r["x_msg"]
+                    if "成功" in r["x_msg"]: x_cnt += 1
+
+            wb.Save()
+
+            # 打ち切りで持ち越した行を含むブロックは記録せず、次回も確認させる
+            done = {r["row"]: r for r in results}
+            carried = set()
+            for t in tasks:
+                res = done.get(t["row"], {})
+                if (t["p_url"] and str(t["p_url"]).startswith("http") and not res.get("p_msg")) or \
+                        (t["x_url"] and str(t["x_url"]).startswith("http") and not res.get("x_msg")):
+                    carried.add(t["row"] // wm.BLOCK_SIZE)
+            fps = wm.block_fingerprints(fp_rows(), FIRST_DATA_ROW, max_row)
+            wm.commit(con, WATERMARK_STAGE, max_row, {b: fp for b, fp in fps.items() if b not in carried})
+        finally:
+            con.close()
 
-        dl_end_time = time.time()
-        print(f"\nダウンロード完了。Excelに書き込んでいます...")
-
-        # 書き込み
-        excel.ScreenUpdating = False
-        p_cnt, x_cnt = 0, 0
-        for r in results:
-            if r["p_msg"]:
-                ws.Cells(r["row"], COL_PDF_RES).Value = r["p_msg"]
-                if "成功" in r["p_msg"]: p_cnt += 1
-            if r["x_msg"]:
-                ws.Cells(r["row"], COL_XBRL_RES).Value = r["x_msg"]
-                if "成功" in r["x_msg"]: x_cnt += 1
-        
-        wb.Save()
-        
         # --- 時間計算 ---
-        total_elapsed = time.time() - script_start_time
-        dl_elapsed = dl_end_time - dl_start_time
-        avg_speed = dl_elapsed / len(tasks) if tasks else 0
-
-        print("\n" + "="*45)
-        print(f" 【処理結果概要】")
-        print(f"  総実行時間　: {int(total_elapsed // 60)}分 {int(total_elapsed % 60)}秒")
-        print(f"  DL純処理時間: {int(dl_elapsed // 60)}分 {int(dl_elapsed % 60)}秒")
-        print(f"  平均DL速度  : {avg_speed:.2f} 秒/件")
-        print(f"  新規PDF取得 : {p_cnt} 件")
-        print(f"  新規XBRL取得: {x_cnt} 件")
-        print("="*45)
+        print_summary(script_start_time, dl_start_time, dl_end_time, tasks, p_cnt, x_cnt)
 
     except Exception as e:
         print(f"\n致命的なエラー: {e}")
@@ -164,4 +330,7 @@ def main():
         print(f"--- スクリプト終了 [{datetime.now().strftime('%H:%M:%S')}] ---")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if SOURCE == "duckdb":
+        main_duckdb()
+    else:
+        main()
\ No newline at end of file
@@ -5,15 +5,37 @@ import re
 import unicodedata
 import time
 import os
+import json
+import sqlite3
+import hashlib
+from collections import OrderedDict
 from datetime import datetime
 from calendar import monthrange
-import win32com.client  # pywin32を使用
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from tdnet_taxonomy import get_taxonomy
 
 # =================================================================
 # 1. 設定エリア
 # =================================================================
 TARGET_FILE_PATH = r'\\LS720D7A9\TakashiBK\投資\TDNET\TDnet適時情報開示サービス\TDnet適時開示情報.xlsm'
+# 初回のみ使う開始行。以降は tdnet_watermark の記録（新規行＋内容が変わったブロック）で対象を決める
 START_ROW = 41651
+FIRST_DATA_ROW = 2
+WATERMARK_STAGE = "Qperiod:excel"
+DUCKDB_WATERMARK_STAGE = "Qperiod:duckdb"
+# 処理元: "duckdb" = tdnet.duckdb の未分類行 / "excel" = シートのSTART_ROW以降
+SOURCE = "duckdb"
+# 一括判定でプロセス並列にする件数の目安（これ未満は1プロセスで処理）
+PARALLEL_CHUNK_SIZE = 20000
+# 種別（ファイル名の (種別) ・DL優先度に使う）は従来の5区分のみ。上から順に最初に含まれたもの
+# その他のカテゴリ（tdnet_report_types.json）は extract_report_categories / カテゴリ列で扱う
+REPORT_TYPE_KEYWORDS = ["業績予想", "事業計画", "中期経営", "決算説明", "決算短信"]
+# 判定結果キャッシュ（正規化済み表題 -> 判定結果）。判定規則を変えたら CLASSIFIER_VERSION を上げる
+USE_CLASSIFY_CACHE = True
+CLASSIFIER_VERSION = "2"
+CLASSIFY_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tdnet_Qperiod_cache.sqlite")
+CLASSIFY_CACHE_MAX_ENTRIES = 200000  # メモリ上のLRU上限
 # =================================================================
 
 ERA_TO_YEAR = {
@@ -33,11 +55,14 @@ def era_to_western(era_name, era_year_str):
 
 def extract_report_type(text):
     normalized = normalize_text(text)
-    keywords = ["業績予想", "事業計画", "中期経営", "決算説明", "決算短信"]
-    for kw in keywords:
+    for kw in REPORT_TYPE_KEYWORDS:
         if kw in normalized: return kw
     return None
 
+def extract_report_categories(text):
+    """該当する全カテゴリ（優先度順）。"""
+    return get_taxonomy().match(normalize_text(text))
+
 def extract_fiscal_period(text):
     normalized = normalize_text(text)
     p1 = r'(\d{4})年([1-9]|1[0-2])月(期)?'
@@ -64,7 +89,275 @@ def extract_quarter(text):
     if re.search(r'下半期|下期|通期', normalized): return '4Q'
     return None
 
+def classify_title(title):
+    """表題から (種別, 決算期末(year, month, day), quarter) を返す。判定不可は空/None。"""
+    row_rtype = ""
+    row_period = None
+    row_q = ""
+    if title and isinstance(title, str):
+        # 種別判定
+        row_rtype = extract_report_type(title) or ""
+
+        # 決算期・四半期判定
+        period = extract_fiscal_period(title)
+        if period:
+            last_day = monthrange(period[0], period[1])[1]
+            row_period = (period[0], period[1], last_day)
+            row_q = extract_quarter(title) or '4Q'
+    return row_rtype, row_period, row_q
+
+# =================================================================
+# 2. 一括判定エンジン（正規化は1回、パターンはコンパイル済み）
+#    classify_title と同じ結果を返す。判定規則を変えるときは両方を直すこと。
+# =================================================================
+RE_SPACES = re.compile(r'\s+')
+RE_PERIOD_WESTERN = re.compile(r'(\d{4})年([1-9]|1[0-2])月(期)?')
+RE_PERIOD_ERA = re.compile(r'(令和|平成|昭和|大正|明治)(元|\d+)年([1-9]|1[0-2])月(期)?')
+# 四半期の規則を1本にまとめ、マッチした規則の優先順（Q表記 > 第N四半期 > 上期 > 通期）で選ぶ
+RE_QUARTER = re.compile(
+    r'(?P<q1>[1-4])\s*Q|Q\s*(?P<q2>[1-4])'
+    r'|第\s*(?P<q3>[一二三四１２３４1-4])\s*四\s*半\s*期'
+    r'|(?P<half>上半期|上期|中間期|中間)'
+    r'|(?P<full>下半期|下期|通期)',
+    re.IGNORECASE)
+_QUARTER_KANJI = {'一':'1','二':'2','三':'3','四':'4','１':'1','２':'2','３':'3','４':'4','1':'1','2':'2','3':'3','4':'4'}
+
+@lru_cache(maxsize=None)
+def _last_day(year, month):
+    return monthrange(year, month)[1]
+
+def _quarter_normalized(normalized):
+    best_rank, best = 4, None
+    for m in RE_QUARTER.finditer(normalized):
+        kind = m.lastgroup
+        if kind in ("q1", "q2"):
+            return f"{m.group(kind)}Q"
+        rank = 1 if kind == "q3" else 2 if kind == "half" else 3
+        if rank < best_rank:
+            best_rank = rank
+            best = f"{_QUARTER_KANJI.get(m.group('q3'), '4')}Q" if kind == "q3" else '2Q' if kind == "half" else '4Q'
+    return best
+
+def _report_type_normalized(normalized):
+    return next((kw for kw in REPORT_TYPE_KEYWORDS if kw in normalized), "")
+
+def classify_normalized(normalized):
+    """正規化済みの表題から (種別, 決算期末(year, month, day), quarter) を返す。"""
+    rtype = _report_type_normalized(normalized)
+
+    m = RE_PERIOD_WESTERN.search(normalized)
+    if m:
+        year, month = int(m.group(1)), int(m.group(2))
+    else:
+        m = RE_PERIOD_ERA.search(normalized)
+        if not m:
+            return rtype, None, ""
+        year, month = era_to_western(m.group(1), m.group(2)), int(m.group(3))
+    return rtype, (year, month, _last_day(year, month)), _quarter_normalized(normalized) or '4Q'
+
+def normalize_fast(text):
+    return RE_SPACES.sub(' ', unicodedata.normalize('NFKC', text)).strip()
+
+def classify_titles(titles):
+    """表題の列をまとめて判定し、[(種別, 決算期末, quarter), ...] を返す。"""
+    results = []
+    for title in titles:
+        if title and isinstance(title, str):
+            results.append(classify_normalized(normalize_fast(title)))
+        else:
+            results.append(("", None, ""))
+    return results
+
+def classify_titles_parallel(titles, processes=None, chunk_size=PARALLEL_CHUNK_SIZE):
+    """全件再判定向け。chunk_size ごとにプロセスへ分配する。"""
+    titles = list(titles)
+    if len(titles) <= chunk_size:
+        return classify_titles(titles)
+    chunks = [titles[i:i + chunk_size] for i in range(0, len(titles), chunk_size)]
+    results = []
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        for part in executor.map(classify_titles, chunks):
+            results.extend(part)
+    return results
+
+# =================================================================
+# 3. 判定結果キャッシュ（メモリLRU + SQLite永続化）
+# =================================================================
+def classifier_fingerprint():
+    """キャッシュの世代。CLASSIFIER_VERSION と判定規則の内容から作る。"""
+    rules = [CLASSIFIER_VERSION, REPORT_TYPE_KEYWORDS, ERA_TO_YEAR, RE_PERIOD_WESTERN.pattern,
+             RE_PERIOD_ERA.pattern, RE_QUARTER.pattern]
+    return hashlib.sha1(json.dumps(rules, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+class ClassificationCache:
+    """正規化済み表題をキーにした判定結果キャッシュ。
+
+    世代（classifier_fingerprint）が変わると古い行は開いた時点で削除される。
+    """
+
+    def __init__(self, path=CLASSIFY_CACHE_PATH, max_entries=CLASSIFY_CACHE_MAX_ENTRIES):
+        self.version = classifier_fingerprint()
+        self.max_entries = max_entries
+        self.memo = OrderedDict()
+        self.pending = {}
+        self.hits = self.disk_hits = self.misses = 0
+        self.con = sqlite3.connect(path)
+        self.con.execute("""
+            CREATE TABLE IF NOT EXISTS classify_cache (
+                version TEXT, normalized TEXT, rtype TEXT, y INTEGER, m INTEGER, d INTEGER, q TEXT,
+                PRIMARY KEY (version, normalized)
+            )
+        """)
+        self.con.execute("DELETE FROM classify_cache WHERE version <> ?", (self.version,))
+        self.con.commit()
+
+    def _remember(self, key, value):
+        self.memo[key] = value
+        self.memo.move_to_end(key)
+        if len(self.memo) > self.max_entries:
+            self.memo.popitem(last=False)
+
+    def lookup(self, keys):
+        """keys のうちキャッシュにあるものを {key: 結果} で返す。"""
+        found = {}
+        disk_keys = []
+        for k in keys:
+            if k in self.memo:
+                self.memo.move_to_end(k)
+                found[k] = self.memo[k]
+            elif k in self.pending:
+                found[k] = self.pending[k]
+            else:
+                disk_keys.append(k)
+        self.hits += len(found)
+        if len(disk_keys) > 5000:
+            # 全件再判定などキーが多いときは世代の全行を1回で読む
+            wanted = set(disk_keys)
+            rows = (r for r in self.con.execute(
+                "SELECT normalized, rtype, y, m, d, q FROM classify_cache WHERE version = ?", (self.version,))
+                if r[0] in wanted)
+            self._load_rows(rows, found)
+        else:
+            for i in range(0, len(disk_keys), 500):
+                chunk = disk_keys[i:i + 500]
+                self._load_rows(self.con.execute(
+                    f"SELECT normalized, rtype, y, m, d, q FROM classify_cache "
+                    f"WHERE version = ? AND normalized IN ({','.join('?' * len(chunk))})",
+                    [self.version] + chunk), found)
+        return found
+
+    def _load_rows(self, rows, found):
+        for k, rtype, y, m, d, q in rows:
+            value = (rtype, (y, m, d) if y else None, q)
+            found[k] = value
+            self._remember(k, value)
+            self.disk_hits += 1
+
+    def store(self, key, value):
+        self._remember(key, value)
+        self.pending[key] = value
+        self.misses += 1
+
+    def flush(self):
+        if not self.pending:
+            return
+        rows = []
+        for k, (rtype, period, q) in self.pending.items():
+            y, m, d = period if period else (None, None, None)
+            rows.append((self.version, k, rtype, y, m, d, q))
+        with self.con:
+            self.con.executemany("INSERT OR REPLACE INTO classify_cache VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        self.pending = {}
+
+    def close(self):
+        self.flush()
+        self.con.close()
+
+def classify_titles_cached(titles, cache):
+    """classify_titles と同じ結果を、キャッシュ未登録の表題だけ判定して返す。"""
+    raw_to_key = {}
+    for title in titles:
+        if title and isinstance(title, str) and title not in raw_to_key:
+            raw_to_key[title] = normalize_fast(title)
+
+    keys = list(set(raw_to_key.values()))
+    found = cache.lookup(keys)
+    missing = [k for k in keys if k not in found]
+    if missing:
+        classified = classify_titles_parallel(missing)
+        for k, value in zip(missing, classified):
+            found[k] = value
+            cache.store(k, value)
+        cache.flush()
+
+    return [found[raw_to_key[t]] if t in raw_to_key else ("", None, "") for t in titles]
+
+def classify_column(titles):
+    """設定に応じてキャッシュ経由または直接、表題の列を判定する。"""
+    if not USE_CLASSIFY_CACHE:
+        return classify_titles_parallel(titles)
+    cache = ClassificationCache()
+    try:
+        results = classify_titles_cached(titles, cache)
+        print(f"キャッシュ: ヒット {cache.hits}件 / 永続ヒット {cache.disk_hits}件 / 新規判定 {cache.misses}件")
+        return results
+    finally:
+        cache.close()
+
+def process_with_duckdb(db_path):
+    """tdnet.duckdb の未分類行だけを判定して disclosure_class に書き込む。"""
+    import tdnet_worklist
+    import tdnet_watermark as wm
+    from datetime import date
+    start_time = time.time()
+
+    con = tdnet_worklist.connect(db_path)
+    try:
+        n_class, n_file = tdnet_worklist.reset_report_types(con, REPORT_TYPE_KEYWORDS)
+        if n_class:
+            print(f"従来の5区分以外の種別を空に戻しました: {n_class}件 (ファイル名の再生成対象 {n_file}件)")
+
+        # 前回以降に表題が書き換わったブロックは判定結果を消して再判定させる
+        last_key = wm.get_last_key(con, DUCKDB_WATERMARK_STAGE)
+        max_key = con.execute("SELECT coalesce(MAX(連番), 0) FROM disclosure_info").fetchone()[0]
+        fps = wm.table_block_fingerprints(con, "disclosure_info", "連番", ["表題"], last_key)
+        for range_start, range_end in wm.pending_ranges(con, DUCKDB_WATERMARK_STAGE, fps, max_key, 0):
+            if last_key is not None and range_start <= last_key:
+                con.execute("DELETE FROM disclosure_class WHERE 連番 BETWEEN ? AND ?",
+                            [range_start, min(range_end, last_key)])
+
+        targets = tdnet_worklist.fetch_unclassified(con)
+        if not targets:
+            wm.commit(con, DUCKDB_WATERMARK_STAGE, max_key,
+                      wm.table_block_fingerprints(con, "disclosure_info", "連番", ["表題"], max_key))
+            print("処理対象の行がありません。")
+            return
+
+        rows = []
+        updated_count = 0
+        classified = classify_column([title for _, title in targets])
+        taxonomy = get_taxonomy()
+        for (seq, title), (row_rtype, row_period, row_q) in zip(targets, classified):
+            if row_period:
+                updated_count += 1
+            categories = ",".join(taxonomy.match(normalize_fast(title))) if isinstance(title, str) else ""
+            rows.append((seq, row_rtype, date(*row_period) if row_period else None, row_q, categories))
+        tdnet_worklist.save_classification(con, rows)
+        wm.commit(con, DUCKDB_WATERMARK_STAGE, max_key,
+                  wm.table_block_fingerprints(con, "disclosure_info", "連番", ["表題"], max_key))
+    finally:
+        con.close()
+
+    end_time = time.time()
+    print("-" * 40)
+    print(f"【処理結果】")
+    print(f"全対象行数: {len(targets)}件")
+    print(f"判定成功数: {updated_count}件")
+    print(f"処理時間  : {end_time - start_time:.2f}秒")
+    print("-" * 40)
+
 def process_with_win32com(file_path, start_row):
+    import win32com.client  # pywin32を使用
     start_time = time.time()
     
     print(f"Excelを操作中...")
@@ -96,58 +389,75 @@ def process_with_win32com(file_path, start_row):
         print("処理対象の行がありません。")
         return
 
-    # 1. データの読み取り (D列: タイトルを一括取得)
-    titles = ws.Range(ws.Cells(start_row, 4), ws.Cells(max_row, 4)).Value
-    
-    # 書き込み用データ作成 (J, K, L列分)
-    output_data = []
-    updated_count = 0
-
-    # 2. ロジック処理
-    for i, row in enumerate(titles):
-        title = row[0]
-        row_rtype = ""
-        row_period = ""
-        row_q = ""
-        
-        if title and isinstance(title, str):
-            # 種別判定
-            row_rtype = extract_report_type(title)
-            
-            # 決算期・四半期判定
-            period = extract_fiscal_period(title)
-            if period:
-                last_day = monthrange(period[0], period[1])[1]
-                # 日付形式を文字列で作成（Excelへの流し込み用）
-                row_period = f"{period[0]}/{period[1]}/{last_day}"
-                row_q = extract_quarter(title) or '4Q'
-                updated_count += 1
-        
-        # 取得した既存の値を保持しつつ、新しく判定したものをセット
-        # (J列, K列, L列) の形式でリスト化
-        output_data.append([row_rtype, row_period, row_q])
-
-    # 3. データの書き込み (J列〜L列の範囲を一括更新)
-    if output_data:
-        write_range = ws.Range(ws.Cells(start_row, 10), ws.Cells(max_row, 12))
-        write_range.Value = output_data
-        # K列の書式設定（yy/mm/dd）
-        ws.Range(ws.Cells(start_row, 11), ws.Cells(max_row, 11)).NumberFormat = "yy/mm/dd"
+    # 1. データの読み取り (D列: タイトル〜L列: 判定結果を一括取得)
+    import tdnet_watermark as wm
+    from tdnet_worklist import connect
+    values = [list(r) for r in ws.Range(ws.Cells(FIRST_DATA_ROW, 4), ws.Cells(max_row, 12)).Value]
+    def fp_row(r):
+        # 表題と判定結果(J〜L)。保存されずに結果が消えた行も再処理対象になる
+        return (wm.normalize_cell(r[0]), wm.normalize_cell(r[6]), wm.normalize_cell(r[7]), wm.normalize_cell(r[8]))
+
+    con = connect()
+    try:
+        last_key = wm.get_last_key(con, WATERMARK_STAGE)
+        fps = wm.block_fingerprints([fp_row(r) for r in values], FIRST_DATA_ROW, last_key)
+        ranges = wm.pending_ranges(con, WATERMARK_STAGE, fps, max_row, start_row)
+        if not ranges:
+            print("処理対象の行がありません。")
+            return
+        print(f"処理範囲: {', '.join(f'{a}-{b}' for a, b in ranges)} 行目")
+
+        updated_count = 0
+        for range_start, range_end in ranges:
+            rows = values[range_start - FIRST_DATA_ROW:range_end - FIRST_DATA_ROW + 1]
+            # 書き込み用データ作成 (J, K, L列分)
+            output_data = []
+
+            # 2. ロジック処理
+            classified = classify_column([row[0] for row in rows])
+            for row, (row_rtype, period, row_q) in zip(rows, classified):
+                row_period = ""
+                if period:
+                    # 日付形式を文字列で作成（Excelへの流し込み用）
+                    row_period = f"{period[0]}/{period[1]}/{period[2]}"
+                    updated_count += 1
+
+                # 取得した既存の値を保持しつつ、新しく判定したものをセット
+                # (J列, K列, L列) の形式でリスト化
+                output_data.append([row_rtype, row_period, row_q])
+                row[6:9] = [row_rtype, row_period, row_q]
+
+            # 3. データの書き込み (J列〜L列の範囲を一括更新)
+            if output_data:
+                write_range = ws.Range(ws.Cells(range_start, 10), ws.Cells(range_end, 12))
+                write_range.Value = output_data
+                # K列の書式設定（yy/mm/dd）
+                ws.Range(ws.Cells(range_start, 11), ws.Cells(range_end, 11)).NumberFormat = "yy/mm/dd"
+
+        wm.commit(con, WATERMARK_STAGE, max_row,
+                  wm.block_fingerprints([fp_row(r) for r in values], FIRST_DATA_ROW, max_row))
+    finally:
+        con.close()
 
     end_time = time.time()
     
     # 結果出力
     print("-" * 40)
     print(f"【処理結果】")
-    print(f"全対象行数: {len(titles)}件")
+    print(f"全対象行数: {wm.count_rows(ranges)}件")
     print(f"判定成功数: {updated_count}件")
     print(f"処理時間  : {end_time - start_time:.2f}秒")
     print("-" * 40)
     print("完了しました。Excelは開いたままですので、内容を確認して保存してください。")
 
 if __name__ == '__main__':
-    print(f"--- TDnet 判定スクリプト (pywin32版: 開いたまま更新) ---")
     try:
-        process_with_win32com(TARGET_FILE_PATH, START_ROW)
+        if SOURCE == "duckdb":
+            import tdnet_worklist
+            print(f"--- TDnet 判定スクリプト (DuckDB版: 未分類行のみ) ---")
+            process_with_duckdb(tdnet_worklist.DB_PATH)
+        else:
+            print(f"--- TDnet 判定スクリプト (pywin32版: 開いたまま更新) ---")
+            process_with_win32com(TARGET_FILE_PATH, START_ROW)
     except Exception as e:
         print(f"エラーが発生しました: {e}")
\ No newline at end of file
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""tdnet_Qperiod の判定速度比較（従来の1件ずつ判定 vs 一括判定エンジン）と結果一致の確認。
+
+従来側の classify_title は変更前と同じ正規表現・キーワード走査のままなので、一括判定の回帰検出に使える。
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import tdnet_Qperiod as qp
+
+# ================= config =================
+DB_PATH = r"C:\Users\ensyu\Documents\Speculation\TDnet\TDnet適時情報開示サービス\tdnet.duckdb"
+# ==========================================
+
+
+def load_titles(db_path=None, file_path=None, limit=None):
+    """表題コーパスを読み込む。file_path（1行1表題）優先、なければ disclosure_info から。"""
+    if file_path:
+        with open(file_path, encoding="utf-8") as f:
+            titles = [line.rstrip("\n") for line in f]
+    else:
+        import duckdb
+        con = duckdb.connect(database=db_path or DB_PATH, read_only=True)
+        titles = [r[0] for r in con.execute("SELECT 表題 FROM disclosure_info ORDER BY 連番").fetchall()]
+        con.close()
+    return titles[:limit] if limit else titles
+
+
+def timed(label, func, titles):
+    start = time.perf_counter()
+    result = func(titles)
+    elapsed = time.perf_counter() - start
+    rate = len(titles) / elapsed if elapsed else float("inf")
+    print(f"  {label:<22}: {elapsed:8.3f}秒  {rate:12,.0f} 件/秒")
+    return result, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="表題判定ベンチマーク")
+    parser.add_argument("--db", default=DB_PATH, help="tdnet.duckdb のパス")
+    parser.add_argument("--file", help="表題コーパス（1行1表題, UTF-8）")
+    parser.add_argument("--limit", type=int, help="先頭N件のみ")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="並列判定のプロセス数")
+    args = parser.parse_args()
+
+    titles = load_titles(args.db, args.file, args.limit)
+    print(f"コーパス: {len(titles)}件 (重複除外 {len(set(titles))}件)")
+
+    base, t_base = timed("従来 classify_title", lambda ts: [qp.classify_title(t) for t in ts], titles)
+    fast, t_fast = timed("classify_titles", qp.classify_titles, titles)
+    par, t_par = timed(f"並列 ({args.processes}プロセス)",
+                       lambda ts: qp.classify_titles_parallel(ts, args.processes), titles)
+
+    mismatches = [(t, a, b) for t, a, b in zip(titles, base, fast) if a != b]
+    print("-" * 40)
+    print(f"高速化率: 一括 {t_base / t_fast if t_fast else 0:.1f}倍 / 並列 {t_base / t_par if t_par else 0:.1f}倍")
+    if mismatches or par != fast:
+        print(f"❌ 結果不一致: {len(mismatches)}件")
+        for t, a, b in mismatches[:10]:
+            print(f"  {t!r}: 従来={a} 一括={b}")
+        sys.exit(1)
+    print("✅ 全件で結果が一致しました。")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""ダウンロードファイルの内容アドレス型ストア（同一内容は1回だけ保存し、名前はリンクで張る）。"""
+
+import os
+import shutil
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from datetime import datetime
+from typing import Optional, Tuple
+
+import requests
+
+# ================= config =================
+BASE_DIR = r'\\LS720D7A9\TakashiBK\投資\TDNET\TDnet適時情報開示サービス'
+BLOB_DIR = os.path.join(BASE_DIR, "TDnet_blobs")
+INDEX_NAME = "url_index.sqlite"
+# 人が見るファイル名の作り方: "hardlink" / "symlink" / "copy"（失敗時は順に下位へ）
+LINK_MODE = "hardlink"
+CHUNK_SIZE = 1024 * 256
+# ==========================================
+
+_lock = threading.Lock()
+_url_locks = {}
+_con = None
+_link_counts = {}   # 方式ごとのリンク作成数（copy はリンクできず実体を複製した数）
+
+
+def _index():
+    """URL -> sha256 の索引（スレッド間で共有、書き込みは _lock で直列化）。"""
+    global _con
+    if _con is None:
+        os.makedirs(BLOB_DIR, exist_ok=True)
+        _con = sqlite3.connect(os.path.join(BLOB_DIR, INDEX_NAME), check_same_thread=False)
+        _con.execute("""
+            CREATE TABLE IF NOT EXISTS blob_urls (
+                url TEXT PRIMARY KEY, sha256 TEXT, size INTEGER, fetched_at TEXT
+            )
+        """)
+        _con.commit()
+    return _con
+
+
+def _url_lock(url: str) -> threading.Lock:
+    # 同じURLを複数スレッドが同時に取りに行かないようにする
+    with _lock:
+        return _url_locks.setdefault(url, threading.Lock())
+
+
+def blob_path(sha256: str) -> str:
+    return os.path.join(BLOB_DIR, sha256[:2], sha256)
+
+
+def lookup_url(url: str) -> Optional[str]:
+    with _lock:
+        row = _index().execute("SELECT sha256 FROM blob_urls WHERE url = ?", (url,)).fetchone()
+    if row and os.path.exists(blob_path(row[0])):
+        return row[0]
+    return None
+
+
+def _record_url(url: str, sha256: str, size: int):
+    with _lock:
+        con = _index()
+        con.execute("INSERT OR REPLACE INTO blob_urls VALUES (?, ?, ?, ?)",
+                    (url, sha256, size, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+        con.commit()
+
+
+def link_into(sha256: str, save_path: str) -> str:
+    """ブロブを save_path から参照できるようにする。使った方式を返す。"""
+    src = blob_path(sha256)
+    if os.path.lexists(save_path):
+        if os.path.isfile(save_path) and os.path.samefile(src, save_path):
+            return "既存"
+        os.remove(save_path)
+    modes = ["hardlink", "symlink", "copy"]
+    for mode in modes[modes.index(LINK_MODE):]:
+        try:
+            if mode == "hardlink":
+                os.link(src, save_path)
+            elif mode == "symlink":
+                os.symlink(src, save_path)
+            else:
+                shutil.copy2(src, save_path)
+            with _lock:
+                _link_counts[mode] = _link_counts.get(mode, 0) + 1
+                first_copy = mode == "copy" and _link_counts[mode] == 1 and LINK_MODE != "copy"
+            if first_copy:
+                print(f"警告: {LINK_MODE} を作れないためコピーしました（重複排除されず容量を消費します）: {save_path}")
+            return mode
+        except OSError:
+            continue
+    raise OSError(f"リンク作成に失敗しました: {save_path}")
+
+
+def fetch(url: str, headers=None, timeout: int = 30) -> Tuple[str, str]:
+    """URLを取得してストアに格納し (sha256, "新規"/"重複") を返す。
+
+    URLが既知ならネットワークに出ない。内容が既存ブロブと同じなら保存しない。
+    失敗時は例外を送出する。
+    """
+    with _url_lock(url):
+        sha = lookup_url(url)
+        if sha:
+            return sha, "重複"
+
+        os.makedirs(BLOB_DIR, exist_ok=True)
+        h = hashlib.sha256()
+        size = 0
+        fd, tmp = tempfile.mkstemp(dir=BLOB_DIR, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f, \
+                    requests.get(url, timeout=timeout, headers=headers, stream=True) as response:
+                if response.status_code != 200:
+                    raise IOError(f"ステータス {response.status_code}")
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    h.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+            if size == 0:
+                raise IOError("空ファイル")
+            sha = h.hexdigest()
+            dest = blob_path(sha)
+            status = "重複"
+            if not os.path.exists(dest):
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                os.replace(tmp, dest)
+                status = "新規"
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        _record_url(url, sha, size)
+        return sha, status
+
+
+def download_to(url: str, save_path: str, headers=None, timeout: int = 30) -> str:
+    """download_file 互換: ストア経由で取得し save_path にリンクする。結果メッセージを返す。"""
+    try:
+        if not url or not str(url).startswith('http'):
+            return "失敗: URL不正"
+        sha, status = fetch(url, headers, timeout)
+        link_into(sha, save_path)
+        return "成功" if status == "新規" else "成功(重複)"
+    except Exception as e:
+        return f"失敗: {str(e)}"
+
+
+def link_counts() -> dict:
+    """このプロセスで作ったリンクの方式ごとの件数 {"hardlink": n, "symlink": n, "copy": n}。"""
+    with _lock:
+        return dict(_link_counts)
+
+
+def stats() -> Tuple[int, int]:
+    """(URL件数, ブロブ件数) を返す。"""
+    with _lock:
+        row = _index().execute("SELECT COUNT(*), COUNT(DISTINCT sha256) FROM blob_urls").fetchone()
+    return row[0], row[1]
+
+
+if __name__ == "__main__":
+    n_urls, n_blobs = stats()
+    print(f"URL件数: {n_urls} / 実体ファイル数: {n_blobs} / 重複で節約: {n_urls - n_blobs}件")
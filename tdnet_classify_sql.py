@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""tdnet_Qperiod の判定ロジックを DuckDB のマクロ/UDFとして登録する。
+
+登録後は SELECT classify(表題) FROM disclosure_info で DB 内で一括判定できる。
+NFKC 正規化だけは SQL で表現できないため Python UDF（pyarrow があればベクトル化）で行う。
+"""
+
+import sys
+import time
+import argparse
+from datetime import date
+
+import duckdb
+
+import tdnet_Qperiod as qp
+from tdnet_taxonomy import get_taxonomy
+
+# ================= config =================
+DB_PATH = r"C:\Users\ensyu\Documents\Speculation\TDnet\TDnet適時情報開示サービス\tdnet.duckdb"
+# ==========================================
+
+# extract_quarter の規則（上から順に評価）
+SQL_QUARTER_Q = r'(?i)([1-4])\s*Q|Q\s*([1-4])'
+SQL_QUARTER_KANJI = r'第\s*([一二三四１２３４1-4])\s*四\s*半\s*期'
+SQL_QUARTER_HALF = r'上半期|上期|中間期|中間'
+
+
+def _lit(text: str) -> str:
+    return "'" + text.replace("'", "''") + "'"
+
+
+def _taxonomy_conditions():
+    """タクソノミーの各カテゴリを (名前, SQL条件) に変換する（優先度順）。"""
+    conds = []
+    for c in get_taxonomy().ranked():
+        cond = "(" + " OR ".join(f"contains(l, {_lit(k)})" for k in c["keywords"]) + ")"
+        if c["exclude"]:
+            cond += " AND NOT (" + " OR ".join(f"contains(l, {_lit(k)})" for k in c["exclude"]) + ")"
+        conds.append((c["name"], cond))
+    return conds
+
+
+def build_macro_sql() -> str:
+    era_cases = " ".join(f"WHEN {_lit(era)} THEN {year}" for era, year in qp.ERA_TO_YEAR.items())
+    western = _lit(qp.RE_PERIOD_WESTERN.pattern)
+    era = _lit(qp.RE_PERIOD_ERA.pattern)
+    conds = _taxonomy_conditions()
+    # 種別は従来の5区分（qp.REPORT_TYPE_KEYWORDS）のみ。タクソノミーはカテゴリ側で使う
+    rtype_cases = "\n            ".join(f"WHEN contains(n, {_lit(kw)}) THEN {_lit(kw)}" for kw in qp.REPORT_TYPE_KEYWORDS)
+    category_items = ",\n            ".join(f"CASE WHEN {cond} THEN {_lit(name)} END" for name, cond in conds)
+    return f"""
+    CREATE OR REPLACE TEMP MACRO tdnet_era_to_year(era_name, era_year) AS
+        (CASE era_name {era_cases} END)
+        + (CASE WHEN era_year = '元' THEN 1 ELSE CAST(era_year AS INTEGER) END);
+
+    CREATE OR REPLACE TEMP MACRO tdnet_period_end(n) AS
+        CASE
+            WHEN regexp_matches(n, {western}) THEN last_day(make_date(
+                CAST(regexp_extract(n, {western}, 1) AS INTEGER),
+                CAST(regexp_extract(n, {western}, 2) AS INTEGER), 1))
+            WHEN regexp_matches(n, {era}) THEN last_day(make_date(
+                tdnet_era_to_year(regexp_extract(n, {era}, 1), regexp_extract(n, {era}, 2)),
+                CAST(regexp_extract(n, {era}, 3) AS INTEGER), 1))
+        END;
+
+    CREATE OR REPLACE TEMP MACRO tdnet_quarter(n) AS
+        CASE
+            WHEN regexp_matches(n, {_lit(SQL_QUARTER_Q)}) THEN coalesce(
+                nullif(regexp_extract(n, {_lit(SQL_QUARTER_Q)}, 1), ''),
+                regexp_extract(n, {_lit(SQL_QUARTER_Q)}, 2)) || 'Q'
+            WHEN regexp_matches(n, {_lit(SQL_QUARTER_KANJI)}) THEN
+                translate(regexp_extract(n, {_lit(SQL_QUARTER_KANJI)}, 1), '一二三四１２３４', '12341234') || 'Q'
+            WHEN regexp_matches(n, {_lit(SQL_QUARTER_HALF)}) THEN '2Q'
+            ELSE '4Q'
+        END;
+
+    CREATE OR REPLACE TEMP MACRO tdnet_report_type(n) AS
+        CASE
+            {rtype_cases}
+        END;
+
+    CREATE OR REPLACE TEMP MACRO tdnet_report_categories_lower(l) AS
+        list_filter([
+            {category_items}
+        ], x -> x IS NOT NULL);
+
+    CREATE OR REPLACE TEMP MACRO tdnet_report_categories(n) AS tdnet_report_categories_lower(lower(n));
+
+    CREATE OR REPLACE TEMP MACRO classify_normalized(n) AS struct_pack(
+        種別 := tdnet_report_type(n),
+        決算期末 := tdnet_period_end(n),
+        quarter := CASE WHEN tdnet_period_end(n) IS NOT NULL THEN tdnet_quarter(n) END
+    );
+
+    CREATE OR REPLACE TEMP MACRO classify(t) AS classify_normalized(tdnet_normalize(t));
+    """
+
+
+def _register_normalize(con: duckdb.DuckDBPyConnection):
+    # 同じ接続で2回 register しても良いように、登録済みなら外してから登録し直す
+    try:
+        con.remove_function("tdnet_normalize")
+    except duckdb.InvalidInputException:
+        pass
+    try:
+        import pyarrow as pa
+        def normalize_batch(col):
+            return pa.array([qp.normalize_fast(t) if t else t for t in col.to_pylist()], type=pa.string())
+        con.create_function("tdnet_normalize", normalize_batch, ["VARCHAR"], "VARCHAR",
+                            type="arrow", side_effects=False)
+    except ImportError:
+        con.create_function("tdnet_normalize", lambda t: qp.normalize_fast(t) if t else t,
+                            ["VARCHAR"], "VARCHAR", side_effects=False)
+
+
+def register(con: duckdb.DuckDBPyConnection):
+    """接続に tdnet_normalize UDF と classify 系マクロを登録する。"""
+    _register_normalize(con)
+    con.execute(build_macro_sql())
+
+
+def reclassify_all(con: duckdb.DuckDBPyConnection) -> int:
+    """disclosure_info 全件をDB内で判定し disclosure_class を置き換える。件数を返す。"""
+    import tdnet_worklist
+    tdnet_worklist.ensure_schema(con)
+    register(con)
+    con.execute("BEGIN TRANSACTION")
+    try:
+        con.execute("""
+            INSERT OR REPLACE INTO disclosure_class (連番, 種別, 決算月, quarter, classified_at, カテゴリ)
+            SELECT 連番, c.種別, c.決算期末, c.quarter, now(), nullif(array_to_string(cats, ','), '')
+            FROM (
+                SELECT 連番, classify_normalized(n) AS c, tdnet_report_categories(n) AS cats
+                FROM (SELECT 連番, tdnet_normalize(表題) AS n FROM disclosure_info)
+            )
+        """)
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    return con.execute("SELECT COUNT(*) FROM disclosure_class").fetchone()[0]
+
+
+def check_parity(con: duckdb.DuckDBPyConnection, titles) -> list:
+    """SQL 版と Python 版（classify_titles）の結果を比べ、不一致のリストを返す。"""
+    register(con)
+    # 1つのLISTパラメータとして渡して展開する（executemany より大幅に速い）
+    con.execute("""
+        CREATE OR REPLACE TEMP TABLE parity_titles AS
+        SELECT generate_subscripts(x, 1) - 1 AS i, unnest(x) AS t FROM (SELECT ?::VARCHAR[] AS x)
+    """, [list(titles)])
+    rows = con.execute("""
+        SELECT i, c.種別, c.決算期末, c.quarter FROM (SELECT i, classify(t) AS c FROM parity_titles) ORDER BY i
+    """).fetchall()
+    expected = qp.classify_titles(titles)
+    mismatches = []
+    for (i, rtype, period, q), (e_rtype, e_period, e_q) in zip(rows, expected):
+        got = (rtype or "", period, q or "")
+        want = (e_rtype or "", date(*e_period) if e_period else None, e_q or "")
+        if got != want:
+            mismatches.append((titles[i], want, got))
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DuckDB 内での表題判定")
+    parser.add_argument("command", choices=["check", "reclassify"],
+                        help="check: Python版との一致確認 / reclassify: disclosure_info 全件を再判定")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--file", help="check 用の表題コーパス（1行1表題, UTF-8）")
+    args = parser.parse_args()
+
+    start = time.time()
+    if args.command == "reclassify":
+        con = duckdb.connect(args.db)
+        try:
+            n = reclassify_all(con)
+        finally:
+            con.close()
+        print(f"再判定完了: {n}件 ({time.time() - start:.2f}秒)")
+        return
+
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            titles = [line.rstrip("\n") for line in f]
+        con = duckdb.connect()
+    else:
+        con = duckdb.connect(args.db, read_only=True)
+        titles = [r[0] for r in con.execute("SELECT 表題 FROM disclosure_info ORDER BY 連番").fetchall()]
+    try:
+        mismatches = check_parity(con, titles)
+    finally:
+        con.close()
+    print(f"対象: {len(titles)}件 ({time.time() - start:.2f}秒)")
+    if mismatches:
+        print(f"❌ 不一致: {len(mismatches)}件")
+        for t, want, got in mismatches[:10]:
+            print(f"  {t!r}: Python={want} SQL={got}")
+        sys.exit(1)
+    print("✅ SQL版とPython版の結果が一致しました。")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""適時開示イベントスタディ（disclosure_info × 日別株価）。
+
+開示ごとに「最初に反応できる取引日」(t0) を ASOF 結合で決め、t0 からの相対営業日の窓で
+異常リターン（市場平均を差し引いたリターン）の累積 CAR を DuckDB 内で一括計算する。
+引け後（取引終了時刻以降）の開示は翌取引日を t0 とする。
+"""
+
+import time
+import argparse
+from datetime import date, timedelta
+from typing import List, Optional, Sequence, Tuple
+
+import duckdb
+
+import stock_prices
+
+# ================= config =================
+DB_PATH = r"C:\Users\ensyu\Documents\Speculation\TDnet\TDnet適時情報開示サービス\tdnet.duckdb"
+# test.py が作る株価データセット（year=/month= の Hive パーティション）
+PRICE_DATASET = stock_prices.DATASET_DIR
+# 取引終了時刻。この時刻以降の開示は翌取引日に反映されるとみなす（東証は 2024/11/5 から 15:30）
+CLOSE_TIME_DEFAULT = "15:00"
+CLOSE_TIME_CHANGES = [(date(2024, 11, 5), "15:30")]
+# 市場リターン: None = 全銘柄の等加重平均 / 銘柄コード（例 "1306" TOPIX連動ETF）
+MARKET_CODE = None
+# CAR を計算する窓（t0 からの相対営業日, 両端含む）
+WINDOWS = [(0, 0), (0, 1), (-1, 1), (0, 5), (0, 20)]
+# 窓の前後に余分に読む日数（営業日ではなく暦日）
+PRICE_MARGIN_DAYS = 60
+# ==========================================
+
+
+def window_name(a: int, b: int) -> str:
+    def part(x):
+        return f"m{-x}" if x < 0 else f"p{x}"
+    return f"car_{part(a)}_{part(b)}"
+
+
+def _close_time_sql(date_expr: str) -> str:
+    cases = " ".join(f"WHEN {date_expr} >= DATE '{d.isoformat()}' THEN TIME '{t}'"
+                     for d, t in sorted(CLOSE_TIME_CHANGES, reverse=True))
+    return f"(CASE {cases} ELSE TIME '{CLOSE_TIME_DEFAULT}' END)" if cases else f"TIME '{CLOSE_TIME_DEFAULT}'"
+
+
+def register(con: duckdb.DuckDBPyConnection):
+    # TDnet のコードは5桁（末尾0）、株価データは4桁のことがあるため4桁に揃える
+    con.execute("""
+        CREATE OR REPLACE TEMP MACRO tdnet_norm_code(c) AS
+            CASE WHEN length(CAST(c AS VARCHAR)) = 5 AND right(CAST(c AS VARCHAR), 1) = '0'
+                 THEN left(CAST(c AS VARCHAR), 4) ELSE CAST(c AS VARCHAR) END
+    """)
+
+
+def price_source_sql(start: date, end: date, dataset: str = PRICE_DATASET) -> str:
+    """期間にかかる year=/month= のファイルだけを読む式（stock_prices と同じ絞り込み）。"""
+    src = stock_prices.source_sql(start, end, dataset)
+    if src is None:
+        raise FileNotFoundError(f"株価データがありません: {dataset} ({start} - {end})")
+    return src
+
+
+def build_returns(con: duckdb.DuckDBPyConnection, start: date, end: date, dataset: str = PRICE_DATASET):
+    """期間の日次リターンと累積異常リターンを TEMP テーブル event_returns に作る。"""
+    lo = start - timedelta(days=PRICE_MARGIN_DAYS)
+    hi = end + timedelta(days=PRICE_MARGIN_DAYS)
+    # 期間の月のファイルだけを読み、日付でも絞る（Parquet の統計で行グループも飛ばせる）
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE event_px AS
+        SELECT tdnet_norm_code(コード) AS code, 日付 AS d, 終値 AS close
+        FROM {price_source_sql(lo, hi, dataset)}
+        WHERE 日付 BETWEEN DATE '{lo.isoformat()}' AND DATE '{hi.isoformat()}'
+          AND 終値 IS NOT NULL AND 終値 > 0
+    """)
+    if MARKET_CODE is None:
+        market_sql = "SELECT d, avg(r) AS rm FROM r GROUP BY d"
+    else:
+        market_sql = f"SELECT d, r AS rm FROM r WHERE code = tdnet_norm_code('{MARKET_CODE}')"
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE event_returns AS
+        WITH r AS (
+            SELECT code, d, close,
+                   row_number() OVER w AS idx,
+                   close / lag(close) OVER w - 1 AS r
+            FROM event_px
+            WINDOW w AS (PARTITION BY code ORDER BY d)
+        ), m AS ({market_sql})
+        SELECT r.code, r.d, r.idx, r.close, r.r, r.r - m.rm AS ar,
+               sum(coalesce(r.r - m.rm, 0)) OVER (PARTITION BY r.code ORDER BY r.idx) AS cum_ar
+        FROM r LEFT JOIN m USING (d)
+    """)
+
+
+def table_exists(con: duckdb.DuckDBPyConnection, name: str) -> bool:
+    return con.execute("SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = ?", [name]).fetchone()[0] > 0
+
+
+def build_events(con: duckdb.DuckDBPyConnection, start: date, end: date,
+                 report_types: Optional[Sequence[str]] = None):
+    """対象開示と t0（最初に反応できる取引日）を TEMP テーブル events に作る。
+
+    disclosure_class（tdnet_worklist の分類結果）がない DB では 種別/決算月/quarter を NULL にする。
+    """
+    ts = "coalesce(TRY_CAST(TRY_CAST(i.時刻 AS TIMESTAMP) AS TIME), TRY_CAST(i.時刻 AS TIME))"
+    pub = "CAST(i.公開日 AS DATE)"
+    where = ""
+    params = [start, end]
+    if table_exists(con, "disclosure_class"):
+        class_join = "LEFT JOIN disclosure_class c ON c.連番 = i.連番"
+    elif report_types:
+        raise ValueError("disclosure_class がないため種別で絞り込めません（tdnet_worklist で分類してから実行してください）")
+    else:
+        class_join = ("LEFT JOIN (SELECT NULL::BIGINT AS 連番, NULL::VARCHAR AS 種別, NULL::DATE AS 決算月, "
+                      "NULL::VARCHAR AS quarter) c ON FALSE")
+    if report_types:
+        where = "AND list_contains(?, c.種別)"
+        params.append(list(report_types))
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE events_src AS
+        SELECT i.連番, tdnet_norm_code(i.コード) AS code, {pub} AS 公開日, {ts} AS 時刻,
+               c.種別, c.決算月, c.quarter,
+               CASE WHEN {ts} >= {_close_time_sql(pub)} THEN {pub} + 1 ELSE {pub} END AS key_date
+        FROM disclosure_info i
+        {class_join}
+        WHERE {pub} BETWEEN ? AND ? {where}
+    """, params)
+    # 開示日（引け後は翌日）以降で最初の取引日を t0 とする
+    con.execute("""
+        CREATE OR REPLACE TEMP TABLE events AS
+        SELECT e.*, t.d AS event_date, t.idx AS t0
+        FROM events_src e
+        ASOF LEFT JOIN event_returns t ON e.code = t.code AND t.d >= e.key_date
+    """)
+
+
+def compute_car(con: duckdb.DuckDBPyConnection, windows: Sequence[Tuple[int, int]] = WINDOWS) -> duckdb.DuckDBPyRelation:
+    """events × 窓ごとの CAR（累積異常リターン）と期間リターンを TEMP テーブル event_car に作って返す。"""
+    cols, joins = [], []
+    for k, (a, b) in enumerate(windows):
+        name = window_name(a, b)
+        # CAR[a, b] = cum_ar(t0+b) - cum_ar(t0+a-1)
+        joins.append(f"LEFT JOIN event_returns s{k} ON s{k}.code = e.code AND s{k}.idx = e.t0 + ({a - 1})")
+        joins.append(f"LEFT JOIN event_returns f{k} ON f{k}.code = e.code AND f{k}.idx = e.t0 + ({b})")
+        cols.append(f"f{k}.cum_ar - s{k}.cum_ar AS {name}")
+        cols.append(f"f{k}.close / s{k}.close - 1 AS {name.replace('car_', 'ret_')}")
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE event_car AS
+        SELECT e.連番, e.code AS コード, e.公開日, e.時刻, e.種別, e.決算月, e.quarter, e.event_date,
+               {', '.join(cols)}
+        FROM events e
+        {' '.join(joins)}
+        ORDER BY e.連番
+    """)
+    return con.table("event_car")
+
+
+def run(con: duckdb.DuckDBPyConnection, start: date, end: date, report_types: Optional[Sequence[str]] = None,
+        windows: Sequence[Tuple[int, int]] = WINDOWS, dataset: str = PRICE_DATASET) -> duckdb.DuckDBPyRelation:
+    """イベントスタディを実行し、開示ごとの CAR のリレーションを返す。"""
+    register(con)
+    build_returns(con, start, end, dataset)
+    build_events(con, start, end, report_types)
+    return compute_car(con, windows)
+
+
+def summarize(con: duckdb.DuckDBPyConnection, windows: Sequence[Tuple[int, int]] = WINDOWS) -> List[tuple]:
+    """event_car から種別ごとの件数・平均CAR・t値を返す（先頭は列名）。"""
+    aggs = []
+    for a, b in windows:
+        n = window_name(a, b)
+        aggs.append(f"avg({n}) AS {n}")
+        aggs.append(f"avg({n}) / (stddev_samp({n}) / sqrt(count({n}))) AS t_{n}")
+    result = con.execute(f"""
+        SELECT coalesce(種別, '(未分類)') AS 種別, count(*) AS n, {', '.join(aggs)}
+        FROM event_car GROUP BY 1 ORDER BY n DESC
+    """)
+    return [tuple(d[0] for d in result.description)] + result.fetchall()
+
+
+def parse_windows(text: str) -> List[Tuple[int, int]]:
+    """"0:1,-1:1" を [(0, 1), (-1, 1)] にする。"""
+    return [tuple(int(x) for x in w.split(":")) for w in text.split(",") if w]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="適時開示イベントスタディ（CAR の一括計算）")
+    parser.add_argument("--start", required=True, help="開示日の開始 (YYYY-MM-DD)")
+    parser.add_argument("--end", required=True, help="開示日の終了 (YYYY-MM-DD)")
+    parser.add_argument("--types", help="対象の種別（カンマ区切り, 例: 決算短信,業績予想）")
+    parser.add_argument("--windows", help="窓（例: 0:1,-1:1,0:5）")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--prices", default=PRICE_DATASET, help="株価データセットのディレクトリ")
+    parser.add_argument("--out", help="結果の出力先（.csv / .parquet）")
+    args = parser.parse_args()
+
+    start, end = date.fromisoformat(args.start), date.fromisoformat(args.end)
+    types = [t for t in args.types.split(",") if t] if args.types else None
+    windows = parse_windows(args.windows) if args.windows else WINDOWS
+
+    start_time = time.time()
+    con = duckdb.connect(args.db, read_only=True)
+    try:
+        if types and not table_exists(con, "disclosure_class"):
+            parser.error("--types を使うには disclosure_class が必要です（tdnet_worklist で分類してから実行してください）")
+        event_car = run(con, start, end, types, windows, args.prices)
+        n_events = con.execute("SELECT count(*), count(event_date) FROM events").fetchone()
+        if args.out:
+            # パスは SQL に埋め込まずにリレーションから書き出す（' を含むパスでも壊れない）
+            if args.out.lower().endswith(".parquet"):
+                event_car.write_parquet(args.out)
+            else:
+                event_car.write_csv(args.out, header=True)
+        summary = summarize(con, windows)
+    finally:
+        con.close()
+
+    print(f"対象開示: {n_events[0]}件 (株価と対応付け {n_events[1]}件) 処理時間: {time.time() - start_time:.2f}秒")
+    header, rows = summary[0], summary[1:]
+    print("\t".join(header))
+    for row in rows:
+        print("\t".join(f"{v:.4f}" if isinstance(v, float) else str(v) for v in row))
+    if args.out:
+        print(f"出力: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
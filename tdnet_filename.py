@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""ダウンロード用ファイル名（連番+公開日+時刻+(種別)+決算月+4Q+コード+会社名+表題）の一括生成。
+
+disclosure_info と disclosure_class から行単位ではなくバッチでファイル名を作り、
+禁則文字の置換（tdnet_ngword.replace_forbidden, str.translate 1回）・パス長の制限・重複検出までを行う。
+"""
+
+import os
+import time
+import hashlib
+import argparse
+from datetime import datetime, date
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import duckdb
+
+from tdnet_ngword import replace_forbidden
+
+# ================= config =================
+BASE_DIR = r'\\LS720D7A9\TakashiBK\投資\TDNET\TDnet適時情報開示サービス'
+# 保存先フォルダ（パス長の計算に使う。長い方に合わせて切り詰める）
+TARGET_FOLDERS = (
+    os.path.join(BASE_DIR, "TDnet(決算短信)-PDF-随時追加分"),
+    os.path.join(BASE_DIR, "TDnet(決算短信)XBRL-随時追加分"),
+)
+EXTENSION_LENGTH = 4          # ".pdf" / ".zip"
+MAX_PATH_LENGTH = 259         # Windows の MAX_PATH(260) - 終端文字
+# シートの数式と同じ並び（区切りは "_"）。列見出し tdnet_worklist.HEADER_FILENAME の順。
+# シートから取り込んだ既存のファイル名と一致するかは --check で確認できる
+FILENAME_TEMPLATE = "{連番}_{公開日}_{時刻}_({種別})_{決算月}_{quarter}_{コード}_{会社名}_{表題}"
+DATE_FORMAT = "%Y%m%d"
+PERIOD_FORMAT = "%Y%m"
+# ==========================================
+
+
+def _utf16_len(text: str) -> int:
+    # Windows のパス長は UTF-16 の単位で数える
+    return len(text.encode("utf-16-le")) // 2
+
+
+def name_budget(folders: Sequence[str] = TARGET_FOLDERS, max_path: int = MAX_PATH_LENGTH) -> int:
+    """フォルダ + 区切り + 拡張子を除いた、ファイル名本体に使える長さ。"""
+    return max_path - max(_utf16_len(f) for f in folders) - 1 - EXTENSION_LENGTH
+
+
+def truncate(name: str, budget: int) -> Tuple[str, bool]:
+    """budget を超える名前を末尾（表題側）で切り詰め、元の名前のハッシュを付ける。"""
+    if _utf16_len(name) <= budget:
+        return name, False
+    suffix = "~" + hashlib.sha1(name.encode("utf-8")).hexdigest()[:6]
+    limit = budget - len(suffix)
+    out, used = [], 0
+    for ch in name:
+        w = 2 if ord(ch) > 0xFFFF else 1
+        if used + w > limit:
+            break
+        out.append(ch)
+        used += w
+    # Windows では末尾の空白・ピリオドが落とされるため除く
+    return "".join(out).rstrip(" .") + suffix, True
+
+
+def _fmt_date(v, fmt: str) -> str:
+    if v is None or v == "":
+        return ""
+    if isinstance(v, (datetime, date)):
+        return v.strftime(fmt)
+    try:
+        return datetime.strptime(str(v).split()[0].replace("/", "-"), "%Y-%m-%d").strftime(fmt)
+    except ValueError:
+        return str(v)
+
+
+def _fmt_time(v) -> str:
+    # 時刻は "15:30" / "2026-01-28 15:30:00" / datetime のいずれでも HHMM にする
+    if v is None or v == "":
+        return ""
+    if isinstance(v, datetime):
+        return v.strftime("%H%M")
+    text = str(v).split()[-1]
+    return "".join(text.split(":")[:2])
+
+
+def format_fields(rec: Dict) -> Dict[str, str]:
+    return {
+        "連番": str(rec["連番"]),
+        "公開日": _fmt_date(rec.get("公開日"), DATE_FORMAT),
+        "時刻": _fmt_time(rec.get("時刻")),
+        "種別": rec.get("種別") or "",
+        "決算月": _fmt_date(rec.get("決算月"), PERIOD_FORMAT),
+        "quarter": rec.get("quarter") or "",
+        "コード": str(rec.get("コード") or ""),
+        "会社名": (rec.get("会社名") or "").strip(),
+        "表題": (rec.get("表題") or "").strip(),
+    }
+
+
+def build_filenames(records: Sequence[Dict], existing: Optional[Dict[str, int]] = None,
+                    budget: Optional[int] = None) -> Tuple[List[Tuple], List[Tuple[int, int, str]]]:
+    """records からファイル名を一括生成する。
+
+    戻り値: (rows, collisions)
+      rows       = [(連番, ファイル名, 置換した文字 or None, 切り詰めたか), ...]
+      collisions = [(連番, 衝突相手の連番, 元の名前), ...]  衝突した側には "~連番" を付けて一意にする
+    existing は既存のファイル名（casefold 済み）-> 連番。Windows では大文字小文字を区別しないため casefold で比較する。
+    """
+    budget = name_budget() if budget is None else budget
+    seen = dict(existing or {})
+    rows, collisions = [], []
+    for rec in records:
+        seq = int(rec["連番"])
+        name, changed = replace_forbidden(FILENAME_TEMPLATE.format(**format_fields(rec)))
+        name, truncated = truncate(name, budget)
+        key = name.casefold()
+        owner = seen.get(key)
+        if owner is not None and owner != seq:
+            collisions.append((seq, owner, name))
+            tag = f"~{seq}"
+            name = truncate(name, budget - len(tag))[0] + tag
+            key = name.casefold()
+        seen[key] = seq
+        rows.append((seq, name, ",".join(changed) or None, truncated))
+    return rows, collisions
+
+
+# -----------------------------------------------------------------
+# DB との入出力
+# -----------------------------------------------------------------
+def fetch_sources(con: duckdb.DuckDBPyConnection, only_missing: bool = True,
+                  only_existing: bool = False) -> List[Dict]:
+    """ファイル名の材料（disclosure_info + 分類結果）を連番順に返す。分類済みの行のみ。
+
+    only_existing=True の場合はファイル名のある行だけを、既存のファイル名（ファイル名列）付きで返す。
+    """
+    where = "AND f.連番 IS NULL" if only_missing else "AND f.連番 IS NOT NULL" if only_existing else ""
+    result = con.execute(f"""
+        SELECT d.連番, d.公開日, d.時刻, c.種別, c.決算月, c.quarter, d.コード, d.会社名, d.表題, f.ファイル名
+        FROM disclosure_info d
+        JOIN disclosure_class c ON c.連番 = d.連番
+        LEFT JOIN disclosure_file f ON f.連番 = d.連番 AND f.ファイル名 IS NOT NULL
+        WHERE TRUE {where}
+        ORDER BY d.連番
+    """)
+    columns = [desc[0] for desc in result.description]
+    return [dict(zip(columns, row)) for row in result.fetchall()]
+
+
+def existing_names(con: duckdb.DuckDBPyConnection) -> Dict[str, int]:
+    return {name.casefold(): seq for seq, name in con.execute(
+        "SELECT 連番, ファイル名 FROM disclosure_file WHERE ファイル名 IS NOT NULL").fetchall()}
+
+
+def save_filenames(con: duckdb.DuckDBPyConnection, rows: List[Tuple]):
+    """生成したファイル名を disclosure_file に書き込む（DL状況は残す）。生成時に禁則文字は処理済み。"""
+    if not rows:
+        return
+    now = datetime.now()
+    con.execute("BEGIN TRANSACTION")
+    try:
+        con.executemany("""
+            INSERT INTO disclosure_file (連番, ファイル名, 禁則文字, sanitized_at, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (連番) DO UPDATE SET
+                ファイル名 = excluded.ファイル名, 禁則文字 = excluded.禁則文字,
+                sanitized_at = excluded.sanitized_at, updated_at = excluded.updated_at
+        """, [(seq, name, changed, now, now) for seq, name, changed, _ in rows])
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+
+
+def assign_filenames(con: duckdb.DuckDBPyConnection, only_missing: bool = True,
+                     folders: Sequence[str] = TARGET_FOLDERS) -> Tuple[int, int, int]:
+    """ファイル名未設定の行に名前を付けて保存する。(件数, 切り詰め件数, 衝突件数) を返す。"""
+    import tdnet_worklist
+    tdnet_worklist.ensure_schema(con)
+    records = fetch_sources(con, only_missing)
+    if not records:
+        return 0, 0, 0
+    existing = existing_names(con) if only_missing else {}
+    rows, collisions = build_filenames(records, existing, name_budget(folders))
+    save_filenames(con, rows)
+    for seq, owner, name in collisions[:10]:
+        print(f"  ファイル名の衝突: 連番{seq} と 連番{owner} ({name})")
+    return len(rows), sum(1 for r in rows if r[3]), len(collisions)
+
+
+def compare_with_existing(con: duckdb.DuckDBPyConnection,
+                          folders: Sequence[str] = TARGET_FOLDERS) -> Tuple[int, List[Tuple[int, str, str]]]:
+    """既存のファイル名（シートの数式で作られたもの）と、同じ行から作り直した名前を比べる。
+
+    戻り値: (比較件数, [(連番, 既存の名前, 生成した名前), ...])  DBには書き込まない。
+    """
+    import tdnet_worklist
+    tdnet_worklist.ensure_schema(con)
+    records = fetch_sources(con, only_missing=False, only_existing=True)
+    rows, _ = build_filenames(records, {}, name_budget(folders))
+    mismatches = [(seq, rec["ファイル名"], name)
+                  for rec, (seq, name, _, _) in zip(records, rows) if name != rec["ファイル名"]]
+    return len(records), mismatches
+
+
+def main():
+    import tdnet_worklist
+    parser = argparse.ArgumentParser(description="ダウンロード用ファイル名の一括生成")
+    parser.add_argument("--all", action="store_true", help="既存のファイル名も作り直す")
+    parser.add_argument("--check", action="store_true",
+                        help="書き込まずに、既存のファイル名とテンプレートで作った名前が一致するか確認する")
+    parser.add_argument("--db", default=tdnet_worklist.DB_PATH)
+    args = parser.parse_args()
+
+    start_time = time.time()
+    if args.check:
+        con = tdnet_worklist.connect(args.db)
+        try:
+            n, mismatches = compare_with_existing(con)
+        finally:
+            con.close()
+        print(f"比較: {n}件 不一致: {len(mismatches)}件")
+        for seq, old, new in mismatches[:10]:
+            print(f"  連番{seq}\n    既存: {old}\n    生成: {new}")
+        return
+    con = tdnet_worklist.connect(args.db)
+    try:
+        n, n_trunc, n_coll = assign_filenames(con, only_missing=not args.all)
+    finally:
+        con.close()
+    print(f"ファイル名生成: {n}件 (切り詰め {n_trunc}件 / 衝突 {n_coll}件) 処理時間: {time.time() - start_time:.2f}秒")
+
+
+if __name__ == "__main__":
+    main()
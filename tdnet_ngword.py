@@ -1,28 +1,77 @@
-import win32com.client
 import os
-import pythoncom
 
 # ================= config =================
 # ファイルの場所（ネットワークパス）
 EXCEL_FILE = r'\\LS720D7A9\TakashiBK\投資\TDNET\TDnet適時情報開示サービス\TDnet適時開示情報.xlsm'
 SHEET_NAME = '適時開示情報'
-START_ROW = 41650  # 処理を開始する行
+START_ROW = 41650  # 初回に処理を開始する行（以降は tdnet_watermark の記録で対象を決める）
+FIRST_DATA_ROW = 2
+WATERMARK_STAGE = "ngword:excel"
 COL_M = 13  # 対象列 (M列)
 COL_P = 16  # 記録列 (P列)
+# 処理元: "duckdb" = tdnet.duckdb の未チェック行 / "excel" = シートのSTART_ROW以降
+SOURCE = "duckdb"
 
 # Excelの定数定義
 xlUp = -4162 
 # ==========================================
 
+# 禁則文字の定義
+FORBIDDEN_MAPPING = {
+    "/": "／", "\\": "￥", ":": "：", "*": "＊", 
+    "?": "？", '"': "＂", "<": "＜", ">": "＞", "|": "｜"
+}
+
+FORBIDDEN_TABLE = str.maketrans(FORBIDDEN_MAPPING)
+
+def replace_forbidden(original_text, mapping=FORBIDDEN_MAPPING):
+    """禁則文字を全角に置換し、(変換後文字列, 置換した文字のリスト) を返す。"""
+    # 置換は translate の1回で行い、置換があった場合だけ該当文字を調べる
+    table = FORBIDDEN_TABLE if mapping is FORBIDDEN_MAPPING else str.maketrans(mapping)
+    replaced_text = original_text.translate(table)
+    if replaced_text == original_text:
+        return original_text, []
+    return replaced_text, [half for half in mapping if half in original_text]
+
+def convert_forbidden_chars_duckdb():
+    """tdnet.duckdb の未チェックのファイル名だけを変換する。"""
+    import tdnet_worklist
+    print(f"処理を開始します: {os.path.basename(tdnet_worklist.DB_PATH)}")
+
+    con = tdnet_worklist.connect()
+    try:
+        targets = tdnet_worklist.fetch_unsanitized(con)
+        if not targets:
+            print("処理対象の行が見つかりませんでした。")
+            return
+
+        rows = []
+        change_count = 0
+        for seq, original_text in targets:
+            replaced_text, changed_chars = replace_forbidden(original_text)
+            if changed_chars:
+                change_count += 1
+            rows.append((seq, replaced_text, ",".join(changed_chars) or None))
+        tdnet_worklist.save_sanitized(con, rows)
+
+        print("-" * 30)
+        print(f"完了しました。")
+        print(f"対象行数: {len(targets)} 行")
+        print(f"修正行数: {change_count} 行")
+        print("-" * 30)
+    except Exception as e:
+        print(f"エラーが発生しました: {e}")
+    finally:
+        con.close()
+
 def convert_forbidden_chars():
     print(f"処理を開始します: {os.path.basename(EXCEL_FILE)}")
     
-    # 禁則文字の定義
-    mapping = {
-        "/": "／", "\\": "￥", ":": "：", "*": "＊", 
-        "?": "？", '"': "＂", "<": "＜", ">": "＞", "|": "｜"
-    }
+    mapping = FORBIDDEN_MAPPING
     
+    import win32com.client
+    import pythoncom
+
     # COMの初期化（ネットワーク越しやスレッド処理での安定化のため）
     pythoncom.CoInitialize()
     
@@ -51,43 +100,58 @@ def convert_forbidden_chars():
             print(f"処理対象の行が見つかりませんでした。 (最終行: {last_row})")
             return
 
-        print(f"最終行: {last_row} (処理範囲: {START_ROW}行目 〜)")
-
-        # データの読み込み
-        m_range = ws.Range(ws.Cells(START_ROW, COL_M), ws.Cells(last_row, COL_M))
-        m_values = m_range.Value
+        # データの読み込み（M列・P列を一括取得し、前回から変化したブロックと新規行だけを処理）
+        import tdnet_watermark as wm
+        from tdnet_worklist import connect
+        def read_col(col):
+            return [v[0] for v in ws.Range(ws.Cells(FIRST_DATA_ROW, col), ws.Cells(last_row, col)).Value]
+        m_all, p_all = read_col(COL_M), read_col(COL_P)
+        def fp_rows():
+            return [(wm.normalize_cell(m), wm.normalize_cell(p)) for m, p in zip(m_all, p_all)]
 
-        new_m_values = []
-        p_values = []
-        change_count = 0
-
-        # メモリ上での変換処理
-        for i, val in enumerate(m_values):
-            # valはタプル(値,)なので[0]を取り出す
-            original_text = str(val[0]) if val[0] is not None else ""
-            replaced_text = original_text
-            changed_chars = []
-
-            for half, full in mapping.items():
-                if half in replaced_text:
-                    replaced_text = replaced_text.replace(half, full)
-                    changed_chars.append(half)
-
-            if replaced_text != original_text:
-                new_m_values.append([replaced_text])
-                p_values.append([",".join(changed_chars)])
-                change_count += 1
-            else:
-                new_m_values.append([original_text])
-                p_values.append([None])
-
-            if (i + 1) % 1000 == 0:
-                print(f"  進捗: {START_ROW + i} / {last_row} 行目処理中...")
-
-        # Excelへの書き戻し
-        if new_m_values:
-            ws.Range(ws.Cells(START_ROW, COL_M), ws.Cells(last_row, COL_M)).Value = new_m_values
-            ws.Range(ws.Cells(START_ROW, COL_P), ws.Cells(last_row, COL_P)).Value = p_values
+        con = connect()
+        try:
+            last_key = wm.get_last_key(con, WATERMARK_STAGE)
+            ranges = wm.pending_ranges(con, WATERMARK_STAGE,
+                                       wm.block_fingerprints(fp_rows(), FIRST_DATA_ROW, last_key),
+                                       last_row, START_ROW)
+            if not ranges:
+                print(f"処理対象の行が見つかりませんでした。 (最終行: {last_row})")
+                return
+            print(f"最終行: {last_row} (処理範囲: {', '.join(f'{a}-{b}' for a, b in ranges)}行目)")
+
+            change_count = 0
+            for range_start, range_end in ranges:
+                new_m_values = []
+                p_values = []
+
+                # メモリ上での変換処理
+                for r in range(range_start, range_end + 1):
+                    i = r - FIRST_DATA_ROW
+                    original_text = str(m_all[i]) if m_all[i] is not None else ""
+                    replaced_text, changed_chars = replace_forbidden(original_text, mapping)
+
+                    if replaced_text != original_text:
+                        new_m_values.append([replaced_text])
+                        p_values.append([",".join(changed_chars)])
+                        change_count += 1
+                    else:
+                        # 再処理されたブロック内の変換済み行は、前回の記録（P列）を残す
+                        new_m_values.append([original_text])
+                        p_values.append([p_all[i]])
+                    m_all[i], p_all[i] = new_m_values[-1][0], p_values[-1][0]
+
+                    if (r - range_start + 1) % 1000 == 0:
+                        print(f"  進捗: {r} / {last_row} 行目処理中...")
+
+                # Excelへの書き戻し
+                if new_m_values:
+                    ws.Range(ws.Cells(range_start, COL_M), ws.Cells(range_end, COL_M)).Value = new_m_values
+                    ws.Range(ws.Cells(range_start, COL_P), ws.Cells(range_end, COL_P)).Value = p_values
+
+            wm.commit(con, WATERMARK_STAGE, last_row, wm.block_fingerprints(fp_rows(), FIRST_DATA_ROW, last_row))
+        finally:
+            con.close()
 
         wb.Save()
         print("-" * 30)
@@ -103,4 +167,7 @@ def convert_forbidden_chars():
         pythoncom.CoUninitialize()
 
 if __name__ == "__main__":
-    convert_forbidden_chars()
\ No newline at end of file
+    if SOURCE == "duckdb":
+        convert_forbidden_chars_duckdb()
+    else:
+        convert_forbidden_chars()
\ No newline at end of file
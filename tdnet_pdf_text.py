@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""PDF_FOLDER の決算短信PDFからテキストを抽出し、圧縮保存と全文検索インデックスを作る。"""
+
+import os
+import re
+import time
+import zlib
+import queue
+import sqlite3
+import hashlib
+import argparse
+import multiprocessing as mp
+from io import BytesIO
+from datetime import datetime
+from typing import List, Dict, Optional, Tuple
+
+import duckdb
+
+from fts_tokenize import tokenize, build_match_query
+
+# ================= config =================
+DB_PATH = r"C:\Users\ensyu\Documents\Speculation\TDnet\TDnet適時情報開示サービス\tdnet.duckdb"
+# 全文検索インデックス（SQLite FTS5。拡張機能のダウンロード不要）
+INDEX_PATH = os.path.join(os.path.dirname(DB_PATH), "tdnet_pdf_fts.sqlite")
+BASE_DIR = r'\\LS720D7A9\TakashiBK\投資\TDNET\TDnet適時情報開示サービス'
+PDF_FOLDER = os.path.join(BASE_DIR, "TDnet(決算短信)-PDF-随時追加分")
+MAX_WORKERS = os.cpu_count() or 4
+TIMEOUT_SEC = 60         # 1ファイルあたりの上限時間
+INSERT_BATCH = 200       # 何ファイル分の結果ごとにDBへ書き込むか
+# 失敗したPDF（タイムアウト・強制終了・異常終了・読めない）の扱い。
+# False: サイズ・更新時刻が変わるまで再処理しない / True: 毎回やり直す
+RETRY_FAILED = False
+# ==========================================
+
+TEXT_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS pdf_text (
+    sha256 VARCHAR PRIMARY KEY,
+    pages INTEGER,
+    chars INTEGER,
+    text_zlib BLOB,
+    extracted_at TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS pdf_files (
+    file_name VARCHAR PRIMARY KEY,
+    連番 BIGINT,
+    size BIGINT,
+    mtime DOUBLE,
+    sha256 VARCHAR,
+    status VARCHAR,
+    updated_at TIMESTAMP
+);
+"""
+
+RE_SEQ = re.compile(r'^(\d+)')
+
+
+# -----------------------------------------------------------------
+# 抽出（ワーカープロセス）
+# -----------------------------------------------------------------
+def _extract_text(data: bytes, deadline: float) -> Tuple[str, int]:
+    """PDFバイト列からテキストを取り出す。ページ間で期限を確認する。"""
+    try:
+        import fitz  # PyMuPDF（高速）
+        texts = []
+        with fitz.open(stream=data, filetype="pdf") as doc:
+            for page in doc:
+                if time.time() > deadline:
+                    raise TimeoutError("タイムアウト")
+                texts.append(page.get_text())
+            return "\n".join(texts), len(texts)
+    except ImportError:
+        pass
+    from pypdf import PdfReader
+    reader = PdfReader(BytesIO(data))
+    texts = []
+    for page in reader.pages:
+        if time.time() > deadline:
+            raise TimeoutError("タイムアウト")
+        texts.append(page.extract_text() or "")
+    return "\n".join(texts), len(texts)
+
+
+def _new_result(path: str, status: str = "成功") -> Dict:
+    name = os.path.basename(path)
+    m = RE_SEQ.match(name)
+    return {"file_name": name, "連番": int(m.group(1)) if m else None, "sha256": None,
+            "text": None, "pages": 0, "status": status, "size": None, "mtime": None}
+
+
+def _stat_into(res: Dict, path: str):
+    st = os.stat(path)
+    res["size"], res["mtime"] = st.st_size, st.st_mtime
+
+
+def failed_result(path: str, status: str) -> Dict:
+    """ワーカーが結果を返せなかったファイルの記録。サイズ・更新時刻も残し、変わるまで再処理しない。"""
+    res = _new_result(path, status)
+    try:
+        _stat_into(res, path)
+    except OSError:
+        pass
+    return res
+
+
+def extract_pdf(path: str, known_hashes: set, timeout: float = TIMEOUT_SEC) -> Dict:
+    res = _new_result(path)
+    try:
+        _stat_into(res, path)
+        with open(path, "rb") as f:
+            data = f.read()
+        res["sha256"] = hashlib.sha256(data).hexdigest()
+        if res["sha256"] in known_hashes:
+            res["status"] = "既存"
+            return res
+        text, pages = _extract_text(data, time.time() + timeout)
+        res["text"], res["pages"] = text, pages
+    except TimeoutError:
+        res["status"] = "失敗: タイムアウト"
+    except Exception as e:
+        res["status"] = f"失敗: {e}"
+    return res
+
+
+def _worker_loop(wid, task_q, result_q, known_hashes, timeout):
+    while True:
+        path = task_q.get()
+        if path is None:
+            break
+        result_q.put(("start", wid, path))
+        result_q.put(("done", wid, (path, extract_pdf(path, known_hashes, timeout))))
+
+
+def extract_parallel(paths: List[str], known_hashes: set, max_workers: int = MAX_WORKERS,
+                     timeout: float = TIMEOUT_SEC, on_batch=None) -> int:
+    """プロセスプールで抽出する。期限を超えたワーカーは強制終了して補充する。
+
+    on_batch(results) が INSERT_BATCH 件ごとに呼ばれる。処理件数を返す。
+    """
+    ctx = mp.get_context("spawn")
+    task_q, result_q = ctx.Queue(), ctx.Queue()
+    for p in paths:
+        task_q.put(p)
+    n_workers = max(1, min(max_workers, len(paths)))
+    for _ in range(n_workers):
+        task_q.put(None)
+
+    workers, current = {}, {}
+    next_wid = 0
+    def spawn():
+        nonlocal next_wid
+        proc = ctx.Process(target=_worker_loop, args=(next_wid, task_q, result_q, known_hashes, timeout), daemon=True)
+        proc.start()
+        workers[next_wid] = proc
+        next_wid += 1
+    for _ in range(n_workers):
+        spawn()
+
+    batch, done = [], set()
+    def finish(path, res):
+        # 同じファイルの結果が2回来ても（強制終了の直前に done が届いた等）1回だけ数える
+        nonlocal batch
+        if path in done:
+            return
+        done.add(path)
+        batch.append(res)
+        if len(batch) >= INSERT_BATCH and on_batch:
+            on_batch(batch)
+            batch = []
+        if len(done) % 100 == 0 or len(done) == len(paths):
+            print(f"  進捗: {len(done)}/{len(paths)} 件完了...", end="\r")
+
+    def handle(msg):
+        kind, wid, payload = msg
+        if kind == "start":
+            if wid in workers:
+                current[wid] = (payload, time.time())
+            else:
+                # 既に落ちたとみなして入れ替えたワーカーの遅れて届いた start
+                finish(payload, failed_result(payload, "失敗: ワーカー異常終了"))
+        else:
+            path, res = payload
+            if wid in current and current[wid][0] == path:
+                current.pop(wid)
+            finish(path, res)
+
+    last_message = time.time()
+    def drain(wait):
+        # 終了コードを見る前にキューを空にする（落ちる直前に送られた start / done を取りこぼさない）
+        nonlocal last_message
+        try:
+            handle(result_q.get(timeout=wait))
+            last_message = time.time()
+            while True:
+                handle(result_q.get_nowait())
+        except queue.Empty:
+            pass
+
+    # ページ間チェックで止まらないファイル用の強制終了猶予
+    hard_limit = timeout * 1.5 + 5
+    crash_count = 0
+    try:
+        while len(done) < len(paths):
+            drain(1)
+            now = time.time()
+            for wid, proc in list(workers.items()):
+                crashed = proc.exitcode not in (None, 0)
+                if wid in current:
+                    path, started = current[wid]
+                    if now - started <= hard_limit and not crashed:
+                        continue
+                    proc.terminate()
+                    current.pop(wid)
+                    status = "失敗: タイムアウト(強制終了)" if not crashed else f"失敗: ワーカー異常終了({proc.exitcode})"
+                    finish(path, failed_result(path, status))
+                elif crashed:
+                    # タスク受け取り前に落ちた（起動失敗など）
+                    crash_count += 1
+                    if crash_count > n_workers * 2:
+                        raise RuntimeError("ワーカープロセスの起動に繰り返し失敗しました")
+                else:
+                    continue
+                workers.pop(wid)
+                spawn()
+            idle = not current and now - last_message > hard_limit
+            if idle or all(proc.exitcode == 0 for proc in workers.values()):
+                # 結果のないファイル（start を送る前に落ちたワーカーの分）を失敗として閉じる。
+                # 処理中のファイルがないまま hard_limit 何も届かないときも同様（落ちたワーカーがキューのロックを持ったまま等）
+                drain(1)
+                for path in paths:
+                    finish(path, failed_result(path, "失敗: ワーカー異常終了(結果なし)"))
+    finally:
+        for proc in workers.values():
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
+    if batch and on_batch:
+        on_batch(batch)
+    return len(done)
+
+
+# -----------------------------------------------------------------
+# 保存・インデックス
+# -----------------------------------------------------------------
+def ensure_schema(con: duckdb.DuckDBPyConnection):
+    con.execute(TEXT_SCHEMA_SQL)
+
+
+def open_index(index_path: str = INDEX_PATH) -> sqlite3.Connection:
+    idx = sqlite3.connect(index_path)
+    idx.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS pdf_fts USING fts5(tokens, content='', tokenize='unicode61')
+    """)
+    idx.execute("CREATE TABLE IF NOT EXISTS pdf_fts_map (rowid INTEGER PRIMARY KEY, sha256 TEXT UNIQUE)")
+    return idx
+
+
+def find_new_pdfs(con: duckdb.DuckDBPyConnection, folder: str = PDF_FOLDER,
+                  retry_failed: bool = RETRY_FAILED) -> List[str]:
+    """未処理、またはサイズ・更新時刻が変わったPDFだけを返す。retry_failed なら失敗したものも返す。"""
+    done = {r[0]: (r[1], r[2]) for r in con.execute(
+        "SELECT file_name, size, mtime FROM pdf_files WHERE NOT ? OR status NOT LIKE '失敗%'", [retry_failed]).fetchall()}
+    targets = []
+    with os.scandir(folder) as it:
+        for entry in it:
+            if not entry.is_file() or not entry.name.lower().endswith(".pdf"):
+                continue
+            st = entry.stat()
+            prev = done.get(entry.name)
+            if prev is None or prev[0] != st.st_size or prev[1] != st.st_mtime:
+                targets.append(entry.path)
+    return sorted(targets)
+
+
+def save_results(con: duckdb.DuckDBPyConnection, idx: sqlite3.Connection, results: List[Dict]):
+    now = datetime.now()
+    text_rows, seen = [], set()
+    for r in results:
+        if r["text"] is not None and r["sha256"] not in seen:
+            seen.add(r["sha256"])
+            text_rows.append((r["sha256"], r["pages"], len(r["text"]),
+                              zlib.compress(r["text"].encode("utf-8"), 6), now))
+    con.execute("BEGIN TRANSACTION")
+    try:
+        if text_rows:
+            con.executemany("INSERT OR IGNORE INTO pdf_text VALUES (?, ?, ?, ?, ?)", text_rows)
+        con.executemany("INSERT OR REPLACE INTO pdf_files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        [(r["file_name"], r["連番"], r.get("size"), r.get("mtime"), r["sha256"], r["status"], now)
+                         for r in results])
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+
+    with idx:
+        for r in results:
+            if r["text"] is None:
+                continue
+            cur = idx.execute("INSERT OR IGNORE INTO pdf_fts_map (sha256) VALUES (?)", (r["sha256"],))
+            if cur.rowcount:
+                idx.execute("INSERT INTO pdf_fts (rowid, tokens) VALUES (?, ?)",
+                            (cur.lastrowid, " ".join(tokenize(r["text"]))))
+
+
+def load_text(con: duckdb.DuckDBPyConnection, sha256: str) -> Optional[str]:
+    row = con.execute("SELECT text_zlib FROM pdf_text WHERE sha256 = ?", [sha256]).fetchone()
+    return zlib.decompress(row[0]).decode("utf-8") if row else None
+
+
+def _snippet(text: str, query: str, width: int = 40) -> str:
+    for w in query.split():
+        pos = text.find(w)
+        if pos >= 0:
+            s = max(0, pos - width)
+            return text[s:pos + len(w) + width].replace("\n", " ")
+    return text[:width * 2].replace("\n", " ")
+
+
+def search(query: str, limit: int = 20, db_path: str = DB_PATH, index_path: str = INDEX_PATH) -> List[Dict]:
+    """全文検索し、開示行（連番・会社名・表題）とスニペットを返す。"""
+    match = build_match_query(query)
+    if not match:
+        return []
+    idx = open_index(index_path)
+    try:
+        hits = idx.execute("""
+            SELECT m.sha256, bm25(pdf_fts) AS score
+            FROM pdf_fts JOIN pdf_fts_map m ON m.rowid = pdf_fts.rowid
+            WHERE pdf_fts MATCH ? ORDER BY score LIMIT ?
+        """, (match, limit)).fetchall()
+    finally:
+        idx.close()
+
+    con = duckdb.connect(db_path, read_only=True)
+    try:
+        results = []
+        for sha, score in hits:
+            rows = con.execute("""
+                SELECT f.連番, f.file_name, d.コード, d.会社名, d.表題
+                FROM pdf_files f LEFT JOIN disclosure_info d ON d.連番 = f.連番
+                WHERE f.sha256 = ? ORDER BY f.連番
+            """, [sha]).fetchall()
+            text = load_text(con, sha) or ""
+            for seq, fname, code, company, title in rows:
+                results.append({"連番": seq, "file_name": fname, "コード": code, "会社名": company,
+                                "表題": title, "score": score, "snippet": _snippet(text, query)})
+        return results
+    finally:
+        con.close()
+
+
+def run(db_path: str = DB_PATH, folder: str = PDF_FOLDER, max_workers: int = MAX_WORKERS,
+        retry_failed: bool = RETRY_FAILED):
+    start_time = time.time()
+    print(f"--- PDFテキスト抽出開始 [{datetime.now().strftime('%H:%M:%S')}] ---")
+
+    con = duckdb.connect(db_path)
+    idx = open_index()
+    try:
+        ensure_schema(con)
+        targets = find_new_pdfs(con, folder, retry_failed)
+        if not targets:
+            print("処理対象の新規PDFはありません。")
+            return
+        known = {r[0] for r in con.execute("SELECT sha256 FROM pdf_text").fetchall()}
+        print(f"抽出対象: {len(targets)}件 (プロセス数:{max_workers}, タイムアウト:{TIMEOUT_SEC}秒)")
+
+        stats = {"成功": 0, "既存": 0, "失敗": 0}
+        def on_batch(results):
+            for r in results:
+                stats[r["status"][:2]] = stats.get(r["status"][:2], 0) + 1
+            save_results(con, idx, results)
+        extract_parallel(targets, known, max_workers, TIMEOUT_SEC, on_batch)
+    finally:
+        idx.close()
+        con.close()
+
+    elapsed = time.time() - start_time
+    print("\n" + "=" * 45)
+    print(f" 【PDFテキスト抽出結果】")
+    print(f"  対象PDF数 : {len(targets)} 件")
+    print(f"  新規抽出  : {stats['成功']} 件 / 重複スキップ: {stats['既存']} 件 / 失敗: {stats['失敗']} 件")
+    print(f"  処理時間  : {elapsed:.2f}秒 ({len(targets) / elapsed if elapsed else 0:.1f} 件/秒)")
+    print("=" * 45)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="決算短信PDFのテキスト抽出・検索")
+    sub = parser.add_subparsers(dest="command")
+    p_extract = sub.add_parser("extract", help="新規PDFを抽出してインデックスに追加（既定）")
+    p_extract.add_argument("--retry-failed", action="store_true", help="失敗したPDFもやり直す")
+    p_search = sub.add_parser("search", help="全文検索")
+    p_search.add_argument("query")
+    p_search.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == "search":
+        start = time.time()
+        for h in search(args.query, args.limit):
+            print(f"[{h['連番']}] {h['コード'] or ''} {h['会社名'] or ''} {h['表題'] or h['file_name']}")
+            print(f"    … {h['snippet']} …")
+        print(f"({(time.time() - start) * 1000:.0f} ms)")
+    else:
+        run(retry_failed=RETRY_FAILED or getattr(args, "retry_failed", False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""開示種別タクソノミー（設定ファイル）と Aho-Corasick による一括キーワード照合。"""
+
+import os
+import sys
+import json
+import hashlib
+import unicodedata
+from collections import deque
+from typing import List, Dict, Optional
+
+# ================= config =================
+TAXONOMY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tdnet_report_types.json")
+# ==========================================
+
+
+class AhoCorasick:
+    """純Python版の Aho-Corasick オートマトン。build() 後に iter_values() で1回走査する。
+
+    pyahocorasick がインストールされていればそちらを使う。
+    """
+
+    def __init__(self):
+        self._patterns = {}
+        self._native = None
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+    def add(self, pattern: str, value):
+        self._patterns.setdefault(pattern, []).append(value)
+
+    def build(self):
+        try:
+            import ahocorasick
+            automaton = ahocorasick.Automaton()
+            for pattern, values in self._patterns.items():
+                automaton.add_word(pattern, values)
+            if self._patterns:
+                automaton.make_automaton()
+                self._native = automaton
+            return self
+        except ImportError:
+            pass
+
+        for pattern, values in self._patterns.items():
+            node = 0
+            for ch in pattern:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].extend(values)
+
+        # 幅優先で失敗遷移を張り、出力を失敗先から引き継ぐ
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+        return self
+
+    def iter_values(self, text: str):
+        """text 中に現れたパターンの値を（重複を含めて）返す。"""
+        if self._native is not None:
+            for _, values in self._native.iter(text):
+                yield from values
+            return
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                yield from out[node]
+
+
+def _norm_keyword(kw: str) -> str:
+    return unicodedata.normalize('NFKC', kw).lower()
+
+
+class ReportTaxonomy:
+    """設定ファイルのカテゴリ定義から照合器を作る。
+
+    設定: {"categories": [{"name", "keywords", "priority", "exclude"}]}
+    keywords のいずれかを含み、exclude のいずれも含まないカテゴリを該当とする。
+    """
+
+    def __init__(self, categories: List[Dict], fingerprint: str = ""):
+        self.categories = []
+        self.fingerprint = fingerprint
+        self._matcher = AhoCorasick()
+        for order, c in enumerate(categories):
+            idx = len(self.categories)
+            keywords = [_norm_keyword(kw) for kw in c["keywords"]]
+            exclude = [_norm_keyword(kw) for kw in c.get("exclude", [])]
+            self.categories.append({"name": c["name"], "priority": c.get("priority", 0), "order": order,
+                                    "keywords": keywords, "exclude": exclude})
+            for kw in keywords:
+                self._matcher.add(kw, (idx, True))
+            for kw in exclude:
+                self._matcher.add(kw, (idx, False))
+        self._matcher.build()
+        # 優先度の高い順（同じなら設定ファイルの記載順）
+        self._rank = sorted(range(len(self.categories)),
+                            key=lambda i: (-self.categories[i]["priority"], self.categories[i]["order"]))
+        self._rank_of = {i: r for r, i in enumerate(self._rank)}
+
+    @classmethod
+    def load(cls, path: str = TAXONOMY_PATH) -> "ReportTaxonomy":
+        with open(path, "rb") as f:
+            raw = f.read()
+        config = json.loads(raw.decode("utf-8"))
+        return cls(config["categories"], hashlib.sha1(raw).hexdigest()[:16])
+
+    def ranked(self) -> List[Dict]:
+        """カテゴリ定義を優先度順に返す（keywords/exclude は正規化・小文字化済み）。"""
+        return [self.categories[i] for i in self._rank]
+
+    def _matched(self, normalized: str):
+        hit, excluded = set(), set()
+        for idx, positive in self._matcher.iter_values(normalized.lower()):
+            (hit if positive else excluded).add(idx)
+        return hit - excluded
+
+    def match(self, normalized: str) -> List[str]:
+        """該当する全カテゴリ名を優先度順に返す（正規化済みテキストを渡す）。"""
+        return [self.categories[i]["name"] for i in sorted(self._matched(normalized), key=self._rank_of.get)]
+
+    def primary(self, normalized: str) -> Optional[str]:
+        """最も優先度の高いカテゴリ名。該当なしは None。"""
+        matched = self._matched(normalized)
+        if not matched:
+            return None
+        return self.categories[min(matched, key=self._rank_of.get)]["name"]
+
+
+_taxonomy = None
+
+def get_taxonomy() -> ReportTaxonomy:
+    """既定の設定ファイルから読み込んだタクソノミー（初回のみ構築）。"""
+    global _taxonomy
+    if _taxonomy is None:
+        _taxonomy = ReportTaxonomy.load(TAXONOMY_PATH)
+    return _taxonomy
+
+
+if __name__ == "__main__":
+    tax = get_taxonomy()
+    print(f"カテゴリ数: {len(tax.categories)} (設定: {TAXONOMY_PATH})")
+    for text in sys.argv[1:]:
+        n = unicodedata.normalize('NFKC', text)
+        print(f"{text}: 種別={tax.primary(n)} / 該当={tax.match(n)}")
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""行番号/連番ベースで処理するスクリプト共通の処理済み位置（ウォーターマーク）管理。
+
+ステージごとに「どこまで処理したか」と、処理済み範囲のブロック単位の指紋を tdnet.duckdb に記録する。
+次回は新しい行と、指紋が変わったブロック（既存行が書き換わった部分）だけを処理すればよい。
+"""
+
+import sys
+import hashlib
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import duckdb
+
+# ================= config =================
+BLOCK_SIZE = 1000  # 指紋を取る単位（行数）
+# ==========================================
+
+# 指紋の計算方式の世代。block_fingerprints / table_block_fingerprints の計算を変えたら上げる。
+# 記録と世代が違うステージは指紋の値を比べない（全ブロックが「変更あり」扱いになって消し直されるのを防ぐ）
+FINGERPRINT_VERSION = "2"
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS stage_watermark (
+    stage VARCHAR PRIMARY KEY,
+    last_key BIGINT,
+    updated_at TIMESTAMP,
+    fp_version VARCHAR
+);
+CREATE TABLE IF NOT EXISTS stage_fingerprint (
+    stage VARCHAR,
+    block BIGINT,
+    fingerprint VARCHAR,
+    PRIMARY KEY (stage, block)
+);
+"""
+
+
+def ensure_schema(con: duckdb.DuckDBPyConnection):
+    con.execute(SCHEMA_SQL)
+    # fp_version 列がない頃に作った DB 向け（既存行は NULL = 旧方式）
+    con.execute("ALTER TABLE stage_watermark ADD COLUMN IF NOT EXISTS fp_version VARCHAR")
+
+
+def get_last_key(con: duckdb.DuckDBPyConnection, stage: str) -> Optional[int]:
+    ensure_schema(con)
+    row = con.execute("SELECT last_key FROM stage_watermark WHERE stage = ?", [stage]).fetchone()
+    return row[0] if row else None
+
+
+def block_fingerprints(values: Sequence, first_key: int, last_key: Optional[int],
+                       block_size: int = BLOCK_SIZE) -> Dict[int, str]:
+    """values[i]（key = first_key + i の行内容）から last_key までのブロック指紋を作る。"""
+    if last_key is None:
+        return {}
+    fps = {}
+    end = min(len(values), last_key - first_key + 1)
+    h, block = None, None
+    for i in range(end):
+        key = first_key + i
+        b = key // block_size
+        if b != block:
+            if h is not None:
+                fps[block] = h.hexdigest()
+            h, block = hashlib.sha1(), b
+        h.update(repr(values[i]).encode("utf-8"))
+        h.update(b"\x1e")
+    if h is not None:
+        fps[block] = h.hexdigest()
+    return fps
+
+
+def table_block_fingerprints(con: duckdb.DuckDBPyConnection, table: str, key: str, columns: Sequence[str],
+                             last_key: Optional[int], block_size: int = BLOCK_SIZE) -> Dict[int, str]:
+    """DB のテーブルについて key 列でブロック分けした指紋を SQL で集計する（last_key まで）。
+
+    ブロック内の行を key 順に連結した md5。DuckDB の hash() はバージョン間で値が変わりうるので使わない。
+    """
+    if last_key is None:
+        return {}
+    row_expr = " || chr(30) || ".join([f"CAST({key} AS VARCHAR)"] + [f"coalesce(CAST({c} AS VARCHAR), '')" for c in columns])
+    rows = con.execute(f"""
+        SELECT {key} // {block_size} AS block, md5(string_agg({row_expr}, chr(31) ORDER BY {key}))
+        FROM {table} WHERE {key} <= ? GROUP BY block
+    """, [last_key]).fetchall()
+    return dict(rows)
+
+
+def normalize_cell(v):
+    """Excel から読んだ値と書き込んだ値を同じ表現にそろえる（指紋用）。"""
+    if v is None or v == "":
+        return ""
+    if hasattr(v, "year") and hasattr(v, "month"):
+        return f"{v.year}/{v.month}/{v.day}"
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return str(v)
+
+
+def _stored_fingerprints(con: duckdb.DuckDBPyConnection, stage: str) -> Dict[int, str]:
+    return dict(con.execute("SELECT block, fingerprint FROM stage_fingerprint WHERE stage = ?", [stage]).fetchall())
+
+
+def _same_version(con: duckdb.DuckDBPyConnection, stage: str) -> bool:
+    row = con.execute("SELECT fp_version FROM stage_watermark WHERE stage = ?", [stage]).fetchone()
+    return bool(row) and row[0] == FINGERPRINT_VERSION
+
+
+def pending_ranges(con: duckdb.DuckDBPyConnection, stage: str, current_fps: Dict[int, str],
+                   max_key: int, floor_key: int, block_size: int = BLOCK_SIZE) -> List[Tuple[int, int]]:
+    """処理すべき key 範囲 [(start, end), ...]（両端含む）を返す。
+
+    初回は floor_key から max_key まで。以降は指紋が変わったブロックと last_key より後ろ。
+    current_fps は get_last_key() までの範囲で block_fingerprints() した結果を渡す。
+    記録が別の FINGERPRINT_VERSION のときは値を比べず、指紋の記録がないブロックだけを対象にする
+    （次の commit で新しい方式の指紋に置き換わる）。
+    """
+    last_key = get_last_key(con, stage)
+    if last_key is None:
+        return [(floor_key, max_key)] if floor_key <= max_key else []
+
+    stored = _stored_fingerprints(con, stage)
+    same_version = _same_version(con, stage)
+    ranges = []
+    for b in sorted(set(stored) | set(current_fps)):
+        changed = stored.get(b) != current_fps.get(b) if same_version else b not in stored
+        if changed:
+            start = max(b * block_size, floor_key)
+            end = min(b * block_size + block_size - 1, last_key, max_key)
+            if start <= end:
+                ranges.append((start, end))
+    if last_key < max_key:
+        ranges.append((max(last_key + 1, floor_key), max_key))
+
+    # 隣接する範囲をまとめる
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def commit(con: duckdb.DuckDBPyConnection, stage: str, last_key: int, fps: Dict[int, str]):
+    """last_key までを処理済みとし、そのときの内容の指紋を（計算方式の世代と一緒に）記録する。"""
+    ensure_schema(con)
+    con.execute("BEGIN TRANSACTION")
+    try:
+        con.execute("INSERT OR REPLACE INTO stage_watermark (stage, last_key, updated_at, fp_version) VALUES (?, ?, ?, ?)",
+                    [stage, last_key, datetime.now(), FINGERPRINT_VERSION])
+        con.execute("DELETE FROM stage_fingerprint WHERE stage = ?", [stage])
+        if fps:
+            con.executemany("INSERT INTO stage_fingerprint VALUES (?, ?, ?)",
+                            [(stage, b, fp) for b, fp in fps.items()])
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+
+
+def reset(con: duckdb.DuckDBPyConnection, stage: str):
+    """ステージの記録を消す（次回は floor_key から全件処理）。"""
+    ensure_schema(con)
+    con.execute("DELETE FROM stage_watermark WHERE stage = ?", [stage])
+    con.execute("DELETE FROM stage_fingerprint WHERE stage = ?", [stage])
+
+
+def count_rows(ranges: List[Tuple[int, int]]) -> int:
+    return sum(end - start + 1 for start, end in ranges)
+
+
+if __name__ == "__main__":
+    import tdnet_worklist
+    con = tdnet_worklist.connect()
+    try:
+        ensure_schema(con)
+        if len(sys.argv) >= 3 and sys.argv[1] == "reset":
+            reset(con, sys.argv[2])
+            print(f"リセットしました: {sys.argv[2]}")
+        for stage, last_key, updated_at in con.execute(
+                "SELECT stage, last_key, updated_at FROM stage_watermark ORDER BY stage").fetchall():
+            print(f"{stage:<20} 処理済み: {last_key}  更新: {updated_at}")
+    finally:
+        con.close()
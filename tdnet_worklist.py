@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""適時開示ワークリスト（分類・ファイル名・DL状況）を tdnet.duckdb で管理する。"""
+
+import os
+import time
+import argparse
+from datetime import datetime, date
+from typing import List, Dict, Optional, Iterable, Tuple
+
+import duckdb
+
+# ================= config =================
+DB_PATH = r"C:\Users\ensyu\Documents\Speculation\TDnet\TDnet適時情報開示サービス\tdnet.duckdb"
+EXCEL_FILE = r'\\LS720D7A9\TakashiBK\投資\TDNET\TDnet適時情報開示サービス\TDnet適時開示情報.xlsm'
+SHEET_NAME = '適時開示情報'
+# エクスポート先（Excelビュー。正本はDB側）
+EXPORT_FILE = os.path.join(os.path.dirname(EXCEL_FILE), "TDnet適時開示情報_view.xlsx")
+HEADER_FILENAME = "ファイル名(連番+公開日+時刻+(種別)+決算月+4Q+コード+会社名+表題)"
+
+# disclosure_info のURL列名（環境により揺れがあるため候補から解決）
+PDF_URL_COLUMNS = ("表題リンク", "表題_URL", "表題URL")
+XBRL_URL_COLUMNS = ("XBRLリンク", "XBRL_URL", "XBRLURL")
+
+# Excelの定数定義
+xlUp = -4162
+# ==========================================
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS disclosure_class (
+    連番 BIGINT PRIMARY KEY,
+    種別 VARCHAR,
+    決算月 DATE,
+    quarter VARCHAR,
+    classified_at TIMESTAMP,
+    カテゴリ VARCHAR
+);
+CREATE TABLE IF NOT EXISTS disclosure_file (
+    連番 BIGINT PRIMARY KEY,
+    ファイル名 VARCHAR,
+    禁則文字 VARCHAR,
+    sanitized_at TIMESTAMP,
+    pdfDL VARCHAR,
+    xbrlDL VARCHAR,
+    updated_at TIMESTAMP
+);
+"""
+
+
+def connect(db_path: str = DB_PATH, read_only: bool = False) -> duckdb.DuckDBPyConnection:
+    """DB接続を開き、ワークリスト用テーブルを用意する。"""
+    con = duckdb.connect(database=db_path, read_only=read_only)
+    if not read_only:
+        ensure_schema(con)
+    return con
+
+
+def ensure_schema(con: duckdb.DuckDBPyConnection):
+    con.execute(SCHEMA_SQL)
+    # 旧スキーマからの移行
+    con.execute("ALTER TABLE disclosure_class ADD COLUMN IF NOT EXISTS カテゴリ VARCHAR")
+
+
+def resolve_column(con: duckdb.DuckDBPyConnection, candidates: Iterable[str], table: str = "disclosure_info") -> Optional[str]:
+    """候補のうち実在する列名を返す。見つからなければ None。"""
+    cols = {r[0] for r in con.execute(f"DESCRIBE {table}").fetchall()}
+    for c in candidates:
+        if c in cols:
+            return c
+    return None
+
+
+def _is_blank(v) -> bool:
+    return v is None or str(v).strip() in ["", "None"]
+
+
+def _to_seq(v) -> Optional[int]:
+    """セルの値を連番（整数）にする。123 / 123.0 / "123" / "123.0" 以外（見出しの写しなど）は None。"""
+    try:
+        f = float(str(v).strip())
+    except ValueError:
+        return None
+    return int(f) if f.is_integer() else None
+
+
+# -----------------------------------------------------------------
+# 分類（tdnet_Qperiod）
+# -----------------------------------------------------------------
+def fetch_unclassified(con: duckdb.DuckDBPyConnection, min_seq: int = 0) -> List[Tuple[int, str]]:
+    """未分類の (連番, 表題) を連番順に返す。"""
+    return con.execute("""
+        SELECT d.連番, d.表題
+        FROM disclosure_info d
+        WHERE d.連番 > ?
+          AND NOT EXISTS (SELECT 1 FROM disclosure_class c WHERE c.連番 = d.連番)
+        ORDER BY d.連番
+    """, [min_seq]).fetchall()
+
+
+def save_classification(con: duckdb.DuckDBPyConnection, rows: List[Tuple]):
+    """(連番, 種別, 決算月, quarter[, カテゴリ]) をまとめて書き込む。"""
+    if not rows:
+        return
+    now = datetime.now()
+    con.execute("BEGIN TRANSACTION")
+    try:
+        con.executemany("""
+            INSERT OR REPLACE INTO disclosure_class (連番, 種別, 決算月, quarter, classified_at, カテゴリ)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [(r[0], r[1] or None, r[2], r[3] or None, now, (r[4] if len(r) > 4 else None) or None) for r in rows])
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+
+
+def reset_report_types(con: duckdb.DuckDBPyConnection, keywords: Iterable[str]) -> Tuple[int, int]:
+    """種別が keywords 以外の行を未分類（NULL）に戻す。(種別を戻した件数, ファイル名を消した件数) を返す。
+
+    タクソノミーの最優先カテゴリを種別に入れていた時期の行が対象。従来の5区分はタクソノミーでも
+    最優先なので、それ以外が入った行の表題には5区分のキーワードが含まれない。
+    まだ1つもDLしていない行はファイル名の (種別) も作り直させる（DL済みのファイル名は変えない）。
+    """
+    keywords = list(keywords)
+    marks = ", ".join("?" for _ in keywords)
+    now = datetime.now()
+    con.execute("BEGIN TRANSACTION")
+    try:
+        n_file = con.execute(f"""
+            UPDATE disclosure_file
+            SET ファイル名 = NULL, 禁則文字 = NULL, sanitized_at = NULL, updated_at = ?
+            WHERE pdfDL IS NULL AND xbrlDL IS NULL AND ファイル名 IS NOT NULL
+              AND 連番 IN (SELECT 連番 FROM disclosure_class WHERE 種別 NOT IN ({marks}))
+        """, [now, *keywords]).fetchone()[0]
+        n_class = con.execute(f"UPDATE disclosure_class SET 種別 = NULL WHERE 種別 NOT IN ({marks})",
+                              keywords).fetchone()[0]
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    return n_class, n_file
+
+
+# -----------------------------------------------------------------
+# ファイル名（tdnet_ngword）
+# -----------------------------------------------------------------
+def fetch_unsanitized(con: duckdb.DuckDBPyConnection) -> List[Tuple[int, str]]:
+    """禁則文字チェック未実施の (連番, ファイル名) を返す。"""
+    return con.execute("""
+        SELECT 連番, ファイル名 FROM disclosure_file
+        WHERE sanitized_at IS NULL AND ファイル名 IS NOT NULL
+        ORDER BY 連番
+    """).fetchall()
+
+
+def save_sanitized(con: duckdb.DuckDBPyConnection, rows: List[Tuple[int, str, Optional[str]]]):
+    """(連番, 変換後ファイル名, 置換した文字) を書き込む。"""
+    if not rows:
+        return
+    now = datetime.now()
+    con.execute("BEGIN TRANSACTION")
+    try:
+        con.executemany("""
+            UPDATE disclosure_file
+            SET ファイル名 = ?, 禁則文字 = ?, sanitized_at = ?, updated_at = ?
+            WHERE 連番 = ?
+        """, [(fname, changed, now, now, seq) for seq, fname, changed in rows])
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+
+
+# -----------------------------------------------------------------
+# ダウンロード（tdnet_FinancialSummary_dl）
+# -----------------------------------------------------------------
+def fetch_pending_downloads(con: duckdb.DuckDBPyConnection, min_seq: int = 0) -> List[Dict]:
+    """PDF/XBRLのどちらかが未DLの行をタスク形式で返す。"""
+    pdf_col = resolve_column(con, PDF_URL_COLUMNS)
+    xbrl_col = resolve_column(con, XBRL_URL_COLUMNS)
+    p_expr = f'd."{pdf_col}"' if pdf_col else "NULL"
+    x_expr = f'd."{xbrl_col}"' if xbrl_col else "NULL"
+    rows = con.execute(f"""
+        SELECT f.連番, f.ファイル名,
+               CASE WHEN f.pdfDL IS NULL THEN {p_expr} END AS p_url,
+               CASE WHEN f.xbrlDL IS NULL THEN {x_expr} END AS x_url,
+               c.種別, d.コード
+        FROM disclosure_file f
+        JOIN disclosure_info d ON d.連番 = f.連番
+        LEFT JOIN disclosure_class c ON c.連番 = f.連番
+        WHERE f.連番 > ?
+          AND f.ファイル名 IS NOT NULL
+          AND (f.pdfDL IS NULL OR f.xbrlDL IS NULL)
+        ORDER BY f.連番
+    """, [min_seq]).fetchall()
+
+    tasks = []
+    for seq, fname, p_url, x_url, rtype, code in rows:
+        if p_url or x_url:
+            tasks.append({"row": seq, "fname": fname, "p_url": p_url, "x_url": x_url,
+                          "種別": rtype, "コード": code})
+    return tasks
+
+
+def save_download_results(con: duckdb.DuckDBPyConnection, results: List[Dict]):
+    """execute_task の結果（row=連番）をDL状況として書き込む。"""
+    if not results:
+        return
+    now = datetime.now()
+    con.execute("BEGIN TRANSACTION")
+    try:
+        for r in results:
+            if r.get("p_msg"):
+                con.execute("UPDATE disclosure_file SET pdfDL = ?, updated_at = ? WHERE 連番 = ?",
+                            [r["p_msg"], now, r["row"]])
+            if r.get("x_msg"):
+                con.execute("UPDATE disclosure_file SET xbrlDL = ?, updated_at = ? WHERE 連番 = ?",
+                            [r["x_msg"], now, r["row"]])
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+
+
+# -----------------------------------------------------------------
+# Excel との入出力
+# -----------------------------------------------------------------
+def _open_workbook(excel, file_path):
+    for wb in excel.Workbooks:
+        if wb.FullName.lower() == file_path.lower():
+            return wb
+    return excel.Workbooks.Open(file_path)
+
+
+def _get_excel():
+    import win32com.client
+    try:
+        return win32com.client.GetActiveObject("Excel.Application")
+    except:
+        excel = win32com.client.Dispatch("Excel.Application")
+        excel.Visible = True
+        return excel
+
+
+def _to_date(v) -> Optional[date]:
+    if v is None or v == "":
+        return None
+    if isinstance(v, datetime):
+        return v.date()
+    if isinstance(v, date):
+        return v
+    for fmt in ("%Y/%m/%d", "%y/%m/%d", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(str(v).split()[0], fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def import_from_excel(con: duckdb.DuckDBPyConnection, file_path: str = EXCEL_FILE, start_row: int = 2,
+                      new_only: bool = False) -> int:
+    """シートの分類列・ファイル名・DL状況をDBへ取り込む。取り込んだ行数を返す。
+
+    new_only=True の場合は disclosure_file に未登録の連番の行だけを読む。
+    """
+    import pythoncom
+    pythoncom.CoInitialize()
+    try:
+        excel = _get_excel()
+        wb = _open_workbook(excel, file_path)
+        ws = wb.Worksheets(SHEET_NAME)
+        max_row = ws.Cells(ws.Rows.Count, "A").End(xlUp).Row
+        if max_row < start_row:
+            return 0
+
+        headers = ws.Rows(1).Value[0]
+        def find_col(name, default):
+            try: return headers.index(name) + 1
+            except: return default
+
+        if new_only:
+            # 連番列だけを一括取得し、DB未登録の最初の行から読む
+            max_seq = con.execute("SELECT COALESCE(MAX(連番), 0) FROM disclosure_file").fetchone()[0]
+            col_seq = find_col("連番", 1)
+            seqs = ws.Range(ws.Cells(start_row, col_seq), ws.Cells(max_row, col_seq)).Value
+            seqs = [v[0] for v in seqs] if isinstance(seqs, tuple) else [seqs]
+            for i, seq in enumerate(seqs):
+                seq = _to_seq(seq)
+                if seq is not None and seq > max_seq:
+                    start_row += i
+                    break
+            else:
+                return 0
+
+        cols = {
+            "連番": find_col("連番", 1),
+            "種別": find_col("種別", 10),
+            "決算月": find_col("決算月", 11),
+            "quarter": find_col("quarter", 12),
+            "ファイル名": find_col(HEADER_FILENAME, 13),
+            "pdfDL": find_col("pdfDL", 14),
+            "xbrlDL": find_col("xbrlDL", 15),
+            "禁則文字": find_col("禁則文字", 16),
+        }
+        # 列ごとに一括取得（セル単位のCOM呼び出しを避ける）
+        values = {}
+        for key, col in cols.items():
+            rng = ws.Range(ws.Cells(start_row, col), ws.Cells(max_row, col)).Value
+            values[key] = [v[0] for v in rng] if isinstance(rng, tuple) else [rng]
+    finally:
+        pythoncom.CoUninitialize()
+
+    class_rows, file_rows = [], []
+    invalid = 0
+    now = datetime.now()
+    for i, raw_seq in enumerate(values["連番"]):
+        if _is_blank(raw_seq):
+            continue
+        seq = _to_seq(raw_seq)
+        if seq is None:
+            invalid += 1
+            continue
+        rtype = values["種別"][i]
+        period = _to_date(values["決算月"][i])
+        q = values["quarter"][i]
+        if not _is_blank(rtype) or period or not _is_blank(q):
+            class_rows.append((seq, None if _is_blank(rtype) else str(rtype), period,
+                               None if _is_blank(q) else str(q), now))
+        fname = values["ファイル名"][i]
+        if not _is_blank(fname):
+            p_res, x_res, ng = values["pdfDL"][i], values["xbrlDL"][i], values["禁則文字"][i]
+            file_rows.append((seq, str(fname), None if _is_blank(ng) else str(ng), now,
+                              None if _is_blank(p_res) else str(p_res),
+                              None if _is_blank(x_res) else str(x_res), now))
+
+    con.execute("BEGIN TRANSACTION")
+    try:
+        if class_rows:
+            con.executemany("""
+                INSERT OR REPLACE INTO disclosure_class (連番, 種別, 決算月, quarter, classified_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, class_rows)
+        if file_rows:
+            con.executemany("INSERT OR REPLACE INTO disclosure_file VALUES (?, ?, ?, ?, ?, ?, ?)", file_rows)
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    if invalid:
+        print(f"連番が数値でない行をスキップしました: {invalid}件")
+    return len(file_rows)
+
+
+def fetch_sheet_view(con: duckdb.DuckDBPyConnection) -> Tuple[List[str], List[tuple]]:
+    """Excelビュー用に disclosure_info と分類・DL状況を結合して返す。"""
+    result = con.execute("""
+        SELECT d.*, c.種別, c.決算月, c.quarter, c.カテゴリ, f.ファイル名, f.pdfDL, f.xbrlDL, f.禁則文字
+        FROM disclosure_info d
+        LEFT JOIN disclosure_class c ON c.連番 = d.連番
+        LEFT JOIN disclosure_file f ON f.連番 = d.連番
+        ORDER BY d.連番
+    """)
+    columns = [desc[0] for desc in result.description]
+    return columns, result.fetchall()
+
+
+def export_to_excel(con: duckdb.DuckDBPyConnection, file_path: str = EXPORT_FILE) -> int:
+    """DBの内容からExcelビューを再生成する。書き出した行数を返す。"""
+    import pythoncom
+    columns, rows = fetch_sheet_view(con)
+
+    # COMに渡せる形へ変換（日付は文字列、None は空）
+    def to_cell(v):
+        if v is None:
+            return ""
+        if isinstance(v, datetime):
+            return v.strftime('%Y/%m/%d %H:%M:%S')
+        if isinstance(v, date):
+            return v.strftime('%Y/%m/%d')
+        return v
+    data = [[to_cell(v) for v in row] for row in rows]
+
+    pythoncom.CoInitialize()
+    excel = None
+    try:
+        excel = _get_excel()
+        excel.DisplayAlerts = False
+        excel.ScreenUpdating = False
+        wb = excel.Workbooks.Add()
+        ws = wb.Worksheets(1)
+        ws.Name = SHEET_NAME
+        n_cols = len(columns)
+        ws.Range(ws.Cells(1, 1), ws.Cells(1, n_cols)).Value = [columns]
+        if data:
+            ws.Range(ws.Cells(2, 1), ws.Cells(len(data) + 1, n_cols)).Value = data
+        wb.SaveAs(file_path, FileFormat=51)  # 51 = xlOpenXMLWorkbook
+        wb.Close()
+    finally:
+        if excel:
+            excel.ScreenUpdating = True
+            excel.DisplayAlerts = True
+        pythoncom.CoUninitialize()
+    return len(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TDnet ワークリスト（DuckDB）管理")
+    parser.add_argument("command", choices=["import", "export", "status"],
+                        help="import: シート→DB取り込み / export: DB→Excelビュー再生成 / status: 件数表示")
+    parser.add_argument("--start-row", type=int, default=2, help="import 時の開始行")
+    parser.add_argument("--new-only", action="store_true", help="import 時にDB未登録の行だけを読む")
+    parser.add_argument("--out", default=EXPORT_FILE, help="export 先ファイル")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    con = connect()
+    try:
+        if args.command == "import":
+            n = import_from_excel(con, EXCEL_FILE, args.start_row, args.new_only)
+            print(f"取り込み完了: {n}件")
+        elif args.command == "export":
+            import tdnet_filename
+            n_named, _, n_coll = tdnet_filename.assign_filenames(con)
+            if n_named:
+                print(f"ファイル名生成: {n_named}件 (衝突 {n_coll}件)")
+            n = export_to_excel(con, args.out)
+            print(f"Excelビューを書き出しました: {args.out} ({n}件)")
+        else:
+            total = con.execute("SELECT COUNT(*) FROM disclosure_info").fetchone()[0]
+            unclassified = len(fetch_unclassified(con))
+            pending = len(fetch_pending_downloads(con))
+            print(f"disclosure_info: {total}件 / 未分類: {unclassified}件 / 未DL: {pending}件")
+    finally:
+        con.close()
+    print(f"処理時間: {time.time() - start_time:.2f}秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""XBRL_FOLDER のzipからサマリー（iXBRL）の主要数値を抽出し、xbrl_facts テーブルへ追記する。"""
+
+import os
+import re
+import time
+import zipfile
+import html
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Dict, Optional, Tuple
+
+import duckdb
+
+# ================= config =================
+DB_PATH = r"C:\Users\ensyu\Documents\Speculation\TDnet\TDnet適時情報開示サービス\tdnet.duckdb"
+BASE_DIR = r'\\LS720D7A9\TakashiBK\投資\TDNET\TDnet適時情報開示サービス'
+XBRL_FOLDER = os.path.join(BASE_DIR, "TDnet(決算短信)XBRL-随時追加分")
+MAX_WORKERS = os.cpu_count() or 4
+CHUNK_SIZE = 50          # 1ワーカーにまとめて渡すzip数
+INSERT_BATCH = 200       # 何ファイル分の結果ごとにDBへ書き込むか
+# 抽出後にParquetも出力する場合はパスを指定（None で出力しない）
+EXPORT_PARQUET = None
+# ==========================================
+
+# 取得対象の要素（ローカル名 -> 項目名）
+KEY_ELEMENTS = {
+    "NetSales": "売上高",
+    "OperatingRevenues": "売上高",
+    "NetSalesOfInsuranceCompanies": "売上高",
+    "OrdinaryRevenuesBK": "売上高",
+    "OrdinaryRevenuesIN": "売上高",
+    "OperatingIncome": "営業利益",
+    "OrdinaryIncome": "経常利益",
+    "ProfitAttributableToOwnersOfParent": "純利益",
+    "NetIncome": "純利益",
+    "Profit": "純利益",
+    "NetIncomePerShare": "EPS",
+    "DilutedNetIncomePerShare": "希薄化EPS",
+    "DividendPerShare": "配当",
+}
+
+FACTS_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS xbrl_facts (
+    連番 BIGINT,
+    コード VARCHAR,
+    zip_file VARCHAR,
+    項目 VARCHAR,
+    element VARCHAR,
+    context VARCHAR,
+    予想 BOOLEAN,
+    連結 BOOLEAN,
+    value DOUBLE
+);
+CREATE TABLE IF NOT EXISTS xbrl_extracted (
+    zip_file VARCHAR PRIMARY KEY,
+    size BIGINT,
+    mtime DOUBLE,
+    n_facts INTEGER,
+    status VARCHAR,
+    extracted_at TIMESTAMP
+);
+"""
+
+# iXBRL: <ix:nonFraction name="tse-ed-t:NetSales" contextRef="..." ...>1,234</ix:nonFraction>
+RE_IX_FACT = re.compile(r'<ix:nonFraction\b([^>]*)>(.*?)</ix:nonFraction>', re.S | re.I)
+RE_IX_TEXT = re.compile(r'<ix:nonNumeric\b([^>]*)>(.*?)</ix:nonNumeric>', re.S | re.I)
+# 旧形式インスタンス: <tse-t-ed:NetSales contextRef="..." ...>1234</tse-t-ed:NetSales>
+RE_XML_FACT = re.compile(r'<([\w-]+):(\w+)\b([^>]*\bcontextRef="[^"]*"[^>]*)>([^<]*)</\1:\2>', re.S)
+RE_ATTR = re.compile(r'([\w:-]+)="([^"]*)"')
+RE_TAG = re.compile(r'<[^>]+>')
+RE_SEQ = re.compile(r'^(\d+)')
+
+
+def _attrs(text: str) -> Dict[str, str]:
+    return dict(RE_ATTR.findall(text))
+
+
+def parse_number(raw: str, attrs: Dict[str, str]) -> Optional[float]:
+    """表示値と scale/sign 属性から数値を得る。数値でなければ None。"""
+    text = html.unescape(RE_TAG.sub("", raw)).strip()
+    negative = attrs.get("sign") == "-"
+    if text.startswith(("△", "▲", "-", "－")):
+        negative = True
+        text = text[1:]
+    text = text.replace(",", "").replace("，", "")
+    if not text or text in ("-", "－", "―"):
+        return None
+    try:
+        value = float(text)
+    except ValueError:
+        return None
+    scale = attrs.get("scale")
+    if scale and scale.lstrip("-").isdigit():
+        value *= 10 ** int(scale)
+    return -value if negative else value
+
+
+def _fact_row(local: str, context: str, value: float) -> Tuple:
+    is_forecast = "Forecast" in context
+    is_consolidated = "NonConsolidated" not in context
+    return (KEY_ELEMENTS[local], local, context, is_forecast, is_consolidated, value)
+
+
+def parse_summary(content: str) -> Tuple[Optional[str], List[Tuple]]:
+    """サマリー文書から (コード, [(項目, element, context, 予想, 連結, value), ...]) を返す。"""
+    code = None
+    facts = []
+    if "ix:nonFraction" in content or "ix:nonfraction" in content:
+        for attr_text, raw in RE_IX_FACT.findall(content):
+            attrs = _attrs(attr_text)
+            local = attrs.get("name", "").split(":")[-1]
+            if local not in KEY_ELEMENTS:
+                continue
+            value = parse_number(raw, attrs)
+            if value is not None:
+                facts.append(_fact_row(local, attrs.get("contextRef", ""), value))
+        for attr_text, raw in RE_IX_TEXT.findall(content):
+            if _attrs(attr_text).get("name", "").endswith(":SecuritiesCode"):
+                code = html.unescape(RE_TAG.sub("", raw)).strip()
+                break
+    else:
+        for prefix, local, attr_text, raw in RE_XML_FACT.findall(content):
+            if local == "SecuritiesCode" and not code:
+                code = raw.strip()
+                continue
+            if local not in KEY_ELEMENTS:
+                continue
+            attrs = _attrs(attr_text)
+            value = parse_number(raw, attrs)
+            if value is not None:
+                facts.append(_fact_row(local, attrs.get("contextRef", ""), value))
+    return code, facts
+
+
+def _is_summary_member(name: str) -> bool:
+    lower = name.lower()
+    if "/summary/" in lower and lower.endswith("ixbrl.htm"):
+        return True
+    # 旧形式（tdnet-...-summary.xbrl 等）
+    return lower.endswith(".xbrl") and "summary" in lower
+
+
+def extract_zip(zip_path: str) -> Dict:
+    """zipをメモリ上で開き、サマリーの主要数値を抽出する（ワーカープロセスで実行）。"""
+    name = os.path.basename(zip_path)
+    m = RE_SEQ.match(name)
+    res = {"zip_file": name, "連番": int(m.group(1)) if m else None, "コード": None,
+           "facts": [], "status": "成功"}
+    try:
+        st = os.stat(zip_path)
+        res["size"], res["mtime"] = st.st_size, st.st_mtime
+        with zipfile.ZipFile(zip_path) as zf:
+            members = [n for n in zf.namelist() if _is_summary_member(n)]
+            if not members:
+                res["status"] = "サマリーなし"
+                return res
+            for member in members:
+                content = zf.read(member).decode("utf-8", errors="ignore")
+                code, facts = parse_summary(content)
+                res["コード"] = res["コード"] or code
+                res["facts"].extend(facts)
+    except Exception as e:
+        res["status"] = f"失敗: {e}"
+    return res
+
+
+def _extract_chunk(paths: List[str]) -> List[Dict]:
+    return [extract_zip(p) for p in paths]
+
+
+def ensure_schema(con: duckdb.DuckDBPyConnection):
+    con.execute(FACTS_SCHEMA_SQL)
+
+
+def find_new_zips(con: duckdb.DuckDBPyConnection, folder: str = XBRL_FOLDER) -> List[str]:
+    """未抽出、またはサイズ・更新時刻が変わったzipだけを返す。"""
+    done = {r[0]: (r[1], r[2]) for r in con.execute("SELECT zip_file, size, mtime FROM xbrl_extracted").fetchall()}
+    targets = []
+    with os.scandir(folder) as it:
+        for entry in it:
+            if not entry.is_file() or not entry.name.lower().endswith(".zip"):
+                continue
+            st = entry.stat()
+            prev = done.get(entry.name)
+            if prev is None or prev[0] != st.st_size or prev[1] != st.st_mtime:
+                targets.append(entry.path)
+    return sorted(targets)
+
+
+def save_results(con: duckdb.DuckDBPyConnection, results: List[Dict]):
+    """抽出結果を1トランザクションで書き込む（再抽出分は置き換え）。"""
+    if not results:
+        return
+    now = datetime.now()
+    fact_rows = []
+    for r in results:
+        for f in r["facts"]:
+            fact_rows.append((r["連番"], r["コード"], r["zip_file"]) + f)
+    names = [(r["zip_file"],) for r in results]
+
+    con.execute("BEGIN TRANSACTION")
+    try:
+        con.executemany("DELETE FROM xbrl_facts WHERE zip_file = ?", names)
+        if fact_rows:
+            con.executemany("INSERT INTO xbrl_facts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", fact_rows)
+        con.executemany("INSERT OR REPLACE INTO xbrl_extracted VALUES (?, ?, ?, ?, ?, ?)",
+                        [(r["zip_file"], r.get("size"), r.get("mtime"), len(r["facts"]), r["status"], now)
+                         for r in results])
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+
+
+def run(db_path: str = DB_PATH, folder: str = XBRL_FOLDER, max_workers: int = MAX_WORKERS):
+    start_time = time.time()
+    print(f"--- XBRL抽出開始 [{datetime.now().strftime('%H:%M:%S')}] ---")
+
+    con = duckdb.connect(db_path)
+    try:
+        ensure_schema(con)
+        targets = find_new_zips(con, folder)
+        if not targets:
+            print("処理対象の新規zipはありません。")
+            return
+        print(f"抽出対象: {len(targets)}件 (プロセス数:{max_workers})")
+
+        chunks = [targets[i:i + CHUNK_SIZE] for i in range(0, len(targets), CHUNK_SIZE)]
+        pending, done_count, fact_count, error_count = [], 0, 0, 0
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_extract_chunk, c) for c in chunks]
+            for future in as_completed(futures):
+                for r in future.result():
+                    pending.append(r)
+                    fact_count += len(r["facts"])
+                    if r["status"].startswith("失敗"):
+                        error_count += 1
+                done_count += 1
+                if len(pending) >= INSERT_BATCH:
+                    save_results(con, pending)
+                    pending = []
+                print(f"  進捗: {min(done_count * CHUNK_SIZE, len(targets))}/{len(targets)} 件完了...", end="\r")
+        save_results(con, pending)
+
+        if EXPORT_PARQUET:
+            con.execute(f"COPY xbrl_facts TO '{EXPORT_PARQUET}' (FORMAT PARQUET, COMPRESSION ZSTD)")
+            print(f"\nParquetを出力しました: {EXPORT_PARQUET}")
+    finally:
+        con.close()
+
+    elapsed = time.time() - start_time
+    print("\n" + "=" * 45)
+    print(f" 【XBRL抽出結果】")
+    print(f"  対象zip数 : {len(targets)} 件")
+    print(f"  抽出数値数: {fact_count} 件")
+    print(f"  失敗      : {error_count} 件")
+    print(f"  処理時間  : {elapsed:.2f}秒 ({len(targets) / elapsed if elapsed else 0:.1f} 件/秒)")
+    print("=" * 45)
+
+
+if __name__ == "__main__":
+    run()
@@ -1,16 +1,558 @@
 import duckdb
 import glob
 import os
+import re
+import sys
 import time
-from datetime import timedelta
+import shutil
+import hashlib
+from datetime import datetime, timedelta
 from pathlib import Path
 
+import stock_prices
+
 # ==========================================
 # 設定情報
 # ==========================================
 input_path = r'\\LS720D7A9\TakashiBK\投資\無尽蔵日別株価\RawData無尽蔵日別株価(2020-2025年RawData)\*.csv'
 output_file = 'stock_data.parquet'
 error_log_file = 'import_errors.csv'
+# 取り込み方式: "multi" = 複数ファイルを1回の並列読み込み / "per_file" = 従来の1ファイルずつ
+ingest_mode = "multi"
+# multi で1回に読むファイル数（失敗したバッチはエラーのファイルを外して読み直す）
+batch_size = 500
+# Shift-JIS の読み方: "auto" = インストール済みの encodings 拡張を使い、なければPythonで変換
+#                    "extension" = 拡張を INSTALL して使う（要ネットワーク） / "python" = 常にPythonで変換
+# "python" はネットワークなし（拡張を取得できない環境）でも動く。プロセスプールで全コアを使い UTF-8 に変換してから読む
+decode_mode = "auto"
+source_encoding = 'cp932'       # Shift-JIS の Windows 拡張（NEC特殊文字など）を含む
+decode_workers = os.cpu_count()
+decode_dir = 'stock_decode_tmp'  # 変換済み UTF-8 の一時置き場（取り込み後に削除）
+decode_chunk_chars = 1024 * 1024
+# 出力方式: "dataset" = 取り込み済み台帳で新規ファイルだけをパーツとして追記 / "single" = 毎回 output_file を作り直す
+output_mode = "dataset"
+dataset_dir = stock_prices.DATASET_DIR          # Parquetパーツの置き場（読む側の stock_prices / tdnet_event_study と共通の設定）
+staging_dir = dataset_dir + '_staging'          # 書き出し途中のパーツ（dataset_dir の外に置く）
+manifest_file = dataset_dir + '_manifest.duckdb'  # 取り込み済みファイルの台帳（path, size, mtime, hash, part）
+# パーツ数がこれを超えたら、小さいパーツ（compact_small_bytes 未満）を1つにまとめる
+compact_max_parts = 30
+compact_small_bytes = 64 * 1024 * 1024
+# 型付けする列: 出力列名 -> (元CSVの列名の候補, 型)。ヘッダなしのCSVは column0, column1 ... で指定する
+# 候補が見つからない列は出力しない。それ以外の列は VARCHAR のまま残す
+typed_columns = {
+    "日付": (("日付", "年月日", "column0"), "DATE"),
+    "コード": (("銘柄コード", "コード", "column1"), "VARCHAR"),
+    "始値": (("始値", "column4"), "DOUBLE"),
+    "高値": (("高値", "column5"), "DOUBLE"),
+    "安値": (("安値", "column6"), "DOUBLE"),
+    "終値": (("終値", "column7"), "DOUBLE"),
+    "出来高": (("出来高", "column8"), "BIGINT"),
+}
+date_formats = ['%Y/%m/%d', '%Y-%m-%d', '%Y%m%d']
+# Parquet の書き出し設定（year=/month= で Hive パーティション分割、各ファイル内は コード, 日付 順）
+# 行グループを小さめにして、コードで絞った検索が各ファイルの1〜2行グループだけを読むようにする
+row_group_size = 16384
+parquet_compression = 'zstd'
+# メモリ上限（DuckDB の memory_limit）。超えた分は temp_directory に退避する
+memory_limit = '4GB'
+temp_directory = 'stock_duckdb_tmp'
+# 作業用DBをディスクに置く（None ならインメモリ。いずれも memory_limit を超えた分は退避される）
+work_db_file = 'stock_ingest_work.duckdb'
+# dataset で1パーツにするファイル数。この単位で読み込み→書き出し→台帳更新を繰り返し、メモリ使用量を一定に保つ
+files_per_part = 1000
+
+MANIFEST_SQL = """
+CREATE TABLE IF NOT EXISTS m.ingested_files (
+    path VARCHAR PRIMARY KEY,
+    size BIGINT,
+    mtime DOUBLE,
+    sha256 VARCHAR,
+    part VARCHAR,
+    ingested_at TIMESTAMP
+)
+"""
+
+csv_encoding = 'shift_jis'  # DuckDB に渡す encoding（Python変換時は utf-8）
+RE_ERROR_FILE = re.compile(r'^\s*file = (.+?)\s*$', re.M)  # DuckDB の CSV エラーに付くファイル名
+
+def sql_list(paths):
+    return "[" + ", ".join("'" + Path(p).as_posix().replace("'", "''") + "'" for p in paths) + "]"
+
+def table_exists(con):
+    return con.execute("SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = 'all_data'").fetchone()[0] > 0
+
+def table_columns(con):
+    return [r[0] for r in con.execute("DESCRIBE all_data").fetchall()]
+
+def select_columns(columns):
+    # 知っている列だけを選ぶ（他の列は読み捨て、ないものは INSERT BY NAME で NULL になる）
+    names = "[" + ", ".join("'" + c.replace("'", "''") + "'" for c in columns) + "]"
+    return f"COLUMNS(c -> list_contains({names}, c))"
+
+def append(con, source_sql, columns=None):
+    """source_sql を all_data に追加する。
+
+    初回はテーブルを作り（columns があればその列だけ）、2回目以降は all_data にある列だけを列名で合わせて挿入する。
+    備考などの余分な列があるファイルでも失敗しない。
+    """
+    if not table_exists(con):
+        select = "*" if columns is None else select_columns(columns)
+        con.execute(f"CREATE TABLE all_data AS SELECT {select} FROM {source_sql}")
+    else:
+        con.execute(f"INSERT INTO all_data BY NAME SELECT {select_columns(table_columns(con))} FROM {source_sql}")
+
+def ingest_one(con, f, error_list):
+    """1ファイルだけを読み込んで all_data に追加する。失敗は error_list に記録。"""
+    try:
+        append(con, f"read_csv_auto({sql_list([f])}, encoding='{csv_encoding}', all_varchar=True, "
+                    f"union_by_name=True, filename=True)")
+        return True
+    except Exception as e:
+        # エラーが起きたファイルと内容を記録
+        error_list.append({"file": f, "error": str(e)})
+        return False
+
+def failed_file(error, files):
+    """DuckDB のエラーメッセージ（file = ...）から失敗したファイルを探す。分からなければ None。"""
+    m = RE_ERROR_FILE.search(str(error))
+    if m:
+        name = Path(m.group(1)).as_posix()
+        for f in files:
+            if Path(f).as_posix() == name:
+                return f
+    return None
+
+def ingest_batch(con, batch, options, columns, error_list):
+    """batch を1回の読み込みで取り込む。失敗したら原因のファイルだけを外して残りを読み直す。
+
+    原因のファイルはエラーメッセージから特定し、分からなければバッチを半分ずつに分けて絞り込む。
+    外したファイルは最後に ingest_one で読み、読めなければ error_list に記録する
+    （先に読むと、壊れたファイルの列構成で all_data が作られてしまうため）。
+    """
+    pending, excluded = [batch], []
+    while pending:
+        files = pending.pop()
+        if len(files) == 1:
+            excluded.append(files[0])
+            continue
+        try:
+            con.execute("BEGIN TRANSACTION")
+            append(con, f"read_csv({sql_list(files)}, {options})", columns)
+            con.execute("COMMIT")
+        except Exception as e:
+            con.execute("ROLLBACK")
+            bad = failed_file(e, files)
+            if bad is not None:
+                print(f"  バッチ読み込み失敗のため {os.path.basename(bad)} を外して読み直します: {str(e).splitlines()[0]}")
+                excluded.append(bad)
+                pending.append([f for f in files if f != bad])
+            else:
+                print(f"  バッチ読み込み失敗のため半分ずつ読み直します ({len(files)}件): {str(e).splitlines()[0]}")
+                mid = len(files) // 2
+                pending += [files[mid:], files[:mid]]
+    for f in excluded:
+        ingest_one(con, f, error_list)
+
+def ingest_multi(con, files, error_list, start_time):
+    """ファイル群をバッチ単位の1回の読み込み（DuckDB内で並列）で取り込む。
+
+    列は全て VARCHAR で、先頭ファイルの列（と元ファイル名の filename 列）だけを残す。
+    列名で突き合わせる（union_by_name）ので、列の順番が違うファイルや余分な列があるファイルもそのまま読める。
+    バッチの読み込みが失敗したときは ingest_batch で原因のファイルだけを外して読み直す。
+    """
+    num_files = len(files)
+    # 区切り文字・ヘッダ有無と残す列は先頭ファイルで判定する
+    first = sql_list(files[:1])[1:-1]
+    try:
+        delim, has_header = con.execute(
+            f"SELECT Delimiter, HasHeader FROM sniff_csv({first}, encoding='{csv_encoding}')").fetchone()
+        names = [r[0] for r in con.execute(
+            f"DESCRIBE SELECT * FROM read_csv({first}, encoding='{csv_encoding}', all_varchar=True)").fetchall()]
+    except Exception as e:
+        print(f"  先頭ファイルの形式を判定できないため1ファイルずつ読み込みます: {str(e).splitlines()[0]}")
+        for f in files:
+            ingest_one(con, f, error_list)
+        return
+    columns = table_columns(con) if table_exists(con) else names + ["filename"]
+    options = (f"encoding='{csv_encoding}', delim='{delim}', header={has_header}, all_varchar=True, "
+               f"union_by_name=True, filename=True")
+    done = 0
+    for i in range(0, num_files, batch_size):
+        batch = files[i:i + batch_size]
+        ingest_batch(con, batch, options, columns, error_list)
+        done += len(batch)
+        current_duration = timedelta(seconds=int(time.time() - start_time))
+        print(f"進捗: {done}/{num_files} 完了... (経過時間: {current_duration})")
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def new_part_id():
+    return datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+
+def part_files(part):
+    return glob.glob(os.path.join(dataset_dir, '**', f'part-{part}*.parquet'), recursive=True)
+
+def all_part_files():
+    return glob.glob(os.path.join(dataset_dir, '**', 'part-*.parquet'), recursive=True)
+
+def quote_ident(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def date_expr(src):
+    formats = "[" + ", ".join(f"'{f}'" for f in date_formats) + "]"
+    return f"CAST(try_strptime(trim({quote_ident(src)}), {formats}) AS DATE)"
+
+def invalid_date_rows(con, table):
+    """日付を解釈できない行をファイルごとに数え [(filename, 行数, 値の例)] を返す（typed_select はこれらの行を出力しない）。"""
+    source_cols = [r[0] for r in con.execute(f"DESCRIBE {table}").fetchall()]
+    src = next((c for c in typed_columns["日付"][0] if c in source_cols), None)
+    if src is None:
+        return []
+    return con.execute(f"""
+        SELECT filename, COUNT(*), any_value({quote_ident(src)}) FROM {table}
+        WHERE {date_expr(src)} IS NULL GROUP BY filename ORDER BY filename
+    """).fetchall()
+
+def typed_select(con, table):
+    """all_varchar で読んだテーブルを型付きの列 + year/month に変換する SELECT 文を返す。
+
+    日付を解釈できない行は除く（year/month が NULL のパーティションを作らないため。件数は invalid_date_rows で記録する）。
+    """
+    source_cols = [r[0] for r in con.execute(f"DESCRIBE {table}").fetchall()]
+    select, used = [], {}
+    for out_name, (candidates, col_type) in typed_columns.items():
+        src = next((c for c in candidates if c in source_cols), None)
+        if src is None:
+            continue
+        used[src] = out_name
+        col = f"trim({quote_ident(src)})"
+        if col_type == "DATE":
+            expr = date_expr(src)
+        elif col_type == "VARCHAR":
+            expr = col
+        else:
+            # 桁区切りのカンマを除いてから変換（変換できない値は NULL）
+            expr = f"TRY_CAST(replace({col}, ',', '') AS {col_type})"
+        select.append(f"{expr} AS {quote_ident(out_name)}")
+    if "日付" not in used.values() or "コード" not in used.values():
+        raise ValueError(f"日付・コード列が見つかりません（列: {source_cols}）。typed_columns を確認してください。")
+    select += [quote_ident(c) for c in source_cols if c not in used]
+    return f"""
+        SELECT *, year(日付) AS year, month(日付) AS month
+        FROM (SELECT {', '.join(select)} FROM {table})
+        WHERE 日付 IS NOT NULL
+    """
+
+def write_part(con, select_sql):
+    """SELECT の結果（year, month 列を含む）を新しいパーツとして staging に書き、dataset_dir へ移す。パーツIDを返す。
+
+    台帳に載るまでは孤立パーツ扱い（次回 remove_orphan_parts で消える）なので、途中で落ちても二重計上しない。
+    """
+    part = new_part_id()
+    stage = os.path.join(staging_dir, part)
+    os.makedirs(stage, exist_ok=True)
+    con.execute(f"""
+        COPY ({select_sql} ORDER BY コード, 日付) TO '{Path(stage).as_posix()}' (
+            FORMAT PARQUET, PARTITION_BY (year, month), FILENAME_PATTERN 'part-{part}_{{i}}',
+            COMPRESSION '{parquet_compression}', ROW_GROUP_SIZE {row_group_size}
+        )
+    """)
+    for root, _, names in os.walk(stage):
+        for name in names:
+            dest = os.path.join(dataset_dir, os.path.relpath(os.path.join(root, name), stage))
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            os.replace(os.path.join(root, name), dest)
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    return part
+
+def remove_orphan_parts(con):
+    """台帳に載っていないパーツ（書き出し中・まとめ直し中に中断したもの）を消す。"""
+    known = {r[0] for r in con.execute("SELECT DISTINCT part FROM m.ingested_files").fetchall()}
+    removed = 0
+    for path in all_part_files():
+        part = os.path.basename(path)[len('part-'):].split('.')[0].split('_')[0]
+        if part not in known:
+            os.remove(path)
+            removed += 1
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    if removed:
+        print(f"台帳にない中断パーツを削除しました: {removed} 件")
+
+def plan_ingest(con, files):
+    """台帳と突き合わせて (取り込むファイル, うち内容が変わったファイル, 日時だけ変わったファイル) を返す。
+
+    サイズと更新日時が台帳と同じファイルはハッシュを計算せずに飛ばす。
+    """
+    known = {r[0]: r[1:] for r in con.execute(
+        "SELECT path, size, mtime, sha256 FROM m.ingested_files").fetchall()}
+    targets, changed, touched = [], [], []
+    for f in files:
+        path = Path(f).as_posix()
+        st = os.stat(f)
+        rec = known.get(path)
+        if rec and rec[0] == st.st_size and rec[1] == st.st_mtime:
+            continue
+        sha = file_sha256(f)
+        if rec and rec[2] == sha:
+            touched.append((path, st.st_size, st.st_mtime))
+            continue
+        targets.append((f, path, st.st_size, st.st_mtime, sha))
+        if rec:
+            changed.append(path)
+    return targets, changed, touched
+
+def drop_from_parts(con, paths):
+    """内容が変わったファイルの旧データを、それを含むパーツから取り除く（パーツを書き直す）。"""
+    parts = [r[0] for r in con.execute(
+        "SELECT DISTINCT part FROM m.ingested_files WHERE list_contains(?, path)", [paths]).fetchall()]
+    for part in parts:
+        for f in part_files(part):
+            tmp = f + '.tmp'
+            con.execute(f"""
+                COPY (SELECT * FROM read_parquet('{Path(f).as_posix()}', hive_partitioning=false)
+                      WHERE NOT list_contains(?, filename))
+                TO '{Path(tmp).as_posix()}' (
+                    FORMAT PARQUET, COMPRESSION '{parquet_compression}', ROW_GROUP_SIZE {row_group_size}
+                )
+            """, [paths])
+            os.replace(tmp, f)
+
+def compact(con, force=False):
+    """小さいパーツを1つにまとめる。まとめたパーツ数を返す。"""
+    parts = [r[0] for r in con.execute("SELECT DISTINCT part FROM m.ingested_files ORDER BY part").fetchall()]
+    if not force and len(parts) <= compact_max_parts:
+        return 0
+    sizes = {p: sum(os.path.getsize(f) for f in part_files(p)) for p in parts}
+    small = [p for p in parts if sizes[p] < compact_small_bytes]
+    small_files = [f for p in small for f in part_files(p)]
+    if len(small) < 2 or not small_files:
+        return 0
+    print(f"\nパーツをまとめています: {len(small)} 個...")
+    merged = write_part(con, f"SELECT * FROM read_parquet({sql_list(small_files)}, hive_partitioning=true, union_by_name=true)")
+    con.execute("BEGIN TRANSACTION")
+    con.execute("UPDATE m.ingested_files SET part = ? WHERE list_contains(?, part)", [merged, small])
+    con.execute("COMMIT")
+    for f in small_files:
+        os.remove(f)
+    return len(small)
+
+def write_error_log(error_list):
+    if error_list:
+        import csv
+        with open(error_log_file, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=["file", "error"])
+            writer.writeheader()
+            writer.writerows(error_list)
+        print(f"⚠️ {len(error_list)} 件のファイルでエラーが発生しました。詳細は '{error_log_file}' を確認してください。")
+    else:
+        print("✅ すべてのファイルが正常に処理されました。")
+
+def setup_decoding(con):
+    """encodings 拡張を読み込む。使えず decode_mode が auto なら Python 変換に切り替える。
+
+    auto ではインストール済みの拡張を LOAD するだけにする（オフラインで INSTALL を試すと接続待ちで長く止まるため）。
+    """
+    global csv_encoding
+    if decode_mode != "python":
+        try:
+            if decode_mode == "extension":
+                con.execute("INSTALL encodings;")
+            con.execute("LOAD encodings;")
+            csv_encoding = 'shift_jis'
+            return
+        except Exception as e:
+            if decode_mode == "extension":
+                raise
+            print(f"encodings 拡張が使えないため Python で変換します: {str(e).splitlines()[0]}")
+    csv_encoding = 'utf-8'
+
+def transcode_file(job):
+    """1ファイルを source_encoding から UTF-8 へ逐次変換する（プロセスプールのワーカー）。"""
+    src, dst = job
+    try:
+        with open(src, 'r', encoding=source_encoding, newline='') as fin, \
+                open(dst, 'w', encoding='utf-8', newline='') as fout:
+            while True:
+                chunk = fin.read(decode_chunk_chars)
+                if not chunk:
+                    break
+                fout.write(chunk)
+        return src, dst, None
+    except Exception as e:
+        if os.path.exists(dst):
+            os.remove(dst)
+        return src, None, f"文字コード変換エラー: {e}"
+
+def decode_files(files, error_list):
+    """ファイル群を並列で UTF-8 に変換し [(元ファイル, 変換後ファイル)] を返す。失敗は error_list へ。"""
+    from concurrent.futures import ProcessPoolExecutor
+    os.makedirs(decode_dir, exist_ok=True)
+    jobs = [(f, os.path.join(decode_dir, f"{i:06d}.csv")) for i, f in enumerate(files)]
+    pairs = []
+    with ProcessPoolExecutor(max_workers=decode_workers) as executor:
+        for src, dst, err in executor.map(transcode_file, jobs, chunksize=16):
+            if err:
+                error_list.append({"file": src, "error": err})
+            else:
+                pairs.append((src, dst))
+    return pairs
+
+def ingest(con, files, error_list, start_time):
+    """files を all_data に取り込む。Python 変換時は変換してから読み、filename 列を元のパスに戻す。"""
+    if csv_encoding != 'utf-8':
+        ingest_files(con, files, error_list, start_time)
+        return
+    decode_start = time.time()
+    pairs = decode_files(files, error_list)
+    print(f"UTF-8 変換: {len(pairs)} 件 ({time.time() - decode_start:.1f}秒, {decode_workers} プロセス)")
+    try:
+        decoded_errors = []
+        ingest_files(con, [dst for _, dst in pairs], decoded_errors, start_time)
+        back = {dst: src for src, dst in pairs}
+        error_list.extend({"file": back[e["file"]], "error": e["error"]} for e in decoded_errors)
+        if table_exists(con):
+            con.execute("CREATE OR REPLACE TEMP TABLE decoded_map (tmp VARCHAR, orig VARCHAR)")
+            con.executemany("INSERT INTO decoded_map VALUES (?, ?)",
+                            [(Path(dst).as_posix(), Path(src).as_posix()) for src, dst in pairs])
+            con.execute("UPDATE all_data SET filename = m.orig FROM decoded_map m WHERE all_data.filename = m.tmp")
+    finally:
+        shutil.rmtree(decode_dir, ignore_errors=True)
+
+EMPTY_FILE_ERROR = "データ行がありません（空のファイル、または列名を読み取れないファイル）"
+
+def report_empty_files(con, files, error_list):
+    """データ行が1行も入らなかったファイル（ヘッダのみ等）を error_list に記録する。"""
+    failed = {e["file"] for e in error_list}
+    loaded = set()
+    if table_exists(con):
+        loaded = {r[0] for r in con.execute("SELECT DISTINCT filename FROM all_data").fetchall()}
+    for f in files:
+        if f not in failed and Path(f).as_posix() not in loaded:
+            error_list.append({"file": f, "error": EMPTY_FILE_ERROR})
+
+def ingest_files(con, files, error_list, start_time):
+    """files を ingest_mode の方式で取り込む。空のファイルはどの方式でも同じく error_list に記録する。"""
+    # 0バイトのファイルは読まない（先頭で読むと column0 だけの列構成で all_data が作られてしまうため）
+    empty = {f for f in files if os.path.getsize(f) == 0}
+    error_list.extend({"file": f, "error": EMPTY_FILE_ERROR} for f in files if f in empty)
+    files = [f for f in files if f not in empty]
+    if not files:
+        return
+    ingest_files_by_mode(con, files, error_list, start_time)
+    report_empty_files(con, files, error_list)
+
+def ingest_files_by_mode(con, files, error_list, start_time):
+    if ingest_mode == "multi":
+        ingest_multi(con, files, error_list, start_time)
+    else:
+        num_files = len(files)
+        for i, f in enumerate(files, 1):
+            ingest_one(con, f, error_list)
+            # 100ファイルごとに進捗表示
+            if i % 100 == 0:
+                current_duration = timedelta(seconds=int(time.time() - start_time))
+                print(f"進捗: {i}/{num_files} 完了... (経過時間: {current_duration})")
+
+peak_duckdb_bytes = 0
+
+def configure_memory(con):
+    con.execute(f"SET memory_limit = '{memory_limit}'")
+    con.execute(f"SET temp_directory = '{Path(temp_directory).as_posix()}'")
+    # 挿入順の保持をやめるとソート・書き出しのメモリが減る（並びは write_part の ORDER BY で決める）
+    con.execute("SET preserve_insertion_order = false")
+
+def process_peak_mb():
+    """プロセスのピークメモリ（MB）。取得できなければ None。
+
+    Windows は psutil の peak_wset、それ以外は getrusage の ru_maxrss（どちらも最大値で、現在値ではない）。
+    """
+    if sys.platform == 'win32':
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset / 1024 / 1024
+        except ImportError:
+            return None
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024  # macOS はバイト、Linux は KB 単位
+
+def memory_report(con):
+    """DuckDB の現在の使用量を記録し、表示用の文字列を返す。"""
+    global peak_duckdb_bytes
+    used = con.execute("SELECT COALESCE(SUM(memory_usage_bytes), 0) FROM duckdb_memory()").fetchone()[0]
+    spilled = con.execute("SELECT COALESCE(SUM(temporary_storage_bytes), 0) FROM duckdb_memory()").fetchone()[0]
+    peak_duckdb_bytes = max(peak_duckdb_bytes, used)
+    peak = process_peak_mb()
+    text = f"DuckDB {used / 1024 / 1024:,.0f}MB / 退避 {spilled / 1024 / 1024:,.0f}MB"
+    if peak is not None:
+        text += f" / プロセスのピーク {peak:,.0f}MB"
+    return text
+
+def main_dataset(con, files, start_time, force_compact=False):
+    """台帳にない（または内容が変わった）ファイルだけを読み、新しいパーツとして追記する。"""
+    con.execute(f"ATTACH '{Path(manifest_file).as_posix()}' AS m")
+    con.execute(MANIFEST_SQL)
+    os.makedirs(dataset_dir, exist_ok=True)
+    remove_orphan_parts(con)
+
+    targets, changed, touched = plan_ingest(con, files)
+    if touched:
+        con.executemany("UPDATE m.ingested_files SET size = ?, mtime = ? WHERE path = ?",
+                        [(size, mtime, path) for path, size, mtime in touched])
+    print(f"新規・更新ファイル: {len(targets)} 件 (うち内容変更 {len(changed)} 件 / 取り込み済みでスキップ {len(files) - len(targets)} 件)")
+
+    if changed:
+        drop_from_parts(con, changed)
+
+    # files_per_part 件ずつ 読み込み→パーツ書き出し→台帳更新 を繰り返す（all_data は毎回捨てる）
+    error_list = []
+    total_rows = 0
+    for i in range(0, len(targets), files_per_part):
+        chunk = targets[i:i + files_per_part]
+        chunk_errors = []
+        ingest(con, [t[0] for t in chunk], chunk_errors, start_time)
+        error_list.extend(chunk_errors)
+        if not table_exists(con):
+            continue
+        failed = {Path(e["file"]).as_posix() for e in chunk_errors}
+        bad_dates = invalid_date_rows(con, "all_data")
+        error_list.extend({"file": f, "error": f"日付を解釈できない行 {n} 件を除外しました（例: {sample!r}）"}
+                          for f, n, sample in bad_dates)
+        n_rows = con.execute("SELECT COUNT(*) FROM all_data").fetchone()[0] - sum(n for _, n, _ in bad_dates)
+        part = write_part(con, typed_select(con, "all_data"))
+        now = datetime.now()
+        con.execute("BEGIN TRANSACTION")
+        con.executemany("INSERT OR REPLACE INTO m.ingested_files VALUES (?, ?, ?, ?, ?, ?)",
+                        [(path, size, mtime, sha, part, now)
+                         for _, path, size, mtime, sha in chunk if path not in failed])
+        con.execute("COMMIT")
+        report = memory_report(con)
+        con.execute("DROP TABLE all_data")
+        total_rows += n_rows
+        elapsed = time.time() - start_time
+        print(f"パーツ追加: part-{part} ({min(i + files_per_part, len(targets))}/{len(targets)} ファイル, "
+              f"累計 {total_rows:,} 行, {total_rows / elapsed if elapsed else 0:,.0f} 行/秒) {report}")
+    if targets and not total_rows:
+        print("エラー: 読み込めたファイルがありません。")
+
+    merged = compact(con, force_compact)
+    if merged:
+        print(f"{merged} 個のパーツを1つにまとめました。")
+
+    write_error_log(error_list)
+    n_parts = con.execute("SELECT COUNT(DISTINCT part) FROM m.ingested_files").fetchone()[0]
+    print("="*40)
+    print(f"完了！ 出力先: {dataset_dir} (パーツ数 {n_parts})")
+    print(f"合計経過時間: {timedelta(seconds=int(time.time() - start_time))}")
+    peak = process_peak_mb()
+    print(f"DuckDB 使用量のピーク: {peak_duckdb_bytes / 1024 / 1024:,.0f}MB (上限 {memory_limit})"
+          + (f" / プロセスのピーク: {peak:,.0f}MB" if peak is not None else ""))
+    print("="*40)
 
 def main():
     start_time = time.time()
@@ -26,63 +568,34 @@ def main():
     num_files = len(files)
     print(f"読み込み対象ファイル数: {num_files} 件")
 
-    # 2. DuckDBの準備
-    con = duckdb.connect()
+    # 2. DuckDBの準備（作業用DBはディスク上に置き、メモリ上限を超えた分は temp_directory へ退避）
+    if work_db_file and os.path.exists(work_db_file):
+        os.remove(work_db_file)  # 前回中断時の残り
+    con = duckdb.connect(work_db_file or ':memory:')
     try:
-        con.execute("INSTALL encodings; LOAD encodings;")
-        
-        # 最初に空のParquetファイル（またはテンポラリテーブル）を作るための準備
-        # 1つ目のファイルをベースにテーブルを作成
-        first_file = Path(files[0]).as_posix()
+        configure_memory(con)
+        setup_decoding(con)
         
         print("\n処理を開始します...")
-        
+
+        if output_mode == "dataset":
+            main_dataset(con, files, start_time, force_compact="--compact" in sys.argv)
+            return
+
         # エラー記録用リスト
         error_list = []
-        processed_count = 0
-        
-        # 初回フラグ（初回のみテーブル作成、2回目以降は挿入）
-        first_run = True
+        ingest(con, files, error_list, start_time)
 
-        for f in files:
-            file_path = Path(f).as_posix()
-            processed_count += 1
-            
-            try:
-                # 1ファイルずつ読み込んで一時テーブル（all_data）に追加
-                if first_run:
-                    con.execute(f"""
-                        CREATE TABLE all_data AS 
-                        SELECT * FROM read_csv_auto('{file_path}', encoding='shift_jis', all_varchar=True);
-                    """)
-                    first_run = False
-                else:
-                    con.execute(f"""
-                        INSERT INTO all_data 
-                        SELECT * FROM read_csv_auto('{file_path}', encoding='shift_jis', all_varchar=True);
-                    """)
-                
-                # 100ファイルごとに進捗表示
-                if processed_count % 100 == 0:
-                    current_duration = timedelta(seconds=int(time.time() - start_time))
-                    print(f"進捗: {processed_count}/{num_files} 完了... (経過時間: {current_duration})")
-
-            except Exception as e:
-                # エラーが起きたファイルと内容を記録
-                error_list.append({"file": f, "error": str(e)})
+        if not table_exists(con):
+            print("エラー: 読み込めたファイルがありません。")
+            return
 
         # 3. まとめてParquetに出力
         print("\nParquetファイルに書き出し中...")
         con.execute(f"COPY all_data TO '{output_file}' (FORMAT PARQUET);")
         
         # 4. エラーログの保存
-        if error_list:
-            import pandas as pd
-            errors_df = pd.DataFrame(error_list)
-            errors_df.to_csv(error_log_file, index=False, encoding='utf-8-sig')
-            print(f"⚠️ {len(error_list)} 件のファイルでエラーが発生しました。詳細は '{error_log_file}' を確認してください。")
-        else:
-            print("✅ すべてのファイルが正常に処理されました。")
+        write_error_log(error_list)
 
         # 最終統計
         end_time = time.time()
@@ -96,6 +609,11 @@ def main():
         print(f"\n❌ 致命的なエラーが発生しました:\n{e}")
     finally:
         con.close()
+        if work_db_file:
+            for path in (work_db_file, work_db_file + '.wal'):
+                if os.path.exists(path):
+                    os.remove(path)
+        shutil.rmtree(temp_directory, ignore_errors=True)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
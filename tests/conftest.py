@@ -0,0 +1,5 @@
+import os
+import sys
+
+# スクリプトはリポジトリ直下に置いてあるので、そのまま import できるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,50 @@
+import sqlite3
+
+import fts_tokenize
+import index_scripts_search
+import tdnet_pdf_text
+
+
+def test_cjk_bigrams_and_words():
+    assert fts_tokenize.tokenize("2026年3月期 決算短信 EBITDA") == [
+        "2026", "年", "3", "月期", "決算", "算短", "短信", "ebitda"]
+    assert fts_tokenize.tokenize("ｶﾌﾞ 株") == ["ｶﾌ", "ﾌﾞ", "株"]
+
+
+def test_identifier_splitting():
+    assert fts_tokenize.tokenize("extract_info ThreadPoolExecutor", split_identifiers=True) == [
+        "extractinfo", "extract", "info", "threadpoolexecutor", "thread", "pool", "executor"]
+    assert fts_tokenize.tokenize("ThreadPool", split_identifiers=True, for_query=True) == ["thread", "pool"]
+    # 分割しない側（PDF本文）は英数字をそのまま小文字にする
+    assert fts_tokenize.tokenize("extract_info") == ["extract_info"]
+
+
+def test_match_query():
+    assert fts_tokenize.build_match_query("決算短信 売 EBITDA*") == '"決算 算短 短信" AND "売"* AND "ebitda"*'
+    assert fts_tokenize.build_match_query("ThreadPool", split_identifiers=True) == '"thread pool"'
+    assert fts_tokenize.build_match_query("* ?! --") == ""
+
+
+def test_both_indexes_use_the_shared_tokenizer():
+    assert tdnet_pdf_text.tokenize is fts_tokenize.tokenize
+    assert tdnet_pdf_text.build_match_query is fts_tokenize.build_match_query
+    assert index_scripts_search.tokenize("extract_info") == ["extractinfo", "extract", "info"]
+
+
+def test_fts5_round_trip():
+    idx = sqlite3.connect(":memory:")
+    idx.execute("CREATE VIRTUAL TABLE t USING fts5(body)")
+    docs = ["2026年3月期 第3四半期決算短信", "業績予想の修正に関するお知らせ", "def extract_info(path): ..."]
+    idx.executemany("INSERT INTO t (rowid, body) VALUES (?, ?)",
+                    [(i, " ".join(fts_tokenize.tokenize(d, split_identifiers=True))) for i, d in enumerate(docs)])
+
+    def hits(q):
+        return [r[0] for r in idx.execute("SELECT rowid FROM t WHERE t MATCH ? ORDER BY rowid",
+                                          [fts_tokenize.build_match_query(q, split_identifiers=True)])]
+    assert hits("決算短信") == [0]
+    assert hits("四半期 2026") == [0]
+    assert hits("修正") == [1]
+    assert hits("業") == [1]
+    assert hits("info") == [2]
+    assert hits("extract_info") == [2]
+    assert hits("短信 修正") == []
@@ -0,0 +1,107 @@
+import sys
+import types
+
+import pytest
+
+import index_scripts
+
+
+class Stop(Exception):
+    pass
+
+
+@pytest.fixture
+def watch_env(monkeypatch):
+    """watchdog がない環境でも _watch_events を動かせるように、最小限の代わりを入れる。"""
+    events = types.ModuleType("watchdog.events")
+    events.FileSystemEventHandler = object
+    monkeypatch.setitem(sys.modules, "watchdog", types.ModuleType("watchdog"))
+    monkeypatch.setitem(sys.modules, "watchdog.events", events)
+    monkeypatch.setattr(index_scripts, "POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(index_scripts, "DEBOUNCE_SEC", 0)
+    calls = {"run": [], "poll": []}
+
+    def fake_poll(retry=False):
+        calls["poll"].append(retry)
+        raise Stop()
+    monkeypatch.setattr(index_scripts, "_watch_poll", fake_poll)
+    return calls
+
+
+def make_observer(alive_checks):
+    class FakeObserver:
+        def __init__(self):
+            self.checks = 0
+            self.stopped = False
+        def schedule(self, handler, path, recursive):
+            self.handler = handler
+        def start(self):
+            pass
+        def is_alive(self):
+            self.checks += 1
+            return self.checks <= alive_checks
+        def stop(self):
+            self.stopped = True
+        def join(self):
+            pass
+    return FakeObserver
+
+
+def test_failed_run_is_retried_on_a_timer(watch_env, monkeypatch):
+    results = iter([False, False, True])
+
+    def fake_run(scan=None):
+        ok = next(results, True)
+        watch_env["run"].append(ok)
+        return ok
+    monkeypatch.setattr(index_scripts, "_run_safely", fake_run)
+    with pytest.raises(Stop):
+        index_scripts._watch_events(make_observer(alive_checks=10), retry=True)
+    # 変更通知がなくても、成功するまでやり直し、成功後はやめる
+    assert watch_env["run"] == [False, False, True]
+    # observer が止まったらポーリングに切り替え、止まっていた間の変更を拾うため1回 run させる
+    assert watch_env["poll"] == [True]
+
+
+def test_no_retry_when_the_first_run_succeeded(watch_env, monkeypatch):
+    monkeypatch.setattr(index_scripts, "_run_safely", lambda scan=None: watch_env["run"].append(True) or True)
+    with pytest.raises(Stop):
+        index_scripts._watch_events(make_observer(alive_checks=5), retry=False)
+    assert watch_env["run"] == []
+
+
+def test_observer_that_cannot_start_falls_back_to_polling(watch_env):
+    class Broken:
+        def schedule(self, handler, path, recursive):
+            raise FileNotFoundError(path)
+    with pytest.raises(Stop):
+        index_scripts._watch_events(Broken, retry=False)
+    assert watch_env["poll"] == [True]
+
+
+def test_watch_passes_the_initial_result(monkeypatch):
+    seen = {}
+    monkeypatch.setattr(index_scripts, "WATCH_MODE", "auto")
+    monkeypatch.setattr(index_scripts, "_run_safely", lambda scan=None: False)
+    observers = types.ModuleType("watchdog.observers")
+    observers.Observer = type("Observer", (), {})
+    monkeypatch.setitem(sys.modules, "watchdog", types.ModuleType("watchdog"))
+    monkeypatch.setitem(sys.modules, "watchdog.observers", observers)
+    monkeypatch.setattr(index_scripts, "_watch_events", lambda cls, retry=False: seen.update(retry=retry))
+    index_scripts.watch()
+    assert seen == {"retry": True}
+
+
+def test_change_event_runs_once(watch_env, monkeypatch):
+    monkeypatch.setattr(index_scripts, "_run_safely", lambda scan=None: watch_env["run"].append(True) or True)
+    base = make_observer(alive_checks=5)
+
+    class EventObserver(base):
+        def start(self):
+            event = types.SimpleNamespace(event_type="modified", is_directory=False, src_path="/src/a.py")
+            self.handler.on_any_event(event)
+            self.handler.on_any_event(types.SimpleNamespace(event_type="opened", is_directory=False,
+                                                            src_path="/src/b.py"))
+    with pytest.raises(Stop):
+        index_scripts._watch_events(EventObserver, retry=False)
+    assert watch_env["run"] == [True]
@@ -0,0 +1,72 @@
+import importlib.util
+import os
+
+import duckdb
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def ingest(monkeypatch):
+    # test.py は標準ライブラリの test パッケージと名前が重なるので別名で読む
+    spec = importlib.util.spec_from_file_location("stock_ingest", os.path.join(ROOT, "test.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    monkeypatch.setattr(module, "csv_encoding", "utf-8")
+    return module
+
+
+def write(path, text):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return str(path)
+
+
+@pytest.fixture
+def files(tmp_path):
+    return [
+        write(tmp_path / "a.csv", "日付,コード,終値\n2024/01/04,7203,100\n2024/01/04,6758,200\n"),
+        write(tmp_path / "b.csv", "日付,コード,終値,備考\n2024/01/05,7203,101,権利落ち\n"),
+        write(tmp_path / "c.csv", "コード,日付,終値\n6758,2024/01/05,201\n"),
+        write(tmp_path / "empty.csv", ""),
+        write(tmp_path / "header.csv", "日付,コード,終値\n"),
+    ]
+
+
+@pytest.mark.parametrize("mode", ["per_file", "multi"])
+def test_modes_load_the_same_rows(ingest, files, monkeypatch, mode):
+    monkeypatch.setattr(ingest, "ingest_mode", mode)
+    con = duckdb.connect()
+    errors = []
+    ingest.ingest_files(con, files, errors, 0)
+    assert ingest.table_columns(con) == ["日付", "コード", "終値", "filename"]
+    rows = con.execute("SELECT 日付, コード, 終値 FROM all_data ORDER BY 日付, コード").fetchall()
+    assert rows == [("2024/01/04", "6758", "200"), ("2024/01/04", "7203", "100"),
+                    ("2024/01/05", "6758", "201"), ("2024/01/05", "7203", "101")]
+    # 余分な列（備考）は読み捨て、空のファイルはどちらの方式でも同じエラーになる
+    assert sorted((os.path.basename(e["file"]), e["error"]) for e in errors) == [
+        ("empty.csv", ingest.EMPTY_FILE_ERROR), ("header.csv", ingest.EMPTY_FILE_ERROR)]
+
+
+def test_multi_drops_only_the_broken_file(ingest, files, tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "ingest_mode", "multi")
+    broken = tmp_path / "broken.csv"
+    broken.write_bytes("日付,コード,終値\n2024/01/06,7203,102\n".encode("utf-8") + b"\xff\xfe\x00bad\n")
+    broken = str(broken)
+    con = duckdb.connect()
+    errors = []
+    ingest.ingest_files(con, files[:3] + [broken], errors, 0)
+    assert con.execute("SELECT COUNT(*) FROM all_data").fetchone()[0] == 4
+    assert [os.path.basename(e["file"]) for e in errors] == ["broken.csv"]
+
+
+def test_typed_select_skips_unparseable_dates(ingest):
+    con = duckdb.connect()
+    con.execute("""CREATE TABLE all_data AS SELECT * FROM (VALUES
+        ('2024/01/04', '7203', '1,000', 'a.csv'), ('不明', '7203', '1', 'a.csv'), ('20240105', '6758', '', 'b.csv'))
+        t(日付, コード, 終値, filename)""")
+    rows = con.execute(f"SELECT 日付, コード, 終値, year, month FROM ({ingest.typed_select(con, 'all_data')}) ORDER BY 日付").fetchall()
+    assert [(str(d), c, v, y, m) for d, c, v, y, m in rows] == [
+        ("2024-01-04", "7203", 1000.0, 2024, 1), ("2024-01-05", "6758", None, 2024, 1)]
+    assert ingest.invalid_date_rows(con, "all_data") == [("a.csv", 1, "不明")]
@@ -0,0 +1,85 @@
+import importlib.util
+import os
+import threading
+from datetime import date
+
+import duckdb
+import pyarrow as pa
+import pytest
+
+import stock_prices
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def write_part(dataset, name, rows):
+    con = duckdb.connect()
+    con.execute("CREATE TABLE px (日付 DATE, コード VARCHAR, 終値 DOUBLE)")
+    con.executemany("INSERT INTO px VALUES (?, ?, ?)", rows)
+    con.execute(f"COPY (SELECT *, year(日付) AS year, month(日付) AS month FROM px) TO '{dataset}' "
+                f"(FORMAT PARQUET, PARTITION_BY (year, month), FILENAME_PATTERN 'part-{name}_{{i}}', OVERWRITE_OR_IGNORE)")
+    con.close()
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    stock_prices.clear_cache()
+    path = (tmp_path / "stock_data").as_posix()
+    write_part(path, "a", [(date(2024, 1, 4), "7203", 100.0), (date(2024, 2, 1), "7203", 110.0)])
+    yield path
+    stock_prices.clear_cache()
+
+
+def test_partition_pruning_and_code_filter(dataset):
+    t = stock_prices.load_prices(["72030"], "2024-02-01", "2024-02-29", ["日付", "終値"], dataset=dataset)
+    assert t.to_pylist() == [{"日付": date(2024, 2, 1), "終値": 110.0}]
+    assert len(stock_prices.partition_files("2024-02-01", "2024-02-29", dataset)) == 1
+
+
+def test_cache_is_reloaded_after_new_parts(dataset):
+    fields = ["日付", "コード", "終値"]
+    assert stock_prices.load_prices(["7203"], dataset=dataset, fields=fields).num_rows == 2
+    assert stock_prices.load_prices(["7203"], dataset=dataset, fields=fields).num_rows == 2
+    assert stock_prices.cache_info()["hits"] == 1
+    write_part(dataset, "b", [(date(2024, 1, 5), "7203", 101.0)])
+    assert stock_prices.load_prices(["7203"], dataset=dataset, fields=fields).num_rows == 3
+    # 古い世代の結果は残さない
+    assert stock_prices.cache_info()["entries"] == 1
+
+
+def test_no_data_returns_declared_schema(dataset):
+    t = stock_prices.load_prices(["7203"], "2030-01-01", "2030-12-31", ["日付", "コード", "終値", "出来高", "備考"],
+                                 dataset=dataset)
+    assert t.num_rows == 0
+    assert [(f.name, f.type) for f in t.schema] == [
+        ("日付", pa.date32()), ("コード", pa.string()), ("終値", pa.float64()), ("出来高", pa.int64()),
+        ("備考", pa.string())]
+    # データがあるときと同じ型
+    full = stock_prices.load_prices(["7203"], fields=["日付", "コード", "終値"], dataset=dataset)
+    assert full.schema == t.select(["日付", "コード", "終値"]).schema
+
+
+def test_concurrent_loads(dataset):
+    results, errors = [], []
+
+    def worker(code):
+        try:
+            results.append(stock_prices.load_prices([code], dataset=dataset, fields=["日付", "終値"]).num_rows)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=("7203" if i % 2 else "6758",)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors and sorted(results) == [0] * 4 + [2] * 4
+
+
+def test_field_types_match_the_ingest_script():
+    spec = importlib.util.spec_from_file_location("stock_ingest", os.path.join(ROOT, "test.py"))
+    ingest = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(ingest)
+    assert {name: t for name, (_, t) in ingest.typed_columns.items()} == \
+        {name: stock_prices.FIELD_TYPES[name] for name in ingest.typed_columns}
+    assert ingest.dataset_dir == stock_prices.DATASET_DIR
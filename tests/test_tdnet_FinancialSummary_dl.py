@@ -0,0 +1,73 @@
+import heapq
+import threading
+
+import pytest
+
+import tdnet_FinancialSummary_dl as dl
+
+
+def task(row, rtype=None, code="", fname=None, p=True, x=True):
+    return {"row": row, "種別": rtype, "コード": code, "fname": fname or f"{row}_file",
+            "p_url": f"http://x/{row}.pdf" if p else None,
+            "x_url": f"http://x/{row}.zip" if x else None}
+
+
+def job_order(tasks):
+    heap = dl.build_jobs(tasks)
+    return [(j["row"], j["kind"]) for j in (heapq.heappop(heap)[-1] for _ in range(len(heap)))]
+
+
+def test_task_priority(monkeypatch):
+    monkeypatch.setattr(dl, "WATCHLIST_CODES", {"7203"})
+    assert dl.task_priority(task(1, "決算短信")) == 100
+    assert dl.task_priority(task(1, None)) == 0
+    # シート由来（種別なし）はファイル名の (種別) から推定
+    assert dl.task_priority(task(1, None, fname="1_20260128_1530_(業績予想)_x")) == 60
+    assert dl.task_priority(task(1, "決算説明", code="72030")) == 40 + dl.PRIORITY_WATCHLIST
+
+
+def test_build_jobs_order(monkeypatch):
+    monkeypatch.setattr(dl, "NEWEST_FIRST", True)
+    monkeypatch.setattr(dl, "PDF_FIRST", True)
+    tasks = [task(1, "決算短信"), task(2, None), task(3, "決算短信", x=False), task(4, None, p=False)]
+    assert job_order(tasks) == [(3, "p"), (1, "p"), (1, "x"), (2, "p"), (4, "x"), (2, "x")]
+
+    monkeypatch.setattr(dl, "NEWEST_FIRST", False)
+    monkeypatch.setattr(dl, "PDF_FIRST", False)
+    assert job_order(tasks) == [(1, "x"), (1, "p"), (3, "p"), (2, "x"), (4, "x"), (2, "p")]
+
+
+def test_build_jobs_paths():
+    heap = dl.build_jobs([{"row": 1, "fname": "1_a.PDF", "p_url": "http://x/1.pdf",
+                           "x_url": "http://x/1.zip"}])
+    paths = sorted(item[-1]["path"] for item in heap)
+    assert paths[0].endswith("1_a.PDF") and paths[1].endswith("1_a.zip")
+    # URLが http で始まらないものはジョブにしない
+    assert dl.build_jobs([task(1) | {"p_url": "-", "x_url": None}]) == []
+
+
+@pytest.mark.parametrize("max_jobs", [None, 3])
+def test_run_downloads(monkeypatch, max_jobs):
+    done = []
+    lock = threading.Lock()
+
+    def fake_download(url, path):
+        with lock:
+            done.append(url)
+        return "成功"
+
+    monkeypatch.setattr(dl, "download_file", fake_download)
+    monkeypatch.setattr(dl, "MAX_WORKERS", 1)
+    tasks = [task(1, "決算短信"), task(2, None), task(3, "業績予想")]
+    results = dl.run_downloads(tasks, max_jobs=max_jobs)
+
+    if max_jobs is None:
+        assert len(done) == 6
+        assert {r["row"] for r in results} == {1, 2, 3}
+        assert all(r["p_msg"].startswith("成功") and r["x_msg"].startswith("成功") for r in results)
+    else:
+        # 並列数1なので優先度順に3件だけ実行し、残りは持ち越す
+        assert done == ["http://x/1.pdf", "http://x/1.zip", "http://x/3.pdf"]
+        by_row = {r["row"]: r for r in results}
+        assert set(by_row) == {1, 3}
+        assert by_row[3]["x_msg"] is None
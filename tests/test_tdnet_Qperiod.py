@@ -0,0 +1,73 @@
+from datetime import date
+
+import tdnet_Qperiod as qp
+import tdnet_worklist
+
+
+def test_report_type_is_one_of_the_legacy_five():
+    assert qp.extract_report_type("2026年3月期 決算短信〔日本基準〕(連結)") == "決算短信"
+    assert qp.extract_report_type("業績予想の修正に関するお知らせ") == "業績予想"
+    # 複数含む場合は従来どおりキーワードの並び順で決まる
+    assert qp.extract_report_type("決算短信及び業績予想の修正") == "業績予想"
+    # タクソノミーのカテゴリ（自己株式・配当など）は種別にはならない
+    assert qp.extract_report_type("自己株式の取得状況に関するお知らせ") is None
+    assert qp.extract_report_type("剰余金の配当に関するお知らせ") is None
+    assert qp.extract_report_type("") is None
+    assert qp.extract_report_type(None) is None
+
+
+def test_categories_carry_the_taxonomy():
+    assert qp.extract_report_categories("自己株式の取得状況に関するお知らせ") == ["自己株式取得結果"]
+    cats = qp.extract_report_categories("決算短信及び業績予想の修正")
+    assert cats[:2] == ["業績予想", "決算短信"]
+
+
+def test_batch_engine_matches_classify_title():
+    titles = ["2026年3月期 第3四半期決算短信", "自己株式の取得状況に関するお知らせ",
+              "令和8年3月期 決算説明資料", "中期経営計画の策定について", None, ""]
+    assert qp.classify_titles(titles) == [qp.classify_title(t) for t in titles]
+    assert qp.classify_titles(titles)[1][0] == ""
+
+
+def test_reset_report_types_reverts_taxonomy_rows():
+    con = tdnet_worklist.connect(":memory:")
+    tdnet_worklist.save_classification(con, [
+        (1, "決算短信", date(2026, 3, 31), "4Q", "決算短信"),
+        (2, "自己株式", None, "", "自己株式"),
+        (3, "配当", None, "", "配当"),
+        (4, None, None, "", None),
+    ])
+    con.executemany("INSERT INTO disclosure_file (連番, ファイル名, pdfDL) VALUES (?, ?, ?)", [
+        (1, "1_(決算短信)", None),
+        (2, "2_(自己株式)", None),
+        (3, "3_(配当)", "成功"),
+    ])
+    n_class, n_file = tdnet_worklist.reset_report_types(con, qp.REPORT_TYPE_KEYWORDS)
+    assert (n_class, n_file) == (2, 1)
+    assert con.execute("SELECT 連番, 種別 FROM disclosure_class ORDER BY 連番").fetchall() == [
+        (1, "決算短信"), (2, None), (3, None), (4, None)]
+    # DL済みのファイル名はそのまま、未DLの行だけ作り直し対象にする
+    assert con.execute("SELECT 連番, ファイル名 FROM disclosure_file ORDER BY 連番").fetchall() == [
+        (1, "1_(決算短信)"), (2, None), (3, "3_(配当)")]
+
+
+def test_classification_cache_round_trip(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.sqlite")
+    titles = ["2026年3月期 第3四半期決算短信", "２０２６年３月期　第３四半期決算短信", "配当予想の修正", None]
+    cache = qp.ClassificationCache(path)
+    assert qp.classify_titles_cached(titles, cache) == qp.classify_titles(titles)
+    # 全角・空白違いは正規化後に同じキーになる
+    assert cache.misses == 2
+    cache.close()
+
+    cache = qp.ClassificationCache(path)
+    assert qp.classify_titles_cached(titles, cache) == qp.classify_titles(titles)
+    assert (cache.disk_hits, cache.misses) == (2, 0)
+    cache.close()
+
+    # 判定規則の世代が変わったら古い結果は使わない
+    monkeypatch.setattr(qp, "CLASSIFIER_VERSION", "test")
+    cache = qp.ClassificationCache(path)
+    qp.classify_titles_cached(titles, cache)
+    assert (cache.disk_hits, cache.misses) == (0, 2)
+    cache.close()
@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+import tdnet_blobstore
+
+
+class FakeResponse:
+    def __init__(self, body: bytes, status_code: int = 200):
+        self.body = body
+        self.status_code = status_code
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i:i + chunk_size]
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(tdnet_blobstore, "BLOB_DIR", str(tmp_path / "blobs"))
+    monkeypatch.setattr(tdnet_blobstore, "_con", None)
+    monkeypatch.setattr(tdnet_blobstore, "_url_locks", {})
+    monkeypatch.setattr(tdnet_blobstore, "_link_counts", {})
+    bodies = {}
+    calls = []
+
+    def fake_get(url, timeout=None, headers=None, stream=False):
+        calls.append(url)
+        return FakeResponse(*bodies[url])
+
+    monkeypatch.setattr(tdnet_blobstore.requests, "get", fake_get)
+    yield bodies, calls
+    if tdnet_blobstore._con is not None:
+        tdnet_blobstore._con.close()
+
+
+def test_same_content_is_stored_once(store, tmp_path):
+    bodies, calls = store
+    bodies["http://x/a.pdf"] = (b"%PDF same",)
+    bodies["http://x/b.pdf"] = (b"%PDF same",)
+
+    a, b = tmp_path / "a.pdf", tmp_path / "b.pdf"
+    assert tdnet_blobstore.download_to("http://x/a.pdf", str(a)) == "成功"
+    assert tdnet_blobstore.download_to("http://x/b.pdf", str(b)) == "成功(重複)"
+    assert a.read_bytes() == b.read_bytes() == b"%PDF same"
+    assert os.path.samefile(a, b)
+    assert tdnet_blobstore.stats() == (2, 1)
+
+    # 既知のURLはネットワークに出ない
+    assert tdnet_blobstore.download_to("http://x/a.pdf", str(a)) == "成功(重複)"
+    assert calls == ["http://x/a.pdf", "http://x/b.pdf"]
+
+
+def test_failures_leave_no_blob(store, tmp_path):
+    bodies, _ = store
+    bodies["http://x/404.pdf"] = (b"", 404)
+    bodies["http://x/empty.pdf"] = (b"",)
+
+    assert tdnet_blobstore.download_to("http://x/404.pdf", str(tmp_path / "n.pdf")) == "失敗: ステータス 404"
+    assert tdnet_blobstore.download_to("http://x/empty.pdf", str(tmp_path / "e.pdf")) == "失敗: 空ファイル"
+    assert tdnet_blobstore.download_to("ftp://x/a.pdf", str(tmp_path / "f.pdf")) == "失敗: URL不正"
+    assert tdnet_blobstore.stats() == (0, 0)
+    assert not [n for n in os.listdir(tdnet_blobstore.BLOB_DIR) if n.endswith(".part")]
+
+
+def test_link_falls_back_to_copy(store, tmp_path, monkeypatch, capsys):
+    bodies, _ = store
+    bodies["http://x/a.pdf"] = (b"%PDF a",)
+
+    def no_link(*args):
+        raise OSError("not supported")
+
+    monkeypatch.setattr(tdnet_blobstore.os, "link", no_link)
+    monkeypatch.setattr(tdnet_blobstore.os, "symlink", no_link)
+    a = tmp_path / "a.pdf"
+    assert tdnet_blobstore.download_to("http://x/a.pdf", str(a)) == "成功"
+    assert a.read_bytes() == b"%PDF a"
+    assert tdnet_blobstore.link_counts() == {"copy": 1}
+    assert "コピーしました" in capsys.readouterr().out
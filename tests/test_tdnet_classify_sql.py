@@ -0,0 +1,68 @@
+from datetime import date
+
+import duckdb
+import pytest
+
+import tdnet_Qperiod as qp
+import tdnet_classify_sql
+
+TITLES = [
+    "2026年3月期 決算短信〔日本基準〕(連結)",
+    "２０２６年３月期 第２四半期決算短信〔日本基準〕(連結)",
+    "2026年3月期 第３四半期決算短信",
+    "2026年3月期 第三四半期 決算説明資料",
+    "2026年3月期 第 1 四 半 期決算短信",
+    "2026年3月期 3Q 決算説明会資料",
+    "2026年3月期 Q2 決算補足資料",
+    "２０２６年３月期 ２ｑ 決算説明資料",
+    "2026年3月期 通期業績予想の修正に関するお知らせ",
+    "2026年3月期 第1四半期決算短信及び通期業績予想の修正",
+    "2025年12月期 中間期決算短信",
+    "2025年12月期 上期 業績予想の修正",
+    "2025年12月期 下期の見通し",
+    "令和元年12月期 決算短信",
+    "令和8年3月期 事業計画及び成長可能性に関する事項",
+    "平成30年3月期 中期経営計画",
+    "2026年13月期 決算短信",
+    "自己株式の取得状況に関するお知らせ",
+    "剰余金の配当に関するお知らせ",
+    "代表取締役の異動に関するお知らせ",
+    "",
+]
+
+
+@pytest.fixture
+def con():
+    con = duckdb.connect()
+    tdnet_classify_sql.register(con)
+    yield con
+    con.close()
+
+
+def test_sql_macros_match_python(con):
+    assert tdnet_classify_sql.check_parity(con, TITLES) == []
+
+
+@pytest.mark.parametrize("title, expected", [
+    ("２０２６年３月期 第２四半期決算短信〔日本基準〕(連結)", ("決算短信", date(2026, 3, 31), "2Q")),
+    ("２０２６年３月期 ２ｑ 決算説明資料", ("決算説明", date(2026, 3, 31), "2Q")),
+    ("2026年3月期 通期業績予想の修正に関するお知らせ", ("業績予想", date(2026, 3, 31), "4Q")),
+    ("2026年3月期 第1四半期決算短信及び通期業績予想の修正", ("業績予想", date(2026, 3, 31), "1Q")),
+    ("令和元年12月期 決算短信", ("決算短信", date(2019, 12, 31), "4Q")),
+    ("2026年13月期 決算短信", ("決算短信", None, None)),
+    ("自己株式の取得状況に関するお知らせ", (None, None, None)),
+])
+def test_sql_and_python_expected_values(con, title, expected):
+    rtype, period, q = con.execute("SELECT c.種別, c.決算期末, c.quarter FROM (SELECT classify(?) AS c)",
+                                   [title]).fetchone()
+    assert (rtype, period, q) == expected
+    py_rtype, py_period, py_q = qp.classify_title(title)
+    assert (py_rtype or None, date(*py_period) if py_period else None, py_q or None) == expected
+    assert qp.extract_report_type(title) == expected[0]
+    assert qp.extract_fiscal_period(title) == ((expected[1].year, expected[1].month) if expected[1] else None)
+
+
+def test_sql_categories_match_taxonomy(con):
+    rows = con.execute("SELECT tdnet_report_categories(tdnet_normalize(unnest(?::VARCHAR[])))",
+                       [TITLES]).fetchall()
+    assert [r[0] or [] for r in rows] == [qp.extract_report_categories(t) for t in TITLES]
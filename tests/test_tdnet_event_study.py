@@ -0,0 +1,71 @@
+import os
+import sys
+from datetime import date, timedelta
+
+import duckdb
+import pytest
+
+import tdnet_event_study as es
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    # 2銘柄 × 2024/1 の毎日。7203 は 1/7 から毎日 +1%、6758 は横ばい
+    days = [date(2024, 1, 4) + timedelta(days=i) for i in range(20)]
+    rows = []
+    for i, d in enumerate(days):
+        rows.append(("7203", d, 100.0 * (1.01 ** max(0, i - 2))))
+        rows.append(("6758", d, 50.0))
+    con = duckdb.connect()
+    con.execute("CREATE TABLE px (コード VARCHAR, 日付 DATE, 終値 DOUBLE)")
+    con.executemany("INSERT INTO px VALUES (?, ?, ?)", rows)
+    out = tmp_path / "stock_data"
+    con.execute(f"COPY (SELECT *, year(日付) AS year, month(日付) AS month FROM px) TO '{out.as_posix()}' "
+                "(FORMAT PARQUET, PARTITION_BY (year, month))")
+    con.close()
+    return str(out)
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "tdnet.duckdb")
+    con = duckdb.connect(path)
+    con.execute("CREATE TABLE disclosure_info (連番 BIGINT, 公開日 VARCHAR, 時刻 VARCHAR, コード VARCHAR, 表題 VARCHAR)")
+    con.executemany("INSERT INTO disclosure_info VALUES (?, ?, ?, ?, ?)", [
+        (1, "2024-01-06", "2024-01-06 12:00:00", "72030", "決算短信"),
+        (2, "2024-01-06", "2024-01-06 15:30:00", "72030", "業績予想の修正"),
+    ])
+    con.close()
+    return path
+
+
+def test_after_close_disclosure_moves_to_next_day(db, dataset):
+    con = duckdb.connect(db, read_only=True)
+    es.run(con, date(2024, 1, 1), date(2024, 1, 31), None, [(0, 0), (0, 1)], dataset)
+    rows = con.execute("SELECT 連番, コード, event_date, car_p0_p0 FROM event_car ORDER BY 連番").fetchall()
+    con.close()
+    assert [(r[0], r[1], r[2]) for r in rows] == [(1, "7203", date(2024, 1, 6)), (2, "7203", date(2024, 1, 7))]
+    # 7203 のリターン r と市場平均 r/2 の差 = r/2
+    assert rows[0][3] == pytest.approx(0.0)
+    assert rows[1][3] == pytest.approx(0.01 / 2)
+
+
+def test_types_without_disclosure_class_is_a_usage_error(db, dataset, monkeypatch, capsys):
+    monkeypatch.setattr(sys, "argv", ["tdnet_event_study.py", "--start", "2024-01-01", "--end", "2024-01-31",
+                                      "--types", "決算短信", "--db", db, "--prices", dataset])
+    with pytest.raises(SystemExit) as exc:
+        es.main()
+    assert exc.value.code == 2
+    assert "disclosure_class" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize("name", ["o'brien.csv", "o'brien.parquet"])
+def test_out_path_with_quote(db, dataset, tmp_path, monkeypatch, name):
+    out = str(tmp_path / name)
+    monkeypatch.setattr(sys, "argv", ["tdnet_event_study.py", "--start", "2024-01-01", "--end", "2024-01-31",
+                                      "--db", db, "--prices", dataset, "--out", out])
+    es.main()
+    reader = "read_parquet" if name.endswith(".parquet") else "read_csv"
+    con = duckdb.connect()
+    assert con.execute(f"SELECT count(*) FROM {reader}(?)", [out]).fetchone()[0] == 2
+    con.close()
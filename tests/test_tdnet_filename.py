@@ -0,0 +1,66 @@
+from datetime import date
+
+import duckdb
+import pytest
+
+import tdnet_filename
+import tdnet_worklist
+
+# シートの数式（連番+公開日+時刻+(種別)+決算月+4Q+コード+会社名+表題）で作られ、
+# 従来の tdnet_ngword で禁則文字を置換したファイル名
+ROWS = [
+    ((100, "2026-01-28", "2026-01-28 15:30:00", "7203", "トヨタ自動車",
+      "2026年3月期 第3四半期決算短信〔日本基準〕(連結)"),
+     ("決算短信", date(2026, 3, 31), "3Q"),
+     "100_20260128_1530_(決算短信)_202603_3Q_7203_トヨタ自動車_2026年3月期 第3四半期決算短信〔日本基準〕(連結)"),
+    ((101, "2026-01-28", "2026-01-28 15:00:00", "6758", "ソニーグループ",
+      "業績予想の修正について(2026/3期: 通期?)"),
+     ("業績予想", date(2026, 3, 31), "4Q"),
+     "101_20260128_1500_(業績予想)_202603_4Q_6758_ソニーグループ_業績予想の修正について(2026／3期： 通期？)"),
+    ((102, "2026-02-02", "2026-02-02 09:05:00", "130A", " ＶＥＲＩＴＡＳ ",
+      "自己株式の取得状況に関するお知らせ"),
+     (None, None, None),
+     "102_20260202_0905_()___130A_ＶＥＲＩＴＡＳ_自己株式の取得状況に関するお知らせ"),
+]
+
+
+@pytest.fixture
+def con():
+    con = tdnet_worklist.connect(":memory:")
+    con.execute("""CREATE TABLE disclosure_info (
+        連番 BIGINT, 公開日 VARCHAR, 時刻 VARCHAR, コード VARCHAR, 会社名 VARCHAR, 表題 VARCHAR)""")
+    con.executemany("INSERT INTO disclosure_info VALUES (?, ?, ?, ?, ?, ?)", [info for info, _, _ in ROWS])
+    tdnet_worklist.save_classification(con, [(info[0], *cls) for info, cls, _ in ROWS])
+    yield con
+    con.close()
+
+
+def test_assign_filenames_matches_sheet_formula(con):
+    assert tdnet_filename.assign_filenames(con, folders=("C:\\x",)) == (len(ROWS), 0, 0)
+    got = con.execute("SELECT 連番, ファイル名 FROM disclosure_file ORDER BY 連番").fetchall()
+    assert got == [(info[0], name) for info, _, name in ROWS]
+
+
+def test_compare_with_existing(con):
+    con.executemany("INSERT INTO disclosure_file (連番, ファイル名) VALUES (?, ?)",
+                    [(info[0], name) for info, _, name in ROWS])
+    assert tdnet_filename.compare_with_existing(con, folders=("C:\\x",)) == (len(ROWS), [])
+    con.execute("UPDATE disclosure_file SET ファイル名 = 'x' WHERE 連番 = 101")
+    n, mismatches = tdnet_filename.compare_with_existing(con, folders=("C:\\x",))
+    assert n == len(ROWS) and [m[:2] for m in mismatches] == [(101, "x")]
+
+
+def test_long_names_are_truncated_with_hash():
+    rec = {"連番": 1, "公開日": "2026-01-28", "時刻": "15:30", "種別": "決算短信", "決算月": date(2026, 3, 31),
+           "quarter": "4Q", "コード": "7203", "会社名": "会社", "表題": "あ" * 300}
+    rows, _ = tdnet_filename.build_filenames([rec], budget=100)
+    seq, name, changed, truncated = rows[0]
+    assert truncated and len(name) <= 100 and name.startswith("1_20260128_1530_(決算短信)_202603_4Q_7203_会社_あ")
+    assert tdnet_filename.build_filenames([rec], budget=100)[0][0][1] == name
+
+
+def test_collisions_get_the_sequence_suffix():
+    rec = {"連番": 1, "公開日": "2026-01-28", "時刻": "15:30", "コード": "1", "会社名": "A", "表題": "T"}
+    rows, collisions = tdnet_filename.build_filenames([rec], existing={"1_20260128_1530_()___1_a_t": 9}, budget=200)
+    assert collisions == [(1, 9, "1_20260128_1530_()___1_A_T")]
+    assert rows[0][1] == "1_20260128_1530_()___1_A_T~1"
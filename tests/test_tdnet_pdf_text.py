@@ -0,0 +1,57 @@
+import hashlib
+import os
+
+import duckdb
+
+import tdnet_pdf_text
+
+
+def result(folder, name, text, status="成功"):
+    path = os.path.join(folder, name)
+    with open(path, "wb") as f:
+        f.write(text.encode("utf-8"))
+    res = tdnet_pdf_text._new_result(path, status)
+    tdnet_pdf_text._stat_into(res, path)
+    res["sha256"] = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    res["text"], res["pages"] = (text, 1) if status == "成功" else (None, 0)
+    return res
+
+
+def test_save_and_search(tmp_path):
+    folder, db_path, index_path = str(tmp_path), str(tmp_path / "t.duckdb"), str(tmp_path / "fts.sqlite")
+    con = duckdb.connect(db_path)
+    tdnet_pdf_text.ensure_schema(con)
+    con.execute("CREATE TABLE disclosure_info (連番 BIGINT, コード VARCHAR, 会社名 VARCHAR, 表題 VARCHAR)")
+    con.execute("INSERT INTO disclosure_info VALUES (100, '7203', 'トヨタ自動車', '決算短信'), "
+                "(101, '7203', 'トヨタ自動車', '決算短信（訂正）')")
+    idx = tdnet_pdf_text.open_index(index_path)
+    results = [result(folder, "100_a.pdf", "営業利益は前年同期比で増加しました。Operating income"),
+               result(folder, "101_b.pdf", "営業利益は前年同期比で増加しました。Operating income"),
+               result(folder, "102_c.pdf", "", status="失敗: タイムアウト")]
+    tdnet_pdf_text.save_results(con, idx, results)
+    idx.close()
+
+    # 同じ内容のPDFはテキスト・索引とも1件
+    assert con.execute("SELECT COUNT(*) FROM pdf_text").fetchone()[0] == 1
+    assert con.execute("SELECT COUNT(*) FROM pdf_files").fetchone()[0] == 3
+    assert tdnet_pdf_text.load_text(con, results[0]["sha256"]).startswith("営業利益")
+
+    # 処理済みは対象外、失敗は RETRY_FAILED のときだけ対象
+    with open(os.path.join(folder, "103_d.pdf"), "wb") as f:
+        f.write(b"new")
+    assert [os.path.basename(p) for p in tdnet_pdf_text.find_new_pdfs(con, folder, False)] == ["103_d.pdf"]
+    assert [os.path.basename(p) for p in tdnet_pdf_text.find_new_pdfs(con, folder, True)] == ["102_c.pdf", "103_d.pdf"]
+    con.close()
+
+    hits = tdnet_pdf_text.search("営業利益 income", db_path=db_path, index_path=index_path)
+    assert [(h["連番"], h["表題"]) for h in hits] == [(100, "決算短信"), (101, "決算短信（訂正）")]
+    assert "営業利益" in hits[0]["snippet"]
+    assert tdnet_pdf_text.search("売上高", db_path=db_path, index_path=index_path) == []
+    assert tdnet_pdf_text.search("* ?!", db_path=db_path, index_path=index_path) == []
+
+
+def test_extract_pdf_skips_known_hash(tmp_path):
+    path = tmp_path / "100_a.pdf"
+    path.write_bytes(b"%PDF-1.4 dummy")
+    res = tdnet_pdf_text.extract_pdf(str(path), {hashlib.sha256(b"%PDF-1.4 dummy").hexdigest()})
+    assert (res["連番"], res["status"], res["text"], res["size"]) == (100, "既存", None, 14)
@@ -0,0 +1,35 @@
+import random
+
+import tdnet_taxonomy
+from tdnet_taxonomy import AhoCorasick, ReportTaxonomy
+
+
+def test_aho_corasick_finds_every_occurrence():
+    rng = random.Random(0)
+    patterns = ["ab", "b", "bab", "abc", "c", "aa", "cab"]
+    ac = AhoCorasick()
+    for p in patterns:
+        ac.add(p, p)
+    ac.build()
+    for _ in range(200):
+        text = "".join(rng.choice("abc") for _ in range(rng.randint(0, 20)))
+        expected = sorted(p for p in patterns for i in range(len(text)) if text.startswith(p, i))
+        assert sorted(ac.iter_values(text)) == expected, text
+
+
+def test_priority_exclude_and_normalized_keywords():
+    tax = ReportTaxonomy([
+        {"name": "配当", "keywords": ["配当"], "priority": 10, "exclude": ["無配"]},
+        {"name": "M&A", "keywords": ["ＴＯＢ", "公開買付"], "priority": 50},
+        {"name": "訂正", "keywords": ["訂正"], "priority": 50},
+    ])
+    assert tax.match("公開買付けに関する配当予想の訂正") == ["M&A", "訂正", "配当"]
+    # 同じ優先度は設定ファイルの記載順、keywords は NFKC + 小文字で照合
+    assert tax.primary("tob の実施") == "M&A"
+    assert tax.match("無配に関する配当予想") == []
+    assert tax.primary("人事異動") is None
+
+
+def test_default_file_keeps_the_legacy_five_on_top():
+    names = [c["name"] for c in tdnet_taxonomy.get_taxonomy().ranked()[:5]]
+    assert names == ["業績予想", "事業計画", "中期経営", "決算説明", "決算短信"]
@@ -0,0 +1,73 @@
+import hashlib
+
+import duckdb
+import pytest
+
+import tdnet_watermark as wm
+
+STAGE = "test"
+
+
+@pytest.fixture
+def con():
+    con = duckdb.connect()
+    con.execute("CREATE TABLE disclosure_info (連番 BIGINT, 表題 VARCHAR)")
+    con.executemany("INSERT INTO disclosure_info VALUES (?, ?)",
+                    [(i, None if i % 7 == 0 else f"表題{i}") for i in range(1, 26)])
+    yield con
+    con.close()
+
+
+def fps(con, last_key=25):
+    return wm.table_block_fingerprints(con, "disclosure_info", "連番", ["表題"], last_key, block_size=10)
+
+
+def test_table_fingerprint_is_a_plain_md5(con):
+    # 同じ内容なら DuckDB のバージョンやプロセスに関係なく同じ値になること
+    rows = [f"{i}\x1e{'' if i % 7 == 0 else f'表題{i}'}" for i in range(10, 20)]
+    assert fps(con)[1] == hashlib.md5("\x1f".join(rows).encode("utf-8")).hexdigest()
+
+
+def test_table_fingerprint_is_independent_of_insert_order(con):
+    other = duckdb.connect()
+    other.execute("CREATE TABLE disclosure_info (連番 BIGINT, 表題 VARCHAR)")
+    other.executemany("INSERT INTO disclosure_info VALUES (?, ?)",
+                      con.execute("SELECT * FROM disclosure_info ORDER BY 連番 DESC").fetchall())
+    assert fps(other) == fps(con)
+
+
+def test_changed_row_marks_only_its_block(con):
+    wm.commit(con, STAGE, 25, fps(con))
+    con.execute("UPDATE disclosure_info SET 表題 = '訂正' WHERE 連番 = 13")
+    con.execute("INSERT INTO disclosure_info VALUES (26, '新規')")
+    assert wm.pending_ranges(con, STAGE, fps(con), 26, 0, block_size=10) == [(10, 19), (26, 26)]
+
+
+def test_version_change_does_not_mark_blocks_changed(con):
+    # 旧方式で記録された指紋（値が一致しない）
+    wm.commit(con, STAGE, 25, {b: "old" for b in fps(con)})
+    con.execute("UPDATE stage_watermark SET fp_version = NULL")
+    assert wm.pending_ranges(con, STAGE, fps(con), 25, 0, block_size=10) == []
+    # 新しい方式で記録し直した後は通常どおり比較する
+    wm.commit(con, STAGE, 25, fps(con))
+    con.execute("UPDATE disclosure_info SET 表題 = '訂正' WHERE 連番 = 3")
+    assert wm.pending_ranges(con, STAGE, fps(con), 25, 0, block_size=10) == [(0, 9)]
+
+
+def test_version_change_keeps_blocks_left_unrecorded(con):
+    # 失敗分を持ち越すため指紋を記録しなかったブロックは、方式が変わっても対象に残す
+    current = fps(con)
+    wm.commit(con, STAGE, 25, {b: fp for b, fp in current.items() if b != 2})
+    con.execute("UPDATE stage_watermark SET fp_version = 'old'")
+    assert wm.pending_ranges(con, STAGE, current, 25, 0, block_size=10) == [(20, 25)]
+
+
+def test_old_schema_gets_version_column():
+    con = duckdb.connect()
+    con.execute("CREATE TABLE stage_watermark (stage VARCHAR PRIMARY KEY, last_key BIGINT, updated_at TIMESTAMP)")
+    con.execute("INSERT INTO stage_watermark VALUES ('s', 5, now())")
+    assert wm.get_last_key(con, "s") == 5
+    con.execute("INSERT INTO stage_fingerprint VALUES ('s', 0, 'old')")
+    assert wm.pending_ranges(con, "s", {0: "x"}, 5, 0, block_size=10) == []
+    wm.commit(con, "s", 5, {0: "x"})
+    assert con.execute("SELECT fp_version FROM stage_watermark").fetchone()[0] == wm.FINGERPRINT_VERSION
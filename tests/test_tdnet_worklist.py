@@ -0,0 +1,72 @@
+from datetime import date
+
+import pytest
+
+import tdnet_worklist
+
+
+@pytest.fixture
+def con():
+    con = tdnet_worklist.connect(":memory:")
+    con.execute("""CREATE TABLE disclosure_info (
+        連番 BIGINT, コード VARCHAR, 表題 VARCHAR, 表題_URL VARCHAR, XBRLリンク VARCHAR)""")
+    con.executemany("INSERT INTO disclosure_info VALUES (?, ?, ?, ?, ?)", [
+        (1, "7203", "決算短信", "http://x/1.pdf", "http://x/1.zip"),
+        (2, "6758", "業績予想の修正", "http://x/2.pdf", None),
+        (3, "130A", "自己株式の取得", None, None),
+    ])
+    yield con
+    con.close()
+
+
+@pytest.mark.parametrize("value, expected", [
+    (123, 123), (123.0, 123), ("123", 123), (" 123.0 ", 123),
+    (1.5, None), ("連番", None), (None, None), ("", None),
+])
+def test_to_seq(value, expected):
+    assert tdnet_worklist._to_seq(value) == expected
+
+
+def test_resolve_column(con):
+    assert tdnet_worklist.resolve_column(con, tdnet_worklist.PDF_URL_COLUMNS) == "表題_URL"
+    assert tdnet_worklist.resolve_column(con, tdnet_worklist.XBRL_URL_COLUMNS) == "XBRLリンク"
+    assert tdnet_worklist.resolve_column(con, ("無い列",)) is None
+
+
+def test_classification_round_trip(con):
+    assert tdnet_worklist.fetch_unclassified(con) == [(1, "決算短信"), (2, "業績予想の修正"), (3, "自己株式の取得")]
+    tdnet_worklist.save_classification(con, [
+        (1, "決算短信", date(2026, 3, 31), "3Q", "決算短信"),
+        (2, "", None, "", None),   # 空文字は NULL で保存（カテゴリ省略の4要素形式）
+    ])
+    assert tdnet_worklist.fetch_unclassified(con) == [(3, "自己株式の取得")]
+    assert tdnet_worklist.fetch_unclassified(con, min_seq=3) == []
+    rows = con.execute("SELECT 連番, 種別, 決算月, quarter, カテゴリ FROM disclosure_class ORDER BY 連番").fetchall()
+    assert rows == [(1, "決算短信", date(2026, 3, 31), "3Q", "決算短信"), (2, None, None, None, None)]
+
+
+def test_download_round_trip(con):
+    con.executemany("INSERT INTO disclosure_file (連番, ファイル名) VALUES (?, ?)",
+                    [(1, "1_a?"), (2, "2_b"), (3, "3_c")])
+    assert tdnet_worklist.fetch_unsanitized(con) == [(1, "1_a?"), (2, "2_b"), (3, "3_c")]
+    tdnet_worklist.save_sanitized(con, [(1, "1_a？", "?"), (2, "2_b", None), (3, "3_c", None)])
+    assert tdnet_worklist.fetch_unsanitized(con) == []
+
+    tdnet_worklist.save_classification(con, [(1, "決算短信", None, None)])
+    tasks = tdnet_worklist.fetch_pending_downloads(con)
+    # URLが1つも無い行（連番3）はタスクにしない
+    assert tasks == [
+        {"row": 1, "fname": "1_a？", "p_url": "http://x/1.pdf", "x_url": "http://x/1.zip",
+         "種別": "決算短信", "コード": "7203"},
+        {"row": 2, "fname": "2_b", "p_url": "http://x/2.pdf", "x_url": None,
+         "種別": None, "コード": "6758"},
+    ]
+
+    tdnet_worklist.save_download_results(con, [{"row": 1, "p_msg": "成功", "x_msg": None}])
+    tasks = tdnet_worklist.fetch_pending_downloads(con)
+    # PDFだけDL済みの行はXBRLだけ残る
+    assert [(t["row"], t["p_url"], t["x_url"]) for t in tasks] == [
+        (1, None, "http://x/1.zip"), (2, "http://x/2.pdf", None)]
+    tdnet_worklist.save_download_results(con, [{"row": 1, "p_msg": None, "x_msg": "成功"},
+                                               {"row": 2, "p_msg": "失敗: ステータス 404", "x_msg": None}])
+    assert tdnet_worklist.fetch_pending_downloads(con) == []